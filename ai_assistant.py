@@ -1,14 +1,15 @@
 # Rule-based AI assistant with English + Swahili responses.
 import random
+import re
 
 FAQ_RULES = [
-    (['pregnant','pregnancy','antenatal','anc'], "Pregnancy requires routine antenatal care. Try to attend at least 4 ANC visits; eat iron-rich foods and rest."),
-    (['bp','blood pressure','hypertension','pressure'], "High blood pressure in pregnancy can be dangerous. If you have severe headache, visual changes, or swelling, seek urgent care."),
-    (['bleeding','bleed'], "Any bleeding during pregnancy is a danger sign. Go to the nearest health facility immediately."),
-    (['vomit','vomiting','nausea'], "Mild nausea is common. Sip fluids, eat small frequent meals. If you cannot keep fluids down, visit a clinic."),
-    (['nutrition','food','eat'], "Eat a balanced diet: sukuma wiki, beans, eggs, fruits; take iron and folic acid as advised."),
-    (['baby','child','infant','immunization','vaccine'], "Ensure your child's immunizations are up to date and monitor growth. Visit the clinic for routine immunizations."),
-    (['fever','temperature'], "Fever in a pregnant mother or baby can be serious. Measure temperature; if >38°C or if the mother is unwell, visit a clinic."),
+    (['pregnant','pregnancy','antenatal','anc','mimba','ujauzito'], "Pregnancy requires routine antenatal care. Try to attend at least 4 ANC visits; eat iron-rich foods and rest."),
+    (['bp','blood pressure','hypertension','pressure','presha','shinikizo la damu'], "High blood pressure in pregnancy can be dangerous. If you have severe headache, visual changes, or swelling, seek urgent care."),
+    (['bleeding','bleed','kutokwa na damu','kuvuja damu'], "Any bleeding during pregnancy is a danger sign. Go to the nearest health facility immediately."),
+    (['vomit','vomiting','nausea','kutapika','kichefuchefu'], "Mild nausea is common. Sip fluids, eat small frequent meals. If you cannot keep fluids down, visit a clinic."),
+    (['nutrition','food','eat','lishe','chakula'], "Eat a balanced diet: sukuma wiki, beans, eggs, fruits; take iron and folic acid as advised."),
+    (['baby','child','infant','immunization','vaccine','mtoto','chanjo'], "Ensure your child's immunizations are up to date and monitor growth. Visit the clinic for routine immunizations."),
+    (['fever','temperature','homa'], "Fever in a pregnant mother or baby can be serious. Measure temperature; if >38°C or if the mother is unwell, visit a clinic."),
     (['swahili','kiswahili','kiswahili?'], "Habari mama! Unaweza kuniuliza kwa Kiswahili pia. Ninaweza kusema kuhusu lishe, dalili hatari, na chanjo."),
 ]
 
@@ -17,14 +18,98 @@ FALLBACKS = [
     "Nisamehe, sijui jibu kamili. Tafadhali tembelea kituo cha afya kwa ushauri wa kliniki."
 ]
 
+# CHV triage rules, emergencies first: (name, keyword groups, reply).
+# A rule matches when every group has at least one keyword in the text.
+TRIAGE_RULES = [
+    ('bleeding', [["bleed", "bleeding", "vaginal bleeding", "kutokwa na damu", "kuvuja damu"]],
+     "Bleeding in pregnancy is an emergency. Advise immediate referral to the nearest health facility."),
+    ('convulsions', [["convuls", "seizure", "fit", "degedege", "kifafa"]],
+     "Convulsions are a medical emergency (eclampsia). Call emergency services and refer immediately."),
+    ('headache_vision', [["headache", "severe headache", "maumivu ya kichwa", "kichwa kuuma"],
+                         ["vision", "blurred", "blur", "kuona", "ukungu"]],
+     "Severe headache with visual changes may indicate preeclampsia. Check BP and refer urgently."),
+    ('reduced_movement', [["reduced movement", "reduced fetal movement", "no movement", "hachezi"]],
+     "Reduced fetal movement is concerning. Advise urgent facility review."),
+    ('vomiting', [["vomit", "vomiting", "persistent vomiting", "kutapika"]],
+     "Persistent vomiting risks dehydration and poor nutrition. Encourage oral rehydration and refer if unable to retain fluids."),
+    ('fever', [["fever", "high temperature", "homa"]],
+     "Fever may indicate infection—advise facility evaluation and appropriate tests/antibiotics if indicated."),
+    ('swelling', [["swelling", "swollen face", "swollen hands", "kuvimba", "uvimbe"]],
+     "Swelling (face/hands) with other symptoms may suggest preeclampsia. Check BP and refer as needed."),
+    ('anemia', [["anemia", "hb", "upungufu wa damu"]],
+     "Anemia: give iron + folate, counsel on iron-rich foods; check Hb and refer if severe."),
+    ('blood_pressure', [["bp", "pressure", "hypertension", "presha", "shinikizo la damu"]],
+     "Monitor BP regularly. If BP >=140/90 or symptoms (headache/vision changes), arrange prompt review for preeclampsia."),
+    ('nutrition', [["nutrition", "lishe"]],
+     "Advice: balanced diet, iron/folate supplements, protein, fruits & vegetables, hydration. Avoid alcohol and raw foods."),
+]
+
+# Triage rules that are danger signs (refer now), as opposed to advice topics.
+DANGER_SIGNS = ['bleeding', 'convulsions', 'headache_vision', 'reduced_movement', 'vomiting', 'fever', 'swelling']
+
+TRIAGE_FALLBACK = ("This is informational. Encourage ANC visits, monitor BP & Hb, teach danger signs "
+                   "(bleeding, severe headache, visual changes, swelling, reduced fetal movement) and refer to facility for emergencies.")
+
+class KeywordMatcher:
+    """Every keyword of a rule list compiled into one regex and found in a single pass.
+
+    Matching is by substring, like the `kw in text` checks it replaces. The
+    regex is a zero-width lookahead, so it reports a keyword starting at
+    every position, including overlapping ones.
+    """
+
+    def __init__(self, keywords):
+        # keywords: iterable of (keyword, tag)
+        tags = {}
+        for keyword, tag in keywords:
+            tags.setdefault(keyword.lower(), set()).add(tag)
+        longest_first = sorted(tags, key=len, reverse=True)
+        self._regex = re.compile("(?=(" + "|".join(map(re.escape, longest_first)) + "))")
+        # At one position the regex reports only the longest keyword; any other
+        # keyword starting there is a prefix of it, so credit those tags too.
+        self._tags = {
+            keyword: frozenset().union(*(tags[p] for p in tags if keyword.startswith(p)))
+            for keyword in longest_first
+        }
+
+    def match(self, text):
+        found = set()
+        for m in self._regex.finditer((text or '').lower()):
+            found |= self._tags[m.group(1)]
+        return found
+
+def _compile(rules):
+    return KeywordMatcher((keyword, (i, g))
+                          for i, (_, groups, _) in enumerate(rules)
+                          for g, group in enumerate(groups)
+                          for keyword in group)
+
+def _matched(rules, matcher, text):
+    # indices of matching rules, in priority order
+    hits = matcher.match(text)
+    return [i for i, (_, groups, _) in enumerate(rules)
+            if all((i, g) in hits for g in range(len(groups)))]
+
+_FAQ = [(str(i), [keywords], reply) for i, (keywords, reply) in enumerate(FAQ_RULES)]
+_FAQ_MATCHER = _compile(_FAQ)
+_TRIAGE_MATCHER = _compile(TRIAGE_RULES)
+
+def triage(text):
+    """Names of every triage rule the text matches, highest priority first."""
+    return [TRIAGE_RULES[i][0] for i in _matched(TRIAGE_RULES, _TRIAGE_MATCHER, text)]
+
+def triage_many(texts):
+    return [triage(text) for text in texts]
+
+def offline_ai_response(text):
+    matched = _matched(TRIAGE_RULES, _TRIAGE_MATCHER, text)
+    return TRIAGE_RULES[matched[0]][2] if matched else TRIAGE_FALLBACK
+
 def ai_response(query, mother_id=None):
-    q = (query or '').lower()
-    # exact keyword matching
-    for keywords, reply in FAQ_RULES:
-        for kw in keywords:
-            if kw in q:
-                # small chance to include empathy and local touch
-                prefix = random.choice(["", "⚠️ ", "😊 "])
-                return prefix + reply
+    matched = _matched(_FAQ, _FAQ_MATCHER, query)
+    if matched:
+        # small chance to include empathy and local touch
+        prefix = random.choice(["", "⚠️ ", "😊 "])
+        return prefix + _FAQ[matched[0]][2]
     # fallback
     return random.choice(FALLBACKS)
@@ -1,134 +1,83 @@
 # frontend/app.py
 import streamlit as st
 import sys, os
+import time
 import uuid
 from datetime import datetime, timedelta
-import pandas as pd
-import numpy as np
-import sqlite3
-from pathlib import Path
 
-import db, risk_model
+# pandas, numpy and matplotlib are imported by the pages that use them:
+# Home, Search, Register and the assistant never pay for loading them
+import ai_assistant, danger_signs, db, exports, metrics, risk_model
 
 # ---------------- SETTINGS ----------------
 st.set_page_config(page_title="Afyamama Health System", layout="wide")
 db.init_db()
-DB_PATH = Path(__file__).parent / "afyamama.db"
-
-# ---------- AI assistant logic (improved) ----------
-def offline_ai_response(text):
-    t = (text or "").lower()
-    # prioritized emergency/danger signs
-    if any(k in t for k in ["bleed", "bleeding", "vaginal bleeding"]):
-        return "Bleeding in pregnancy is an emergency. Advise immediate referral to the nearest health facility."
-    if any(k in t for k in ["convuls", "seizure", "fit"]):
-        return "Convulsions are a medical emergency (eclampsia). Call emergency services and refer immediately."
-    if any(k in t for k in ["headache", "severe headache"]) and any(k in t for k in ["vision", "blurred", "blur"]):
-        return "Severe headache with visual changes may indicate preeclampsia. Check BP and refer urgently."
-    if "reduced movement" in t or "reduced fetal movement" in t or "no movement" in t:
-        return "Reduced fetal movement is concerning. Advise urgent facility review."
-    if any(k in t for k in ["vomit", "vomiting", "persistent vomiting"]):
-        return "Persistent vomiting risks dehydration and poor nutrition. Encourage oral rehydration and refer if unable to retain fluids."
-    if any(k in t for k in ["fever", "high temperature"]):
-        return "Fever may indicate infection—advise facility evaluation and appropriate tests/antibiotics if indicated."
-    if any(k in t for k in ["swelling", "swollen face", "swollen hands"]):
-        return "Swelling (face/hands) with other symptoms may suggest preeclampsia. Check BP and refer as needed."
-    if "anemia" in t or "hb" in t:
-        return "Anemia: give iron + folate, counsel on iron-rich foods; check Hb and refer if severe."
-    if "bp" in t or "pressure" in t or "hypertension" in t:
-        return "Monitor BP regularly. If BP >=140/90 or symptoms (headache/vision changes), arrange prompt review for preeclampsia."
-    if "nutrition" in t or "lishe" in t:
-        return "Advice: balanced diet, iron/folate supplements, protein, fruits & vegetables, hydration. Avoid alcohol and raw foods."
-    # fallback
-    return ("This is informational. Encourage ANC visits, monitor BP & Hb, teach danger signs "
-            "(bleeding, severe headache, visual changes, swelling, reduced fetal movement) and refer to facility for emergencies.")
 
 # ---------- Sidebar navigation (session stable) ----------
 st.sidebar.title("Afyamama Navigation 🩺")
 PAGES = [
-    "Home", "Dashboard", "Register Mother", "Mother Profiles",
+    "Home", "Search", "Dashboard", "Register Mother", "Mother Profiles",
     "Risk Assessment", "Predictive Insights", "ANC Visits",
-    "Child Profiles", "Follow-ups", "AI Assistant", "Reports"
+    "Child Profiles", "Follow-ups", "AI Assistant", "Reports", "Admin: Metrics"
 ]
 if "page" not in st.session_state:
     st.session_state.page = "Home"
 page = st.sidebar.radio("Select page:", PAGES, index=PAGES.index(st.session_state.page))
 st.session_state.page = page
 
-# ---------- Helpers: fallback SQL functions ----------
-def fetch_followups_from_db(mother_id=None):
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        if mother_id:
-            cur.execute("SELECT * FROM followups WHERE mother_id=? ORDER BY created_at DESC", (mother_id,))
-        else:
-            cur.execute("SELECT * FROM followups ORDER BY created_at DESC")
-        rows = cur.fetchall()
-        conn.close()
-        return [dict(r) for r in rows]
-    except Exception:
-        return []
-
-def mark_followup_done_db(followup_id):
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cur = conn.cursor()
-        cur.execute("UPDATE followups SET done = 1 WHERE id = ?", (followup_id,))
-        conn.commit()
-        conn.close()
-        return True
-    except Exception:
-        return False
-
+REPORT_PAGE_SIZE = 100
+FOLLOWUP_PAGE_SIZE = 50
+
+# Predictive Insights what-if axes: label and plotted range, and points per axis
+SWEEP_AXES = {
+    'bp_systolic': ("BP systolic", (80, 220)),
+    'bp_diastolic': ("BP diastolic", (40, 140)),
+    'hb': ("Hemoglobin (g/dL)", (5.0, 18.0)),
+    'bmi': ("BMI", (10.0, 50.0)),
+    'age': ("Age", (10, 60)),
+    'parity': ("Parity", (0, 12)),
+}
+SWEEP_POINTS = 200
+
+# ---------- Helpers: mother picker (server-side search) ----------
+def select_mother(key):
+    # only the matching id+name pairs are fetched, never the whole registry
+    search = st.text_input("Search mother (name, ID, phone or location)", key=f"{key}_search")
+    options = db.get_mother_options(search.strip() or None)
+    if not options:
+        return None
+    sel = st.selectbox("Select mother", [f"{mid} — {name}" for mid, name in options], key=f"{key}_select")
+    return sel.split(" — ")[0]
+
+# ---------- Helpers: fallback SQL functions (pooled via db) ----------
 def add_anc_visit_fallback(mid, visit_date, bp_systolic, bp_diastolic, hb, weight, urine_protein, fetal_hr, fundal_height, symptoms, notes):
-    # store detailed items in notes JSON-like string to avoid schema changes
-    combined_notes = ""
-    if symptoms:
-        combined_notes += f"Symptoms: {symptoms}\n"
-    if urine_protein is not None:
-        combined_notes += f"Urine protein: {urine_protein}\n"
-    if fetal_hr is not None:
-        combined_notes += f"Fetal HR: {fetal_hr}\n"
-    if fundal_height is not None:
-        combined_notes += f"Fundal height: {fundal_height}\n"
-    if notes:
-        combined_notes += f"Notes: {notes}\n"
     # fallback insertion into anc_visits table (table created in db.init_db)
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
     # ensure hb and bp numeric where possible
     hb_val = float(hb) if hb not in (None, "") else None
+    row = (mid, visit_date, bp_systolic if bp_systolic else None, bp_diastolic if bp_diastolic else None,
+           hb_val, weight if weight else None, urine_protein, fetal_hr, fundal_height, symptoms or None,
+           notes or None, datetime.utcnow().isoformat())
+    insert_sql = """INSERT INTO anc_visits (mother_id, visit_date, bp_systolic, bp_diastolic, hb, weight,
+                                            urine_protein, fetal_hr, fundal_height, symptoms, notes, created_at)
+                    VALUES (?,?,?,?,?,?,?,?,?,?,?,?)"""
+    # as db.add_anc_visit: the insert's triggers also close due ANC contacts and
+    # move the rollup counters, so cached worklist and dashboard reads must go
+    invalidates = ("anc_visits", "mothers", "followups")
     try:
-        cur.execute("""INSERT INTO anc_visits (mother_id, visit_date, bp_systolic, bp_diastolic, hb, weight, notes, created_at)
-                       VALUES (?,?,?,?,?,?,?,?)""",
-                    (mid, visit_date, bp_systolic if bp_systolic else None, bp_diastolic if bp_diastolic else None,
-                     hb_val, weight if weight else None, combined_notes, datetime.utcnow().isoformat()))
-        conn.commit()
+        with db.transaction(invalidates=invalidates) as conn:
+            conn.execute(insert_sql, row)
+            db.rescore_mother(mid)
     except Exception as e:
-        # attempt to create table and retry (defensive)
-        cur.execute("""CREATE TABLE IF NOT EXISTS anc_visits (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        mother_id TEXT,
-                        visit_date TEXT,
-                        bp_systolic INTEGER,
-                        bp_diastolic INTEGER,
-                        hb REAL,
-                        weight REAL,
-                        notes TEXT,
-                        created_at TEXT
-                       )""")
-        conn.commit()
-        cur.execute("""INSERT INTO anc_visits (mother_id, visit_date, bp_systolic, bp_diastolic, hb, weight, notes, created_at)
-                       VALUES (?,?,?,?,?,?,?,?)""",
-                    (mid, visit_date, bp_systolic if bp_systolic else None, bp_diastolic if bp_diastolic else None,
-                     hb_val, weight if weight else None, combined_notes, datetime.utcnow().isoformat()))
-        conn.commit()
-    finally:
-        conn.close()
+        # attempt to create tables and retry (defensive)
+        metrics.record_error('anc_visit_fallback', e)
+        db.init_db(force=True)
+        with db.transaction(invalidates=invalidates) as conn:
+            conn.execute(insert_sql, row)
+            db.rescore_mother(mid)
 
 # -------------------- PAGES --------------------
+# timed from here to the footer; runs cut short by st.rerun() are not counted
+page_started = time.perf_counter()
 
 # HOME (detailed English + Swahili)
 if page == "Home":
@@ -163,19 +112,45 @@ Early identification of hypertension, severe anemia, and danger signs enables ti
 
 """)
 
+# SEARCH
+elif page == "Search":
+    st.header("🔎 Search")
+    query = st.text_input("Search names, phone numbers, locations, notes and chats")
+    kinds = st.multiselect("Look in", list(db.SEARCH_KINDS), default=list(db.SEARCH_KINDS),
+                           format_func=lambda t: t.replace('_', ' ').title())
+    if query.strip() and kinds:
+        hits = db.search_records(query, limit=50, kinds=kinds)
+        if not hits:
+            st.info("No matches.")
+        for hit in hits:
+            st.markdown(f"**{hit['mother_id']} — {hit['name'] or 'unknown'}** · _{hit['kind'].replace('_', ' ')}_  \n"
+                        f"{hit['snippet']}")
+
 # DASHBOARD
 elif page == "Dashboard":
     st.header("📊 Dashboard Overview")
-    mothers = db.get_mothers()
-    st.metric("Registered Mothers", len(mothers))
-    risks = {'Low Risk': 0, 'Moderate Risk': 0, 'High Risk': 0, 'Unknown': 0}
-    for m in mothers:
-        try:
-            r = risk_model.predict_risk(m['age'], m['bp_systolic'], m['bp_diastolic'], m['hb'], m['bmi'], m['parity'], m.get('notes',''))
-            risks[r['risk']] += 1
-        except Exception:
-            risks['Unknown'] += 1
+    import pandas as pd
+    # precomputed rollups: constant cost whatever the registry size
+    loc = st.selectbox("Location", ["All"] + db.get_rollup_locations())
+    summary = db.get_dashboard_summary(None if loc == "All" else loc, days=30)
+    daily = pd.DataFrame(summary['daily'], columns=['day', 'registrations', 'anc_visits', 'referrals'])
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Registered Mothers", summary['total_mothers'])
+    col2.metric("Overdue Follow-ups", summary['overdue_followups'])
+    col3.metric("ANC Visits (30 days)", int(daily['anc_visits'].sum()))
+    col4.metric("Referrals (30 days)", int(daily['referrals'].sum()))
+    risks = dict.fromkeys(risk_model.RISK_CATEGORIES + ['Pending'], 0)
+    for risk, n in summary['risk'].items():
+        risks[risk or 'Pending'] += n
     st.bar_chart(pd.DataFrame(list(risks.values()), index=list(risks.keys())))
+    if not daily.empty:
+        st.subheader("Last 30 days")
+        st.line_chart(daily.set_index('day'))
+    # filled by the batch triage job (python danger_signs.py)
+    flagged = danger_signs.get_flagged_mothers(location=None if loc == "All" else loc, limit=50)
+    if flagged:
+        st.subheader("⚠️ Danger signs in notes & chats")
+        st.dataframe(pd.DataFrame(flagged))
 
 # REGISTER MOTHER
 elif page == "Register Mother":
@@ -214,13 +189,11 @@ elif page == "Register Mother":
 # MOTHER PROFILES (edit, delete with confirm, refer)
 elif page == "Mother Profiles":
     st.header("👩 Mother Profiles")
-    mothers = db.get_mothers()
-    if not mothers:
+    if not db.has_mothers():
         st.info("No mothers yet.")
+    elif (mid := select_mother("profiles")) is None:
+        st.info("No mothers match that search.")
     else:
-        df = pd.DataFrame(mothers)
-        sel = st.selectbox("Select mother", df['mother_id'] + " — " + df['name'])
-        mid = sel.split(" — ")[0]
         m = db.get_mother_by_id(mid)
 
         # display cleanly
@@ -239,7 +212,8 @@ elif page == "Mother Profiles":
             st.markdown(f"**BMI:** {m['bmi']}")
 
         st.markdown("---")
-        r = risk_model.predict_risk(m['age'], m['bp_systolic'], m['bp_diastolic'], m['hb'], m['bmi'], m['parity'], m.get('notes',''))
+        # stored score (includes latest ANC visit); re-score now if the rules changed
+        r = db.stored_risk(m) or db.rescore_mother(mid)
         st.subheader("Risk Assessment")
         st.success(f"**{r['risk']}** (score {r['score']})")
         if r['reasons']:
@@ -252,8 +226,18 @@ elif page == "Mother Profiles":
             st.subheader("Clinical Notes")
             st.write(m['notes'])
 
-        # Edit form inside expander
+        # once known, the outcome is a training label for the risk model (ml_model.py)
         st.markdown("---")
+        with st.expander("🏁 Pregnancy outcome"):
+            outcomes = list(db.OUTCOMES)
+            current = db.get_outcome(mid)
+            choice = st.selectbox("Outcome", outcomes, key="outcome",
+                                  index=outcomes.index(current['outcome']) if current and current['outcome'] in outcomes else 0)
+            if st.button("Save outcome"):
+                db.record_outcome(mid, choice)
+                st.success("Outcome recorded.")
+
+        # Edit form inside expander
         with st.expander("✏️ Edit details"):
             edit_name = st.text_input("Name", value=m.get('name',''))
             edit_age = st.number_input("Age", value=m.get('age',25))
@@ -277,19 +261,17 @@ elif page == "Mother Profiles":
                 if hasattr(db, "edit_mother"):
                     db.edit_mother(mid, data)
                 else:
-                    conn = sqlite3.connect(DB_PATH)
-                    cur = conn.cursor()
-                    cur.execute("""
-                        UPDATE mothers SET name=?, age=?, phone=?, location=?, gestational_age_weeks=?, parity=?,
-                                          bp_systolic=?, bp_diastolic=?, hb=?, bmi=?, notes=?, status=?
-                        WHERE mother_id=?
-                    """, (
-                        data['name'], data['age'], data['phone'], data['location'], data['gestational_age_weeks'],
-                        data['parity'], data['bp_systolic'], data['bp_diastolic'], data['hb'], data['bmi'],
-                        data['notes'], data['status'], mid
-                    ))
-                    conn.commit()
-                    conn.close()
+                    with db.transaction(invalidates=("mothers",)) as conn:
+                        conn.execute("""
+                            UPDATE mothers SET name=?, age=?, phone=?, location=?, gestational_age_weeks=?, parity=?,
+                                              bp_systolic=?, bp_diastolic=?, hb=?, bmi=?, notes=?, status=?
+                            WHERE mother_id=?
+                        """, (
+                            data['name'], data['age'], data['phone'], data['location'], data['gestational_age_weeks'],
+                            data['parity'], data['bp_systolic'], data['bp_diastolic'], data['hb'], data['bmi'],
+                            data['notes'], data['status'], mid
+                        ))
+                        db.rescore_mother(mid)
                 st.success("Details updated.")
                 st.experimental_rerun()
 
@@ -308,11 +290,8 @@ elif page == "Mother Profiles":
                     if hasattr(db, "delete_mother"):
                         db.delete_mother(mid)
                     else:
-                        conn = sqlite3.connect(DB_PATH)
-                        cur = conn.cursor()
-                        cur.execute("DELETE FROM mothers WHERE mother_id=?", (mid,))
-                        conn.commit()
-                        conn.close()
+                        with db.transaction(invalidates=("mothers",)) as conn:
+                            conn.execute("DELETE FROM mothers WHERE mother_id=?", (mid,))
                     st.success("Mother deleted.")
                     st.session_state.confirm_delete = None
                     st.experimental_rerun()
@@ -324,30 +303,25 @@ elif page == "Mother Profiles":
         # Refer button
         st.markdown("---")
         if st.button("🚑 Refer to higher-level facility"):
-            note = f"Referral: refer for urgent review (generated {datetime.utcnow().isoformat()})"
+            note = f"{db.REFERRAL_PREFIX} refer for urgent review (generated {datetime.utcnow().isoformat()})"
             if hasattr(db, "add_followup"):
-                db.add_followup(mid, datetime.utcnow().isoformat(), note)
+                db.add_followup(mid, datetime.utcnow().isoformat(), note, kind='referral')
             else:
-                conn = sqlite3.connect(DB_PATH)
-                cur = conn.cursor()
-                cur.execute("INSERT INTO followups (mother_id, due_date, notes, created_at) VALUES (?,?,?,?)",
-                            (mid, datetime.utcnow().isoformat(), note, datetime.utcnow().isoformat()))
-                conn.commit()
-                conn.close()
+                with db.transaction(invalidates=("followups",)) as conn:
+                    conn.execute("INSERT INTO followups (mother_id, due_date, notes, created_at) VALUES (?,?,?,?)",
+                                 (mid, datetime.utcnow().isoformat(), note, datetime.utcnow().isoformat()))
             st.error("Mother referred and follow-up created.")
 
 # ANC VISITS (Detailed - option B)
 elif page == "ANC Visits":
     st.header("📅 ANC Visit Tracker (Detailed)")
+    import pandas as pd
 
-    mothers = db.get_mothers()
-    if not mothers:
+    if not db.has_mothers():
         st.info("Register mothers first.")
+    elif (mid := select_mother("anc")) is None:
+        st.info("No mothers match that search.")
     else:
-        df = pd.DataFrame(mothers)
-        sel = st.selectbox("Select mother", df['mother_id'] + " — " + df['name'])
-        mid = sel.split(" — ")[0]
-
         st.subheader("Add ANC Visit (detailed)")
         with st.form("anc_form"):
             visit_date = st.date_input("Visit date", value=datetime.utcnow().date())
@@ -355,7 +329,7 @@ elif page == "ANC Visits":
             bp_dia = st.number_input("BP Diastolic", 40, 150, 80)
             hb = st.number_input("Haemoglobin (g/dL)", 5.0, 20.0, 11.0, format="%.1f")
             weight = st.number_input("Weight (kg)", 30.0, 200.0, 60.0, format="%.1f")
-            urine_protein = st.selectbox("Urine Protein", ["None","Trace","+1","+2","+3","+4"])
+            urine_protein = st.selectbox("Urine Protein", db.URINE_PROTEIN_LEVELS)
             fetal_hr = st.number_input("Fetal heart rate (bpm)", 80, 220, 140)
             fundal_height = st.number_input("Fundal height (cm)", 10.0, 50.0, 24.0, format="%.1f")
             symptoms = st.text_area("Symptoms (comma-separated)")
@@ -369,8 +343,11 @@ elif page == "ANC Visits":
                     'bp_diastolic': int(bp_dia),
                     'hb': float(hb),
                     'weight': float(weight),
-                    # extras stored in notes
-                    'notes': f"Urine protein: {urine_protein}; FetalHR: {fetal_hr}; FundalHeight: {fundal_height}; Symptoms: {symptoms}; {notes}"
+                    'urine_protein': urine_protein,
+                    'fetal_hr': float(fetal_hr),
+                    'fundal_height': float(fundal_height),
+                    'symptoms': symptoms or None,
+                    'notes': notes or None,
                 }
                 if hasattr(db, "add_anc_visit"):
                     try:
@@ -388,47 +365,33 @@ elif page == "ANC Visits":
         if hasattr(db, "get_anc_visits"):
             visits = db.get_anc_visits(mid)
         else:
-            conn = sqlite3.connect(DB_PATH)
-            conn.row_factory = sqlite3.Row
-            cur = conn.cursor()
-            cur.execute("SELECT * FROM anc_visits WHERE mother_id=? ORDER BY visit_date DESC", (mid,))
-            rows = cur.fetchall()
+            rows = db.get_conn().execute("SELECT * FROM anc_visits WHERE mother_id=? ORDER BY visit_date DESC", (mid,)).fetchall()
             visits = [dict(r) for r in rows]
-            conn.close()
 
         if visits:
-            dfv = pd.DataFrame(visits)
-            st.dataframe(dfv)
-            # try to plot HB and fetal HR (if stored)
-            # HB plot
-            if 'hb' in dfv.columns:
-                try:
-                    dfv['hb'] = pd.to_numeric(dfv['hb'], errors='coerce')
-                    display_hb = dfv.set_index(pd.to_datetime(dfv['visit_date']))['hb'].dropna()
-                    if not display_hb.empty:
-                        st.line_chart(display_hb)
-                except Exception:
-                    pass
-            # fetal HR may be embedded in notes; try extract and plot if present
-            try:
-                # extract fetal HR from 'notes' if present with pattern "FetalHR: {num}"
-                def extract_fhr(note):
-                    if not note: return None
-                    for part in str(note).split(';'):
-                        part = part.strip()
-                        if part.lower().startswith("fetalhr"):
-                            try:
-                                return float(part.split(':')[1].strip())
-                            except:
-                                return None
-                    return None
-                dfv['fhr'] = dfv['notes'].apply(extract_fhr)
-                if dfv['fhr'].notna().any():
-                    display_fhr = dfv.set_index(pd.to_datetime(dfv['visit_date']))['fhr'].dropna()
-                    if not display_fhr.empty:
-                        st.line_chart(display_fhr)
-            except Exception:
-                pass
+            # features stored as each visit was saved: nothing recomputed per rerun
+            trends = db.get_mother_trends(mid)
+            if trends:
+                def per_week(value, unit):
+                    return "—" if value is None else f"{value:+.2f} {unit}/week"
+                t1, t2, t3 = st.columns(3)
+                t1.metric("Systolic BP trend", per_week(trends['sbp_slope'], "mmHg"),
+                          None if trends['sbp_change'] is None else f"{trends['sbp_change']:+.0f} since last visit",
+                          delta_color="inverse")
+                t2.metric("Hb trend", per_week(trends['hb_slope'], "g/dL"),
+                          None if trends['hb_change'] is None else f"{trends['hb_change']:+.1f} since last visit")
+                t3.metric("Weight gain", per_week(trends['weight_slope'], "kg"),
+                          None if trends['weight_gain_per_week'] is None
+                          else f"{trends['weight_gain_per_week']:+.2f} kg/week lately")
+            st.dataframe(pd.DataFrame(visits))
+            with st.expander("Timeline (registration, visits, children, follow-ups)"):
+                st.dataframe(pd.DataFrame(db.get_mother_timeline(mid)))
+            # typed columns: plot straight from the indexed trend query, no notes parsing
+            trend = pd.DataFrame(db.get_anc_trend(mid, ('hb', 'fetal_hr'))).set_index('visit_date')
+            for col in ('hb', 'fetal_hr'):
+                series = trend[col].dropna()
+                if not series.empty:
+                    st.line_chart(series)
         else:
             st.info("No ANC visits recorded for this mother yet.")
 
@@ -455,6 +418,8 @@ elif page == "Risk Assessment":
 # PREDICTIVE INSIGHTS (detailed)
 elif page == "Predictive Insights":
     st.header("🔮 Predictive Insights (Clinical)")
+    import numpy as np
+    import pandas as pd
 
     st.info("This is an estimation using rule-based clinical indicators — not a diagnosis.")
 
@@ -484,13 +449,42 @@ elif page == "Predictive Insights":
             st.write("- Increase follow-up frequency, re-check BP/Hb within 1–2 weeks.")
         else:
             st.write("- Routine ANC and counseling on nutrition & danger signs.")
-        # small illustrative chart vs BP
-        try:
-            bp_range = np.linspace(bp_sys-10, bp_sys+10, 11)
-            scores = [risk_model.predict_risk(age, float(b), bp_dia, hb, bmi, parity, notes)['score'] for b in bp_range]
-            st.line_chart(pd.DataFrame({"bp": bp_range, "score": scores}).set_index("bp"))
-        except Exception:
-            pass
+
+    # what-if: vary one or two vitals around her values, scored in one vectorized sweep
+    base = {'age': age, 'bp_systolic': bp_sys, 'bp_diastolic': bp_dia, 'hb': hb, 'bmi': bmi,
+            'parity': parity, 'notes': notes}
+    st.subheader("What would change the category")
+    changes = risk_model.category_changes(base)
+    for c in changes:
+        st.write(f"- {SWEEP_AXES[c['field']][0]} {c['op']} {c['value']:g} → **{c['risk']}** (score {c['score']})")
+    if not changes:
+        st.write("- No change in a single vital moves her to another category.")
+
+    st.subheader("Sensitivity")
+    col1, col2 = st.columns(2)
+    fields = list(SWEEP_AXES)
+    x = col1.selectbox("Vary", fields, index=fields.index('bp_systolic'), format_func=lambda f: SWEEP_AXES[f][0])
+    y = col2.selectbox("against", ['—'] + [f for f in fields if f != x], index=0,
+                       format_func=lambda f: SWEEP_AXES[f][0] if f in SWEEP_AXES else f)
+    axes = {x: np.linspace(*SWEEP_AXES[x][1], SWEEP_POINTS)}
+    if y != '—':
+        axes[y] = np.linspace(*SWEEP_AXES[y][1], SWEEP_POINTS)
+    sweep = risk_model.sweep(base, axes)
+    if y == '—':
+        st.line_chart(pd.DataFrame({SWEEP_AXES[x][0]: axes[x], "score": sweep['score']}).set_index(SWEEP_AXES[x][0]))
+    else:
+        import matplotlib.pyplot as plt
+        from matplotlib.colors import ListedColormap
+        fig, ax = plt.subplots(figsize=(6, 4))
+        ax.imshow(sweep['band'].T, origin='lower', aspect='auto', vmin=0, vmax=2,
+                  cmap=ListedColormap(['#4caf50', '#ffb300', '#e53935']),
+                  extent=[*SWEEP_AXES[x][1], *SWEEP_AXES[y][1]])
+        ax.plot(base[x], base[y], 'k*', markersize=12)
+        ax.set_xlabel(SWEEP_AXES[x][0])
+        ax.set_ylabel(SWEEP_AXES[y][0])
+        ax.set_title("Low / Moderate / High Risk")
+        st.pyplot(fig)
+        plt.close(fig)
 
 # CHILD PROFILES
 elif page == "Child Profiles":
@@ -500,54 +494,57 @@ elif page == "Child Profiles":
 # FOLLOW-UPS (schedule, list, mark done)
 elif page == "Follow-ups":
     st.header("📅 Follow-ups & Referrals")
-    mothers = db.get_mothers()
-    if not mothers:
-        st.info("No mothers registered.")
-    else:
-        df = pd.DataFrame(mothers)
-        sel = st.selectbox("Select mother", df['mother_id'] + " — " + df['name'])
-        mid = sel.split(" — ")[0]
-
-        with st.form("follow_form"):
-            due = st.date_input("Due date", value=datetime.utcnow().date() + timedelta(days=7))
-            notes = st.text_area("Notes")
-            if st.form_submit_button("Schedule Follow-up"):
-                if hasattr(db, "add_followup"):
-                    db.add_followup(mid, due.isoformat(), notes)
-                else:
-                    conn = sqlite3.connect(DB_PATH)
-                    cur = conn.cursor()
-                    cur.execute("INSERT INTO followups (mother_id, due_date, notes, created_at) VALUES (?,?,?,?)",
-                                (mid, due.isoformat(), notes, datetime.utcnow().isoformat()))
-                    conn.commit()
-                    conn.close()
-                st.success("Follow-up scheduled.")
-
-        st.markdown("---")
-        st.subheader("All follow-ups")
-        followups = []
-        if hasattr(db, "get_followups"):
-            try:
-                followups = db.get_followups()
-            except Exception:
-                followups = fetch_followups_from_db()
-        else:
-            followups = fetch_followups_from_db()
-
-        if followups:
-            df_f = pd.DataFrame(followups)
-            st.dataframe(df_f)
-            for fu in followups:
-                if not fu.get('done', 0):
-                    if st.button(f"Mark done #{fu.get('id')} ({fu.get('mother_id')})"):
-                        if hasattr(db, "mark_followup_done"):
-                            db.mark_followup_done(fu.get('id'))
-                        else:
-                            mark_followup_done_db(fu.get('id'))
-                        st.success("Marked done.")
-                        st.experimental_rerun()
+    import pandas as pd
+    with st.expander("➕ Schedule a follow-up"):
+        if not db.has_mothers():
+            st.info("No mothers registered.")
+        elif (mid := select_mother("followups")) is None:
+            st.info("No mothers match that search.")
         else:
-            st.info("No follow-ups scheduled.")
+            with st.form("follow_form"):
+                due = st.date_input("Due date", value=datetime.utcnow().date() + timedelta(days=7))
+                chv = st.text_input("Assigned CHV")
+                notes = st.text_area("Notes")
+                if st.form_submit_button("Schedule Follow-up"):
+                    db.add_followup(mid, due.isoformat(), notes, assigned_to=chv.strip() or None)
+                    st.success("Follow-up scheduled.")
+
+    # worklists: one page of open follow-ups at a time, off the open/due-date index
+    colw1, colw2 = st.columns(2)
+    with colw1:
+        chv = st.selectbox("CHV", ["All"] + db.get_followup_chvs())
+    with colw2:
+        loc = st.selectbox("Location", ["All"] + db.get_locations(), key="followup_location")
+    scope = {'chv': None if chv == "All" else chv, 'location': None if loc == "All" else loc}
+    counts = db.count_followup_worklists(**scope)
+    labels = {'overdue': "Overdue", 'today': "Due today", 'upcoming': f"Next {db.UPCOMING_DAYS} days"}
+    which = st.radio("Worklist", db.FOLLOWUP_WORKLISTS, horizontal=True,
+                     format_func=lambda w: f"{labels[w]} ({counts[w]})")
+    if st.session_state.get("followup_scope") != (which, scope):
+        st.session_state.followup_scope = (which, scope)
+        st.session_state.followup_cursors = [None]
+    cursors = st.session_state.followup_cursors
+    rows, next_cursor = db.get_followup_worklist(which, **scope, after=cursors[-1], limit=FOLLOWUP_PAGE_SIZE)
+    if rows:
+        table = pd.DataFrame(rows)
+        table.insert(0, "done", False)
+        edited = st.data_editor(table, hide_index=True, disabled=[c for c in table.columns if c != "done"],
+                                key=f"followups_{which}_{len(cursors)}")
+        selected = edited.loc[edited["done"], "id"].tolist()
+        if st.button(f"✅ Mark {len(selected)} done", disabled=not selected):
+            st.success(f"Marked {db.mark_followups_done(selected)} follow-ups done.")
+            st.rerun()
+    else:
+        st.info("Nothing on this worklist.")
+    colp1, colp2 = st.columns([1,1])
+    with colp1:
+        if len(cursors) > 1 and st.button("⬅ Previous page", key="followups_prev"):
+            cursors.pop()
+            st.rerun()
+    with colp2:
+        if next_cursor and st.button("Next page ➡", key="followups_next"):
+            cursors.append(next_cursor)
+            st.rerun()
 
 # AI ASSISTANT (improved; keeps chat in session_state)
 elif page == "AI Assistant":
@@ -559,30 +556,142 @@ elif page == "AI Assistant":
         st.markdown(f"**Afyamama:** {c['a']}")
     q = st.text_input("Describe the symptom(s) or ask a question (e.g., 'severe headache and blurred vision'):")
     if st.button("Send"):
-        a = offline_ai_response(q)
+        a = ai_assistant.offline_ai_response(q)
         st.session_state.chat.append({"q": q, "a": a})
         try:
             db.add_chat_log(None, q, a)
-        except Exception:
-            pass
+        except Exception as e:
+            # the answer still shows; the log entry is what's lost
+            metrics.record_error('chat_log', e)
         st.rerun()
 
 
 # REPORTS
 elif page == "Reports":
     st.header("📁 Reports & Exports")
-    mothers = db.get_mothers()
-    if mothers:
-        df = pd.DataFrame(mothers)
-        st.dataframe(df)
-        st.download_button("Download CSV", df.to_csv(index=False).encode(), "mothers.csv")
+    import pandas as pd
+    if db.has_mothers():
+        colf1, colf2, colf3 = st.columns(3)
+        with colf1:
+            loc = st.selectbox("Location", ["All"] + db.get_locations())
+        with colf2:
+            status = st.selectbox("Status", ["All"] + db.get_statuses())
+        with colf3:
+            risk = st.selectbox("Risk", ["All"] + risk_model.RISK_CATEGORIES)
+        filters = {
+            'location': None if loc == "All" else loc,
+            'status': None if status == "All" else status,
+            'risk': None if risk == "All" else risk,
+        }
+        # keyset pagination: keep the stack of page cursors, reset when filters change
+        if st.session_state.get("report_filters") != filters:
+            st.session_state.report_filters = filters
+            st.session_state.report_cursors = [None]
+        cursors = st.session_state.report_cursors
+        rows, next_cursor = db.query_mothers(**filters, after=cursors[-1], limit=REPORT_PAGE_SIZE)
+        st.caption(f"{db.count_mothers(**filters)} matching mothers — page {len(cursors)}")
+        st.dataframe(pd.DataFrame(rows))
+        colp1, colp2 = st.columns([1,1])
+        with colp1:
+            if len(cursors) > 1 and st.button("⬅ Previous page"):
+                cursors.pop()
+                st.rerun()
+        with colp2:
+            if next_cursor and st.button("Next page ➡"):
+                cursors.append(next_cursor)
+                st.rerun()
+        # streamed export: chunks go from SQLite to a temp file, never a full DataFrame
+        st.markdown("---")
+        st.subheader("Export")
+        cole1, cole2, cole3, cole4 = st.columns(4)
+        with cole1:
+            exp_table = st.selectbox("Table", list(exports.EXPORT_TABLES))
+        with cole2:
+            exp_fmt = st.selectbox("Format", exports.FORMATS)
+        with cole3:
+            exp_since = st.date_input("From", value=None)
+        with cole4:
+            exp_until = st.date_input("To", value=None)
+        exp_filters = {'since': exp_since, 'until': exp_until, 'location': filters['location']}
+        st.caption(f"{exports.count_rows(exp_table, **exp_filters)} rows "
+                   f"({exports.EXPORT_TABLES[exp_table]} date range, location filter above)")
+        if st.button("Prepare export"):
+            try:
+                st.session_state.export_file = exports.export_tempfile(exp_table, exp_fmt, **exp_filters)
+                st.session_state.export_name = f"{exp_table}.{exp_fmt}"
+            except RuntimeError as e:
+                st.error(str(e))
+        if st.session_state.get("export_file") is not None:
+            # Streamlit keeps download payloads in memory: this is the export's only full copy
+            export_file = st.session_state.export_file
+            export_file.seek(0)
+            st.download_button(f"Download {st.session_state.export_name}",
+                               export_file.read(), st.session_state.export_name)
     else:
         st.info("No data yet.")
 
+# ADMIN: METRICS (this process only: histograms since start, slow queries, handled errors)
+elif page == "Admin: Metrics":
+    st.header("🛠 Metrics")
+    import pandas as pd
+    rows = metrics.summary()
+    if rows:
+        table = pd.DataFrame([{
+            'metric': r['metric'],
+            'labels': ', '.join(f"{k}={v}" for k, v in r['labels'].items()),
+            'count': r['count'],
+            **({k: r[k] for k in ('mean', 'p50', 'p95', 'p99')} if r['metric'] == 'db_call_rows'
+               else {k: round(r[k] * 1000, 2) for k in ('mean', 'p50', 'p95', 'p99')}),
+        } for r in rows])
+        metric = st.selectbox("Metric", sorted(table['metric'].unique()))
+        st.caption("Times in ms (rows for db_call_rows); percentiles are estimated from histogram buckets.")
+        st.dataframe(table[table['metric'] == metric].sort_values('count', ascending=False), hide_index=True)
+    else:
+        st.info("Nothing recorded yet.")
+
+    slow = metrics.slow_queries()
+    st.subheader(f"Slow queries (≥ {metrics.SLOW_QUERY_SECONDS * 1000:.0f} ms): {len(slow)}")
+    for q in reversed(slow):
+        with st.expander(f"{q['ms']} ms — {q['sql'][:100]}"):
+            st.code(q['sql'], language="sql")
+            if q['params']:
+                st.caption(f"params: {q['params']}")
+            if q['plan']:
+                st.code('\n'.join(q['plan']))
+
+    errors = metrics.errors()
+    st.subheader(f"Handled errors: {len(errors)}")
+    for e in reversed(errors):
+        with st.expander(f"{datetime.fromtimestamp(e['at']):%H:%M:%S} {e['where']}: {e['type']}"):
+            st.code(e['trace'])
+
+    cache = db.cache_stats()
+    scoring = risk_model.scoring_stats()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Read cache hit rate", f"{cache['hit_rate']:.0%}")
+    col2.metric("Cache entries", cache['entries'])
+    col3.metric("Risk scorer", scoring['scorer'])
+    if db.WRITE_BEHIND:
+        queues = db.write_queue_stats().values()
+        st.caption(f"Write-behind queue: {sum(q['depth'] for q in queues)} waiting, "
+                   f"{sum(q['done'] for q in queues)} committed, {sum(q['failed'] for q in queues)} failed")
+    text = metrics.render_prometheus()
+    st.download_button("Download Prometheus text", text, "afyamama.prom")
+    if metrics.TEXTFILE_PATH and st.button(f"Write {metrics.TEXTFILE_PATH} now"):
+        metrics.write_textfile()
+        st.success("Written.")
+
+metrics.observe('page_render_seconds', time.perf_counter() - page_started, page=page)
+metrics.write_textfile_if_due()
+
 # FOOTER
 st.markdown("---")
 st.caption("Afyamama — Empowering mothers, saving lives.")
 
+# read-cache counters (process-wide), after the page so they include this run
+cache = db.cache_stats()
+st.sidebar.caption(f"DB cache: {cache['hits']} hits / {cache['misses']} misses ({cache['hit_rate']:.0%} hit rate)")
+
 # ✅ Hide "Made with Streamlit"
 hide_footer = """
 <style>
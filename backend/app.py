@@ -0,0 +1,282 @@
+# Optional FastAPI service over the same data layer as the Streamlit app.
+#
+#   pip install -r backend/requirements.txt
+#   uvicorn backend.app:app --port 8000          # from the repository root
+#
+# SQLite calls are blocking, so every db.py / risk_model.py call runs on a
+# bounded thread pool; each pool thread keeps its own pooled connection
+# (db.get_conn), and the event loop never waits on the database.
+# AFYAMAMA_DB points the service at another database file.
+import asyncio
+import base64
+import json
+import os
+import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import date
+from functools import partial
+from pathlib import Path
+from typing import List, Optional
+
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from pydantic import BaseModel, Field, create_model
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import ai_assistant
+import db
+import importer
+import metrics
+import risk_model
+import sync
+
+if os.environ.get("AFYAMAMA_DB"):
+    db.DB_PATH = Path(os.environ["AFYAMAMA_DB"])
+
+DB_WORKERS = int(os.environ.get("AFYAMAMA_DB_WORKERS", 8))
+MAX_PAGE_SIZE = 500
+MAX_RISK_BATCH = 10000
+
+_pool = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="afyamama-db")
+
+async def run_db(fn, *args, **kwargs):
+    """Run a blocking data-layer call on the DB thread pool."""
+    return await asyncio.get_running_loop().run_in_executor(_pool, partial(fn, *args, **kwargs))
+
+@asynccontextmanager
+async def lifespan(app):
+    await run_db(db.init_db)
+    yield
+    _pool.shutdown(wait=True)
+    db.close_all()
+
+class RequestTimer:
+    """Plain ASGI middleware: observes each request's time by route template into metrics."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            route = scope.get('route')  # set by the router: '/mothers/{mother_id}', not the raw path
+            metrics.observe('http_request_seconds', time.perf_counter() - t0,
+                            route=getattr(route, 'path', 'unmatched'), method=scope['method'],
+                            status=f"{status // 100}xx")
+
+app = FastAPI(title="Afyamama API", lifespan=lifespan)
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+app.add_middleware(RequestTimer)
+
+# ------------------ Models ------------------ #
+# Request bodies are generated from importer.SCHEMAS, so the API validates
+# the same fields and ranges as bulk import and the app's input widgets.
+
+def _schema_model(name, kind, exclude=()):
+    fields = {}
+    for field, (typ, lo, hi, required) in importer.SCHEMAS[kind].items():
+        if field in exclude:
+            continue
+        if required:
+            fields[field] = (typ, Field(..., ge=lo, le=hi))
+        else:
+            fields[field] = (Optional[typ], Field(None, ge=lo, le=hi))
+    return create_model(name, **fields)
+
+MotherIn = _schema_model("MotherIn", "mothers")
+AncVisitIn = _schema_model("AncVisitIn", "anc_visits", exclude=("mother_id",))
+
+class RiskInput(BaseModel):
+    age: Optional[float] = None
+    bp_systolic: Optional[float] = None
+    bp_diastolic: Optional[float] = None
+    hb: Optional[float] = None
+    bmi: Optional[float] = None
+    parity: Optional[float] = None
+    notes: Optional[str] = None
+
+class RiskBatch(BaseModel):
+    mothers: List[RiskInput] = Field(..., max_length=MAX_RISK_BATCH)
+
+class FollowupIn(BaseModel):
+    mother_id: str
+    due_date: date
+    notes: str = ""
+    assigned_to: Optional[str] = None
+
+class FollowupIds(BaseModel):
+    ids: List[int] = Field(..., max_length=MAX_PAGE_SIZE)
+
+class AssistantQuery(BaseModel):
+    query: str = Field(..., max_length=2000)
+    mother_id: Optional[str] = None
+    mode: str = Field("triage", pattern="^(triage|faq)$")
+
+# ------------------ Helpers ------------------ #
+
+def _encode_cursor(cursor):
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode() if cursor else None
+
+def _decode_cursor(token):
+    # both cursors are (sort key, row id); anything else is a client error, not a 500
+    if not token:
+        return None
+    try:
+        key, row_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(400, "Invalid cursor") from None
+    if not isinstance(key, str) or not isinstance(row_id, int) or isinstance(row_id, bool):
+        raise HTTPException(400, "Invalid cursor")
+    return key, row_id
+
+def _page(rows, next_cursor):
+    return {'items': rows, 'next_cursor': _encode_cursor(next_cursor)}
+
+def _mother_out(mother):
+    # cached rows are shared: build a new dict rather than annotating in place
+    return dict(mother, risk_reasons=risk_model.reasons_from_mask(mother['risk_reason_mask'] or 0))
+
+def _normalize(kind, body):
+    try:
+        return importer.normalize_row(kind, body)
+    except ValueError as e:
+        raise HTTPException(422, str(e)) from None
+
+def _register(data):
+    conflict = HTTPException(409, f"Mother {data['mother_id']} already exists")
+    if data['mother_id'] and db.get_mother_by_id(data['mother_id']):
+        raise conflict
+    if not db.add_mother(data):
+        raise conflict  # registered by a concurrent request since the check
+    return db.get_mother_by_id(data['mother_id'])
+
+def _add_visit(data):
+    if db.get_mother_by_id(data['mother_id']) is None:
+        raise HTTPException(404, "Mother not found")
+    db.add_anc_visit(data)
+    return db.get_mother_by_id(data['mother_id'])
+
+def _score_batch(mothers):
+    columns = {f: [getattr(m, f) for m in mothers] for f in RiskInput.model_fields}
+    scored = risk_model.score_batch(columns)
+    return [{'risk': risk, 'score': int(score), 'reasons': risk_model.reasons_from_mask(int(mask))}
+            for risk, score, mask in zip(scored['risk'], scored['score'], scored['reason_mask'])]
+
+def _answer(q):
+    if q.mode == 'faq':
+        response = ai_assistant.ai_response(q.query, q.mother_id)
+    else:
+        response = ai_assistant.offline_ai_response(q.query)
+    db.add_chat_log(q.mother_id, q.query, response)
+    return {'response': response, 'signs': ai_assistant.triage(q.query)}
+
+# ------------------ Endpoints ------------------ #
+
+@app.get("/health")
+async def health():
+    return {'status': 'ok', 'schema_version': await run_db(db.schema_version)}
+
+@app.post("/mothers", status_code=201)
+async def register_mother(body: MotherIn):
+    return _mother_out(await run_db(_register, _normalize('mothers', body.model_dump())))
+
+@app.get("/mothers")
+async def list_mothers(search: Optional[str] = None, location: Optional[str] = None,
+                       status: Optional[str] = None, risk: Optional[str] = None,
+                       cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE)):
+    rows, next_cursor = await run_db(db.query_mothers, search=search, location=location, status=status,
+                                     risk=risk, after=_decode_cursor(cursor), limit=limit)
+    return _page(rows, next_cursor)
+
+@app.get("/mothers/{mother_id}")
+async def get_mother(mother_id: str):
+    mother = await run_db(db.get_mother_by_id, mother_id)
+    if mother is None:
+        raise HTTPException(404, "Mother not found")
+    return _mother_out(mother)
+
+@app.post("/mothers/{mother_id}/anc-visits", status_code=201)
+async def add_anc_visit(mother_id: str, body: AncVisitIn):
+    data = _normalize('anc_visits', dict(body.model_dump(), mother_id=mother_id))
+    return _mother_out(await run_db(_add_visit, data))
+
+@app.get("/mothers/{mother_id}/anc-visits")
+async def list_anc_visits(mother_id: str):
+    return {'items': await run_db(db.get_anc_visits, mother_id)}
+
+@app.get("/mothers/{mother_id}/timeline")
+async def mother_timeline(mother_id: str):
+    timeline = await run_db(db.get_mother_timeline, mother_id)
+    if not timeline:
+        raise HTTPException(404, "Mother not found")
+    return {'items': timeline, 'trends': await run_db(db.get_mother_trends, mother_id)}
+
+@app.post("/risk/batch")
+async def score_batch(body: RiskBatch):
+    return {'results': await run_db(_score_batch, body.mothers)}
+
+@app.get("/risk/model")
+async def risk_model_stats():
+    # active scorer and per-batch scoring times
+    return risk_model.scoring_stats()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/followups")
+async def followup_worklist(worklist: str = Query("overdue", pattern="^(overdue|today|upcoming)$"),
+                            chv: Optional[str] = None, location: Optional[str] = None,
+                            cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE)):
+    rows, next_cursor = await run_db(db.get_followup_worklist, worklist, chv=chv, location=location,
+                                     after=_decode_cursor(cursor), limit=limit)
+    return _page(rows, next_cursor)
+
+@app.get("/followups/counts")
+async def followup_counts(chv: Optional[str] = None, location: Optional[str] = None):
+    return await run_db(db.count_followup_worklists, chv, location)
+
+@app.post("/followups", status_code=201)
+async def add_followup(body: FollowupIn):
+    if await run_db(db.get_mother_by_id, body.mother_id) is None:
+        raise HTTPException(404, "Mother not found")
+    await run_db(db.add_followup, body.mother_id, body.due_date.isoformat(), body.notes,
+                 assigned_to=body.assigned_to)
+    return {'status': 'scheduled'}
+
+@app.post("/followups/done")
+async def mark_followups_done(body: FollowupIds):
+    return {'updated': await run_db(db.mark_followups_done, body.ids)}
+
+@app.post("/assistant")
+async def assistant(body: AssistantQuery):
+    return await run_db(_answer, body)
+
+@app.post("/sync/push")
+async def sync_push(request: Request):
+    try:
+        changeset = sync.decode(await request.body())
+    except (ValueError, zlib.error) as e:
+        raise HTTPException(400, f"Invalid changeset: {e}") from None
+    return await run_db(sync.apply_changeset, changeset)
+
+@app.get("/sync/pull")
+async def sync_pull(device: str, since: int = Query(0, ge=0),
+                    limit: int = Query(sync.BATCH_SIZE, ge=1, le=sync.BATCH_SIZE)):
+    data = await run_db(sync.changes_since, since, exclude_origin=device, limit=limit)
+    return Response(sync.encode(data), media_type="application/octet-stream")
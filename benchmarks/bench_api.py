@@ -0,0 +1,142 @@
+# Load test: the FastAPI backend (backend/app.py) under concurrent clients.
+#
+#   pip install -r backend/requirements.txt
+#   python benchmarks/bench_api.py                      # 20k mothers, 64 clients, 20 s
+#   python benchmarks/bench_api.py --clients 16 --seconds 60 --mothers 100000
+#
+# Seeds a temp database with importer, starts uvicorn on it in a subprocess,
+# then drives a read-heavy mix of endpoints from asyncio clients and reports
+# requests/sec with p50/p99 latency, overall and per endpoint.
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+import db
+import importer
+from bench_import import LOCATIONS, make_rows
+
+# (name, weight): roughly what a CHV device does during a day
+MIX = [
+    ('GET /mothers', 30),
+    ('GET /mothers/{id}', 25),
+    ('GET /followups', 15),
+    ('POST /risk/batch', 10),
+    ('POST /assistant', 8),
+    ('POST /mothers', 7),
+    ('POST /anc-visits', 5),
+]
+
+NOTES = ['severe headache and blurred vision', 'mild nausea', 'no movement since morning', 'fever', 'hi']
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float('nan')
+
+def request_for(name, rng, n_mothers):
+    mid = f"AFY-{rng.randrange(n_mothers):08d}"
+    if name == 'GET /mothers':
+        return 'GET', '/mothers', {'params': {'location': rng.choice(LOCATIONS), 'limit': 50}}
+    if name == 'GET /mothers/{id}':
+        return 'GET', f'/mothers/{mid}', {}
+    if name == 'GET /followups':
+        return 'GET', '/followups', {'params': {'worklist': rng.choice(['overdue', 'today', 'upcoming'])}}
+    if name == 'POST /risk/batch':
+        batch = [{'age': rng.randint(15, 45), 'bp_systolic': rng.randint(95, 170), 'hb': round(rng.uniform(7, 15), 1)}
+                 for _ in range(100)]
+        return 'POST', '/risk/batch', {'json': {'mothers': batch}}
+    if name == 'POST /assistant':
+        return 'POST', '/assistant', {'json': {'query': rng.choice(NOTES), 'mother_id': mid}}
+    if name == 'POST /mothers':
+        return 'POST', '/mothers', {'json': {'name': 'Load Test', 'age': rng.randint(15, 45),
+                                             'location': rng.choice(LOCATIONS), 'gestational_age_weeks': 16}}
+    return 'POST', f'/mothers/{mid}/anc-visits', {'json': {'visit_date': '2026-01-15', 'hb': 10.5,
+                                                            'bp_systolic': 128, 'bp_diastolic': 84}}
+
+async def client(base_url, deadline, seed, n_mothers, latencies, errors):
+    rng = random.Random(seed)
+    names, weights = zip(*MIX)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30, headers={'accept-encoding': 'gzip'}) as http:
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            method, url, kwargs = request_for(name, rng, n_mothers)
+            t0 = time.perf_counter()
+            response = await http.request(method, url, **kwargs)
+            latencies.setdefault(name, []).append(time.perf_counter() - t0)
+            if response.status_code >= 400:
+                errors[name] = errors.get(name, 0) + 1
+
+async def load(base_url, clients, seconds, n_mothers):
+    latencies, errors = {}, {}
+    deadline = time.perf_counter() + seconds
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client(base_url, deadline, i, n_mothers, latencies, errors) for i in range(clients)))
+    return latencies, errors, time.perf_counter() - t0
+
+def wait_ready(base_url, proc, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("uvicorn exited during startup")
+        try:
+            if httpx.get(base_url + '/health').status_code == 200:
+                return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError("uvicorn did not become ready")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mothers', type=int, default=20_000)
+    parser.add_argument('--clients', type=int, default=64)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--db-workers', type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / 'api.db'
+        db.init_db()
+        importer.import_rows('mothers', enumerate(make_rows(args.mothers), start=2))
+        db.close_all()
+
+        port = _free_port()
+        env = dict(os.environ, AFYAMAMA_DB=str(db.DB_PATH), AFYAMAMA_DB_WORKERS=str(args.db_workers))
+        proc = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'backend.app:app', '--port', str(port),
+                                 '--log-level', 'warning'], cwd=ROOT, env=env)
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            wait_ready(base_url, proc)
+            latencies, errors, elapsed = asyncio.run(load(base_url, args.clients, args.seconds, args.mothers))
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    total = sum(len(v) for v in latencies.values())
+    print(f"{args.mothers} mothers, {args.clients} clients, {args.db_workers} DB threads, {elapsed:.1f}s")
+    print(f"{'endpoint':<20} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for name, _ in MIX:
+        lat = latencies.get(name, [])
+        print(f"{name:<20} {len(lat):>9} {len(lat) / elapsed:>8.1f} {percentile(lat, .5) * 1000:>8.1f} "
+              f"{percentile(lat, .99) * 1000:>8.1f} {errors.get(name, 0):>7}")
+    every = [x for lat in latencies.values() for x in lat]
+    print(f"{'all':<20} {total:>9} {total / elapsed:>8.1f} {percentile(every, .5) * 1000:>8.1f} "
+          f"{percentile(every, .99) * 1000:>8.1f} {sum(errors.values()):>7}")
+
+if __name__ == '__main__':
+    main()
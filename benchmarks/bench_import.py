@@ -0,0 +1,79 @@
+# Benchmark: importer.import_file vs one db.add_mother() call per row.
+#
+#   python benchmarks/bench_import.py                 # 20k rows
+#   python benchmarks/bench_import.py --rows 100000 --per-row-max 20000
+#
+# Each path writes into its own fresh database in a temp directory.
+import argparse
+import csv
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import db
+import importer
+
+LOCATIONS = ['Kisumu', 'Nairobi', 'Mombasa', 'Nakuru', 'Eldoret', 'Kakamega']
+
+def make_rows(n, seed=0):
+    rng = random.Random(seed)
+    for i in range(n):
+        yield {
+            'mother_id': f"AFY-{i:08d}",
+            'name': f"Mama {i}",
+            'age': rng.randint(15, 45),
+            'phone': f"07{rng.randint(10000000, 99999999)}",
+            'location': rng.choice(LOCATIONS),
+            'gestational_age_weeks': rng.randint(4, 40),
+            'parity': rng.randint(0, 8),
+            'bp_systolic': rng.randint(95, 170),
+            'bp_diastolic': rng.randint(55, 110),
+            'hb': round(rng.uniform(7, 15), 1),
+            'bmi': round(rng.uniform(17, 38), 1),
+            'notes': rng.choice(['', '', 'headache', 'bleeding reported']),
+            'status': 'active',
+        }
+
+def fresh_db(tmp, name):
+    db.close_all()
+    db.DB_PATH = Path(tmp) / name
+    db.init_db()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=20_000)
+    parser.add_argument('--per-row-max', type=int, default=5_000,
+                        help='rows to time on the slow per-row path (extrapolated)')
+    parser.add_argument('--batch-size', type=int, default=importer.BATCH_SIZE)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = Path(tmp) / 'mothers.csv'
+        with open(csv_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(importer.SCHEMAS['mothers']))
+            writer.writeheader()
+            writer.writerows(make_rows(args.rows))
+
+        fresh_db(tmp, 'per_row.db')
+        n_slow = min(args.rows, args.per_row_max)
+        t0 = time.perf_counter()
+        for row in make_rows(n_slow):
+            db.add_mother(row)
+        t_slow = time.perf_counter() - t0
+
+        fresh_db(tmp, 'bulk.db')
+        report = importer.import_file('mothers', csv_path, batch_size=args.batch_size)
+        t_bulk = report['seconds']
+        db.close_all()
+
+    slow_rate, bulk_rate = n_slow / t_slow, args.rows / t_bulk
+    print(f"per-row add_mother : {n_slow:>9} rows {t_slow:8.2f}s {slow_rate:12,.0f} rows/s")
+    print(f"bulk import_file   : {args.rows:>9} rows {t_bulk:8.2f}s {bulk_rate:12,.0f} rows/s "
+          f"(batch {args.batch_size}, {len(report['errors'])} errors)")
+    print(f"speedup            : {bulk_rate / slow_rate:.1f}x")
+
+if __name__ == '__main__':
+    main()
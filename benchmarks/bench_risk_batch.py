@@ -0,0 +1,97 @@
+# Benchmark: risk_model.predict_risk_batch vs the per-mother predict_risk loop.
+#
+#   python benchmarks/bench_risk_batch.py            # 10k, 100k, 1M rows
+#   python benchmarks/bench_risk_batch.py --sizes 10000 50000
+#
+# Rows carry a visit-history trend state (risk_model.TREND_STATE), so both
+# engines are timed. Checks that both paths agree on a sample before timing anything.
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import risk_model
+
+NOTES = np.array(['', 'Bleeding since morning', 'headache', None, 'mild nausea', 'no complaints'], dtype=object)
+PROTEIN = np.array([None, 'None', 'Trace', '+1', '+2', '+3'], dtype=object)
+
+def make_columns(n, seed=0):
+    rng = np.random.default_rng(seed)
+    cols = {
+        'age': rng.integers(14, 48, n).astype(float),
+        'bp_systolic': rng.integers(90, 180, n).astype(float),
+        'bp_diastolic': rng.integers(55, 120, n).astype(float),
+        'hb': rng.normal(11.5, 1.6, n).round(1),
+        'bmi': rng.normal(25, 5, n).round(1),
+        'parity': rng.integers(0, 9, n).astype(float),
+        'notes': NOTES[rng.integers(0, len(NOTES), n)],
+    }
+    visits = rng.integers(0, 7, n).astype(float)
+    cols.update({
+        'visits': visits,
+        'sbp_slope': rng.normal(0.5, 1.5, n),
+        'hb_slope': rng.normal(-0.03, 0.08, n),
+        'sbp_change': rng.normal(3, 10, n).round(),
+        'dbp_change': rng.normal(2, 7, n).round(),
+        'hb_change': rng.normal(-0.2, 0.7, n).round(1),
+        'weight_gain_per_week': rng.normal(0.4, 0.3, n),
+        'last_bp_systolic': rng.integers(90, 180, n).astype(float),
+        'last_bp_diastolic': rng.integers(55, 120, n).astype(float),
+        'last_urine_protein': PROTEIN[rng.integers(0, len(PROTEIN), n)],
+    })
+    # sprinkle missing vitals, as in real registrations; no visits, no trend
+    for name in ('hb', 'bmi', 'bp_diastolic', 'hb_change', 'weight_gain_per_week'):
+        cols[name][rng.random(n) < 0.05] = np.nan
+    for name in risk_model.TREND_STATE[1:-1]:
+        cols[name][visits == 0] = np.nan
+    return cols
+
+def scalar_row(cols, i):
+    vals = [cols[f][i] for f in ('age', 'bp_systolic', 'bp_diastolic', 'hb', 'bmi', 'parity')]
+    vals = [None if np.isnan(v) else float(v) for v in vals]
+    trend = {f: cols[f][i] for f in risk_model.TREND_STATE}
+    trend = {f: None if isinstance(v, float) and np.isnan(v) else v for f, v in trend.items()}
+    return risk_model.predict_risk(*vals, cols['notes'][i], trend if trend['visits'] else None)
+
+def check_equivalence(n=20000):
+    cols = make_columns(n, seed=1)
+    batch = risk_model.predict_risk_batch(cols)
+    for i in range(n):
+        r = scalar_row(cols, i)
+        assert r['score'] == batch['score'][i], i
+        assert r['risk'] == batch['risk'][i], i
+        assert r['reasons'] == risk_model.reasons_from_mask(batch['reason_mask'][i]), i
+    print(f"equivalence: {n} rows identical to predict_risk")
+
+def time_it(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--scalar-max', type=int, default=100_000,
+                        help='skip the slow scalar loop above this many rows')
+    args = parser.parse_args()
+
+    check_equivalence()
+    print(f"{'rows':>10} {'batch s':>10} {'rows/s':>14} {'scalar s':>10} {'speedup':>8}")
+    for n in args.sizes:
+        cols = make_columns(n)
+        t_batch = time_it(lambda: risk_model.predict_risk_batch(cols))
+        if n <= args.scalar_max:
+            t_scalar = time_it(lambda: [scalar_row(cols, i) for i in range(n)], repeat=1)
+            scalar, speedup = f"{t_scalar:10.3f}", f"{t_scalar / t_batch:7.1f}x"
+        else:
+            scalar, speedup = f"{'-':>10}", f"{'-':>8}"
+        print(f"{n:>10} {t_batch:10.3f} {n / t_batch:14,.0f} {scalar} {speedup}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# Benchmark: the trained risk model (ml_model.py) against the rules.
+#
+#   python benchmarks/bench_risk_model.py                 # 10k, 100k, 1M rows
+#   python benchmarks/bench_risk_model.py --sizes 100000 --train 50000
+#
+# Fits a model on synthetic outcomes - drawn from a hidden logistic function
+# of the same inputs, so there is something to learn - then reports holdout
+# AUC for the model and the rules' score, the model file's size, load time,
+# and risk_model.score_batch() throughput with each scorer. Exits 1 if
+# scoring 100k mothers with the model takes a second or more.
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import ml_model
+import risk_model
+from bench_risk_batch import make_columns, time_it
+
+def make_labels(cols, seed=0):
+    rng = np.random.default_rng(seed)
+
+    def z(name, centre, spread):
+        return np.nan_to_num((np.asarray(cols[name], dtype=float) - centre) / spread)
+
+    bleeding = np.array([isinstance(t, str) and 'bleed' in t.lower() for t in cols['notes']], dtype=float)
+    logit = (-2.2 + 0.9 * z('bp_systolic', 130, 20) + 0.4 * z('bp_diastolic', 85, 15) - 0.6 * z('hb', 11.5, 1.6)
+             + 0.3 * z('age', 30, 8) + 0.5 * z('sbp_slope', 0.5, 1.5) + 1.5 * bleeding)
+    return (rng.random(len(logit)) < 1 / (1 + np.exp(-logit))).astype(int)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--train', type=int, default=20_000, help='mothers with outcomes to train on')
+    args = parser.parse_args()
+
+    cols = make_columns(args.train, seed=2)
+    t0 = time.perf_counter()
+    model = ml_model.train(cols, make_labels(cols))
+    print(f"trained on {args.train} rows in {time.perf_counter() - t0:.2f}s: "
+          f"holdout AUC {model.meta['holdout_auc']:.3f} (rules {model.meta['rules_holdout_auc']:.3f})")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = ml_model.save(model, Path(tmp) / 'risk_model.npz')
+        t0 = time.perf_counter()
+        loaded = ml_model.load(path)
+        print(f"model file {path.stat().st_size:,} bytes, loaded in {(time.perf_counter() - t0) * 1000:.1f} ms")
+    check = make_columns(1000, seed=3)
+    assert np.allclose(loaded.probability(check), model.probability(check)), "save/load changed the model"
+
+    print(f"{'rows':>10} {'rules s':>10} {'model s':>10} {'model rows/s':>14}")
+    ok = True
+    for n in args.sizes:
+        cols = make_columns(n)
+        risk_model.set_scorer(risk_model.RULE_SCORER)
+        t_rules = time_it(lambda: risk_model.score_batch(cols))
+        risk_model.set_scorer(loaded)
+        t_model = time_it(lambda: risk_model.score_batch(cols))
+        print(f"{n:>10} {t_rules:10.3f} {t_model:10.3f} {n / t_model:14,.0f}")
+        ok &= n != 100_000 or t_model < 1.0
+
+    stats = risk_model.scoring_stats()
+    print("per-scorer totals:", {name: {'batches': t['batches'], 'rows': t['rows'], 'fallbacks': t['fallbacks']}
+                                 for name, t in stats['totals'].items()})
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
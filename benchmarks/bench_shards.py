@@ -0,0 +1,141 @@
+# Benchmark: one afyamama.db vs per-facility shards (shards.py).
+#
+#   python benchmarks/bench_shards.py                       # 20k mothers, 12 facility shards
+#   python benchmarks/bench_shards.py --mothers 100000 --threads 1 4 16
+#
+# Builds a synthetic registry in one file, splits it into location shards
+# with shards.split(), and checks the merged cross-shard reads (dashboard,
+# risk counts, worklist counts, every worklist page, exports) equal the
+# single-file ones. Then times those reads on the single file, on the
+# shards in-process and on the shards over the process pool, and times
+# concurrent writers - one thread per facility, each adding follow-ups and
+# ANC visits for its own mothers - against one file vs the shards.
+import argparse
+import io
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+import db
+import exports
+import shards
+import synthetic
+
+TODAY = date(2026, 1, 15)
+
+def best_of(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        db.cache_clear()
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def walk_worklist(fetch, which):
+    rows, cursor = [], None
+    while True:
+        page, cursor = fetch(which, after=cursor, limit=200, today=TODAY)
+        rows += [(r['mother_id'], r['due_date'], r['kind'], r['notes']) for r in page]
+        if cursor is None:
+            return Counter(rows)
+
+def check(workers):
+    single = db.get_dashboard_summary.uncached(None, days=30)
+    for mode in (0, workers):
+        assert shards.get_dashboard_summary(None, days=30, workers=mode) == single, mode
+        assert shards.count_mothers_by_risk(workers=mode) == db.count_mothers_by_risk.uncached()
+        assert shards.count_followup_worklists(today=TODAY, workers=mode) == \
+            db.count_followup_worklists.uncached(today=TODAY)
+    for which in db.FOLLOWUP_WORKLISTS:
+        expected = walk_worklist(db.get_followup_worklist.uncached, which)
+        assert walk_worklist(lambda *a, **k: shards.get_followup_worklist(*a, workers=workers, **k), which) \
+            == expected, which
+    for table in ('mothers', 'anc_visits'):
+        assert shards.write_export(table, io.BytesIO()) == exports.write_export(table, io.BytesIO()), table
+    print("equivalence: dashboard, risk counts, worklist counts, every worklist page and exports match")
+
+def time_reads(workers):
+    cases = [
+        ('dashboard', lambda: db.get_dashboard_summary.uncached(None, days=30),
+         lambda w: shards.get_dashboard_summary(None, days=30, workers=w)),
+        ('risk counts', lambda: db.count_mothers_by_risk.uncached(),
+         lambda w: shards.count_mothers_by_risk(workers=w)),
+        ('worklist counts', lambda: db.count_followup_worklists.uncached(today=TODAY),
+         lambda w: shards.count_followup_worklists(today=TODAY, workers=w)),
+        ('worklist page', lambda: db.get_followup_worklist.uncached('upcoming', limit=50, today=TODAY),
+         lambda w: shards.get_followup_worklist('upcoming', limit=50, today=TODAY, workers=w)),
+        ('export anc csv', lambda: exports.write_export('anc_visits', io.BytesIO()),
+         lambda w: shards.write_export('anc_visits', io.BytesIO())),
+    ]
+    shards.count_mothers_by_risk(workers=workers)  # start the pool outside the timings
+    print(f"{'read':<16} {'one file ms':>12} {'shards ms':>10} {'pool ms':>9}")
+    for name, single, sharded in cases:
+        print(f"{name:<16} {best_of(single) * 1000:12.1f} {best_of(lambda: sharded(0)) * 1000:10.1f} "
+              f"{best_of(lambda: sharded(workers)) * 1000:9.1f}")
+
+def writer(add_followup, add_anc_visit, mother_ids, writes):
+    for i in range(writes):
+        mother_id = mother_ids[i % len(mother_ids)]
+        if i % 4:
+            add_followup(mother_id, '2026-02-01', 'home visit')
+        else:
+            add_anc_visit({'mother_id': mother_id, 'visit_date': '2026-01-15', 'bp_systolic': 124,
+                           'bp_diastolic': 80, 'hb': 11.5})
+
+def time_writes(by_location, threads, writes):
+    locations = sorted(by_location)
+    print(f"{'writers':<8} {'one file w/s':>13} {'shards w/s':>11}")
+    for n in threads:
+        rates = []
+        for add_followup, add_anc_visit in ((db.add_followup, db.add_anc_visit),
+                                            (shards.add_followup, shards.add_anc_visit)):
+            pool = [threading.Thread(target=writer, args=(add_followup, add_anc_visit,
+                                                          by_location[locations[i % len(locations)]], writes))
+                    for i in range(n)]
+            t0 = time.perf_counter()
+            for t in pool:
+                t.start()
+            for t in pool:
+                t.join()
+            rates.append(n * writes / (time.perf_counter() - t0))
+        print(f"{n:<8} {rates[0]:13,.0f} {rates[1]:11,.0f}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mothers', type=int, default=20_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=shards.FANOUT_WORKERS, help="fan-out process pool size")
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 12], help="concurrent writers")
+    parser.add_argument('--writes', type=int, default=400, help="writes per writer")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / 'county.db'
+        db.init_db()
+        generated = synthetic.generate(args.mothers, args.seed, today=TODAY)
+        print(f"one file: {generated['records']:,} records in {generated['seconds']:.1f}s")
+        shards.SHARD_DIR = Path(tmp) / 'shards'
+        t0 = time.perf_counter()
+        copied = shards.split(db.DB_PATH)
+        print(f"split into {len(copied)} shards in {time.perf_counter() - t0:.1f}s "
+              f"(largest {max(copied.values()):,} mothers), pool of {args.workers} workers")
+
+        check(args.workers)
+        time_reads(args.workers)
+        by_location = {}
+        for r in db.get_conn().execute("SELECT mother_id, location FROM mothers ORDER BY id"):
+            by_location.setdefault(r['location'], []).append(r['mother_id'])
+        time_writes(by_location, args.threads, args.writes)
+        shards.shutdown_pool()
+        db.close_all()
+
+if __name__ == '__main__':
+    main()
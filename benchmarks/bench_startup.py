@@ -0,0 +1,138 @@
+# Benchmark: cold start - module imports, schema init and the first render
+# of app pages, each in a fresh interpreter.
+#
+#   python benchmarks/bench_startup.py                      # 1k-mother registry
+#   python benchmarks/bench_startup.py --pages Home Reports --out startup.json
+#   python benchmarks/bench_suite.py --compare old.json new.json    # same format
+#
+# Every case runs in its own `python` process (best of --repeat; the OS file
+# cache is warm after the first run, as on a clinic laptop that has started
+# the app before) and reports which heavy modules it ended up loading.
+# render_* cases run app.py with Streamlit's AppTest and are skipped when
+# Streamlit is not installed.
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from datetime import date
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+import bench_suite
+import db
+import synthetic
+
+HEAVY = ('numpy', 'pandas', 'matplotlib', 'pyarrow', 'streamlit')
+
+# Child programs: each prints one JSON object with 'seconds'.
+PRELUDE = f"""
+import json, sys, time
+from pathlib import Path
+def report(seconds, **extra):
+    loaded = [m for m in {HEAVY!r} if m in sys.modules]
+    print(json.dumps(dict(seconds=seconds, loaded=loaded, **extra)))
+"""
+
+IMPORT_CORE = PRELUDE + """
+t0 = time.perf_counter()
+import ai_assistant, danger_signs, db, exports, metrics, risk_model
+report(time.perf_counter() - t0)
+"""
+
+INIT_DB = PRELUDE + """
+import db
+db.DB_PATH = Path(sys.argv[1])
+t0 = time.perf_counter()
+db.init_db()
+first = time.perf_counter() - t0
+t0 = time.perf_counter()
+db.init_db()
+report(first, repeat=time.perf_counter() - t0)
+"""
+
+RENDER = PRELUDE + """
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+import db
+db.DB_PATH = Path(sys.argv[1])
+streamlit_import = time.perf_counter() - t0
+at = AppTest.from_file(sys.argv[3], default_timeout=300)
+if sys.argv[2] != 'Home':
+    at.session_state['page'] = sys.argv[2]
+t0 = time.perf_counter()
+at.run()
+report(time.perf_counter() - t0, streamlit_import=streamlit_import, errors=[str(e.value) for e in at.exception])
+"""
+
+def child(program, *args):
+    done = subprocess.run([sys.executable, '-c', program, *map(str, args)], cwd=ROOT, capture_output=True,
+                          text=True, timeout=600)
+    if done.returncode:
+        raise RuntimeError(done.stderr.strip().splitlines()[-1] if done.stderr.strip() else done.returncode)
+    return json.loads(done.stdout.strip().splitlines()[-1])
+
+def best_of(repeat, program, *args):
+    runs = [child(program, *args) for _ in range(repeat)]
+    best = min(runs, key=lambda r: r['seconds'])
+    return best, [r['seconds'] for r in runs]
+
+def has_streamlit():
+    return subprocess.run([sys.executable, '-c', 'import streamlit.testing.v1'], capture_output=True).returncode == 0
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mothers', type=int, default=1_000, help="registry size for render_* cases")
+    parser.add_argument('--pages', nargs='+', default=['Home', 'Dashboard', 'Predictive Insights', 'Reports'])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help="results file (default: startup-<revision>.json)")
+    args = parser.parse_args()
+
+    env = bench_suite.environment()
+    results = []
+
+    def record(name, size, best, runs):
+        results.append({'size': size, 'case': name, 'ops': 1, 'seconds': best['seconds'], 'runs': runs,
+                        'loaded': best['loaded'], **{k: v for k, v in best.items() if k not in ('seconds', 'loaded')}})
+        loaded = ', '.join(best['loaded']) or '-'
+        print(f"  {name:<30} {best['seconds'] * 1000:9.1f} ms   loads: {loaded}")
+        if best.get('errors'):
+            print(f"    page raised: {best['errors'][0]}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print("imports and schema init")
+        record('import_core', 0, *best_of(args.repeat, IMPORT_CORE))
+        new = [child(INIT_DB, Path(tmp) / f"new-{i}.db") for i in range(args.repeat)]
+        best = min(new, key=lambda r: r['seconds'])
+        record('init_db_new', 0, best, [r['seconds'] for r in new])
+        current = Path(tmp) / 'current.db'
+        child(INIT_DB, current)
+        best, runs = best_of(args.repeat, INIT_DB, current)
+        record('init_db_current', 0, best, runs)
+        record('init_db_repeat', 0, dict(best, seconds=best['repeat']), [best['repeat']])
+
+        if not has_streamlit():
+            print("Streamlit is not installed: render_* cases skipped")
+        else:
+            db.DB_PATH = Path(tmp) / f"registry-{args.mothers}.db"
+            db.init_db()
+            synthetic.generate(args.mothers, args.seed, today=date(2026, 1, 15))
+            db.close_all()
+            print(f"first render, {args.mothers:,} mothers")
+            for page in args.pages:
+                best, runs = best_of(args.repeat, RENDER, db.DB_PATH, page, ROOT / 'app.py')
+                record(f"render_{page.lower().replace(' ', '_').replace(':', '')}", args.mothers, best, runs)
+
+    out = Path(args.out or f"startup-{env['revision'] or 'unknown'}.json")
+    out.write_text(json.dumps({
+        'environment': env,
+        'settings': {'mothers': args.mothers, 'pages': args.pages, 'repeat': args.repeat, 'seed': args.seed},
+        'results': results,
+    }, indent=1))
+    print(f"results written to {out}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+# Benchmark suite: the app's hot paths, end to end, on synthetic registries.
+#
+#   python benchmarks/bench_suite.py                                # 1k and 10k mothers
+#   python benchmarks/bench_suite.py --sizes 100000 --out v2.json
+#   python benchmarks/bench_suite.py --compare v1.json v2.json      # flag regressions
+#
+# For each size, builds a fresh database in a temp directory with
+# synthetic.py (same seed, same records), then times each case below,
+# best of --repeat runs, with the read cache bypassed unless the case is
+# about the cache. Results go to a JSON file with the git revision,
+# Python/SQLite/NumPy versions and the machine, so runs of two versions
+# on the same box can be compared case by case; --compare exits 1 if any
+# case got slower than --threshold (cases under --min-ms are too noisy to
+# judge and only shown).
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+import ai_assistant
+import db
+import exports
+import risk_model
+import synthetic
+
+REGISTER_N = 200
+LOOKUPS_N = 1000
+
+CASES = []
+
+def case(name, description):
+    def register(fn):
+        CASES.append((name, description, fn))
+        return fn
+    return register
+
+# Each case runs once and returns how many operations (calls or rows) it did.
+
+@case('register', "db.add_mother(), one call per mother as the Register page does")
+def _register(ctx):
+    for _ in range(REGISTER_N):
+        ctx['registered'] += 1
+        db.add_mother({'mother_id': f"BENCH-{ctx['registered']:07d}", 'name': "Bench Mother", 'age': 24,
+                       'location': 'Nairobi', 'gestational_age_weeks': 14, 'parity': 1, 'bp_systolic': 122,
+                       'bp_diastolic': 78, 'hb': 11.8, 'bmi': 23.5, 'notes': '', 'status': 'active'})
+    return REGISTER_N
+
+@case('get_mothers', "db.get_mothers(), the whole registry, read cache bypassed")
+def _get_mothers(ctx):
+    return len(db.get_mothers.uncached())
+
+@case('get_mothers_cached', "db.get_mothers() served from the read cache")
+def _get_mothers_cached(ctx):
+    db.get_mothers()
+    for _ in range(100):
+        db.get_mothers()
+    return 100
+
+@case('query_mothers_pages', "first 20 pages of the registry (keyset pagination), uncached")
+def _query_pages(ctx):
+    cursor, pages = None, 0
+    while pages < 20:
+        _, cursor = db.query_mothers.uncached(after=cursor, limit=50)
+        pages += 1
+        if cursor is None:
+            break
+    return pages
+
+@case('get_anc_visits', f"db.get_anc_visits() for {LOOKUPS_N} random mothers, uncached")
+def _get_anc_visits(ctx):
+    for mother_id in ctx['sample']:
+        db.get_anc_visits.uncached(mother_id)
+    return len(ctx['sample'])
+
+@case('mother_timeline', f"db.get_mother_timeline() for {LOOKUPS_N} random mothers, uncached")
+def _timeline(ctx):
+    for mother_id in ctx['sample']:
+        db.get_mother_timeline.uncached(mother_id)
+    return len(ctx['sample'])
+
+@case('dashboard', "dashboard summary and risk counts, all locations and each one, uncached")
+def _dashboard(ctx):
+    for location in [None] + ctx['locations']:
+        db.get_dashboard_summary.uncached(location, days=30)
+        db.count_mothers_by_risk.uncached(location)
+    return len(ctx['locations']) + 1
+
+@case('export_mothers_csv', "exports.write_export('mothers') to CSV in memory")
+def _export_mothers(ctx):
+    return exports.write_export('mothers', io.BytesIO())
+
+@case('export_anc_csv', "exports.write_export('anc_visits') to CSV in memory")
+def _export_anc(ctx):
+    return exports.write_export('anc_visits', io.BytesIO())
+
+@case('predict_risk', "risk_model.predict_risk(), one call per mother")
+def _predict_risk(ctx):
+    for row in ctx['inputs']:
+        risk_model.predict_risk(*row)
+    return len(ctx['inputs'])
+
+@case('predict_risk_batch', "risk_model.predict_risk_batch() over every mother")
+def _predict_risk_batch(ctx):
+    return len(risk_model.predict_risk_batch(ctx['columns'])['score'])
+
+@case('rescore_all', "db.rescore_stale() after marking every stored score stale")
+def _rescore(ctx):
+    with db.transaction(invalidates=('mothers',)) as conn:
+        conn.execute("UPDATE mothers SET risk_version = NULL")
+    return db.rescore_stale()
+
+@case('assistant_triage', "ai_assistant.triage_many() over every chat message")
+def _triage(ctx):
+    return len(ai_assistant.triage_many(ctx['chats']))
+
+@case('assistant_reply', "ai_assistant.ai_response() / offline_ai_response() per chat message")
+def _reply(ctx):
+    for text in ctx['chats']:
+        ai_assistant.ai_response(text)
+        ai_assistant.offline_ai_response(text)
+    return len(ctx['chats'])
+
+def _context(seed):
+    conn = db.get_conn()
+    mother_ids = [r[0] for r in conn.execute("SELECT mother_id FROM mothers ORDER BY id")]
+    fields = ('age', 'bp_systolic', 'bp_diastolic', 'hb', 'bmi', 'parity', 'notes')
+    rows = [tuple(r) for r in conn.execute(f"SELECT {', '.join(fields)} FROM mothers ORDER BY id")]
+    return {
+        'registered': 0,
+        'sample': random.Random(seed).sample(mother_ids, min(LOOKUPS_N, len(mother_ids))),
+        'locations': [r[0] for r in conn.execute("SELECT DISTINCT location FROM mothers ORDER BY 1")],
+        'inputs': rows,
+        'columns': {f: [r[i] for r in rows] for i, f in enumerate(fields)},
+        'chats': [r[0] for r in conn.execute("SELECT user_input FROM chat_logs ORDER BY id")],
+    }
+
+def run_size(tmp, mothers, seed, repeat, only):
+    db.close_all()
+    db.DB_PATH = Path(tmp) / f"suite-{mothers}.db"
+    db.init_db()
+    generated = synthetic.generate(mothers, seed, today=date(2026, 1, 15))
+    print(f"{mothers:,} mothers: {generated['records']:,} records generated in {generated['seconds']:.1f}s")
+    ctx = _context(seed)
+    results = [{'size': mothers, 'case': 'generate', 'ops': generated['records'],
+                'seconds': generated['seconds'], 'runs': [generated['seconds']], 'tables': generated['tables']}]
+    for name, _, fn in CASES:
+        if only and name not in only:
+            continue
+        runs, ops = [], 0
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            ops = fn(ctx)
+            runs.append(time.perf_counter() - t0)
+        best = min(runs)
+        results.append({'size': mothers, 'case': name, 'ops': ops, 'seconds': best, 'runs': runs})
+        print(f"  {name:<22} {best * 1000:10.1f} ms {ops:>9,} ops {ops / best if best else 0:>14,.0f} ops/s")
+    db.close_all()
+    return results
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def environment():
+    return {
+        'revision': _git_revision(),
+        'when': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+def compare(old_path, new_path, threshold, min_ms):
+    old, new = (json.loads(Path(p).read_text()) for p in (old_path, new_path))
+    before = {(r['size'], r['case']): r for r in old['results']}
+    print(f"{old['environment']['revision']} -> {new['environment']['revision']}")
+    print(f"{'size':>9} {'case':<22} {'old ms':>10} {'new ms':>10} {'ratio':>7}")
+    regressions = 0
+    for r in new['results']:
+        o = before.get((r['size'], r['case']))
+        if o is None or not o['seconds']:
+            continue
+        ratio = r['seconds'] / o['seconds']
+        flag = ''
+        if max(r['seconds'], o['seconds']) * 1000 < min_ms:
+            flag = '  (noise)'
+        elif ratio > threshold:
+            flag, regressions = '  SLOWER', regressions + 1
+        elif ratio < 1 / threshold:
+            flag = '  faster'
+        print(f"{r['size']:>9,} {r['case']:<22} {o['seconds'] * 1000:10.1f} {r['seconds'] * 1000:10.1f} "
+              f"{ratio:6.2f}x{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000], help="mothers per registry")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--cases', nargs='+', choices=[name for name, _, _ in CASES], help="run only these")
+    parser.add_argument('--out', help="results file (default: bench-<revision>.json)")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="compare two results files")
+    parser.add_argument('--threshold', type=float, default=1.25, help="slowdown ratio reported as a regression")
+    parser.add_argument('--min-ms', type=float, default=5.0, help="ignore cases faster than this in --compare")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold, args.min_ms) else 0)
+
+    env = environment()
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for mothers in args.sizes:
+            results += run_size(tmp, mothers, args.seed, args.repeat, args.cases)
+    out = Path(args.out or f"bench-{env['revision'] or 'unknown'}.json")
+    out.write_text(json.dumps({
+        'environment': env,
+        'settings': {'sizes': args.sizes, 'seed': args.seed, 'repeat': args.repeat},
+        'cases': {name: description for name, description, _ in CASES},
+        'results': results,
+    }, indent=1))
+    print(f"results written to {out}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# Benchmark: risk_model.sweep() what-if grids vs scoring the same grid as rows.
+#
+#   python benchmarks/bench_sweep.py                 # 10^4 .. 10^6 point grids
+#   python benchmarks/bench_sweep.py --points 100 1000
+#
+# Each grid varies BP systolic, Hb, BMI and age around one mother. Checks the
+# sweep against predict_risk_batch() over the flattened grid, and against
+# predict_risk() on a sample of cells, before timing anything.
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import risk_model
+
+BASE = {'age': 28, 'bp_systolic': 132, 'bp_diastolic': 86, 'hb': 10.4, 'bmi': 27.5, 'parity': 2,
+        'notes': 'headache since morning'}
+RANGES = {'bp_systolic': (80, 220), 'hb': (5, 18), 'bmi': (10, 50), 'age': (12, 55)}
+
+def grid(points):
+    # points per axis so the grid has about `points` cells
+    per_axis = max(2, round(points ** (1 / len(RANGES))))
+    return {name: np.linspace(lo, hi, per_axis) for name, (lo, hi) in RANGES.items()}
+
+def flatten(sweep):
+    mesh = np.meshgrid(*sweep['values'], indexing='ij')
+    n = mesh[0].size
+    cols = {name: np.full(n, float(BASE[name])) for name in ('bp_diastolic', 'parity')}
+    cols.update({name: m.ravel() for name, m in zip(sweep['axes'], mesh)})
+    cols['notes'] = np.full(n, BASE['notes'], dtype=object)
+    return cols
+
+def check_equivalence():
+    sweep = risk_model.sweep(BASE, grid(20_000))
+    batch = risk_model.predict_risk_batch(flatten(sweep))
+    assert (batch['score'] == sweep['score'].ravel()).all()
+    assert (batch['reason_mask'] == sweep['reason_mask'].ravel()).all()
+    assert (np.array(risk_model.RISK_CATEGORIES, dtype=object)[sweep['band'].ravel()] == batch['risk']).all()
+    rng = np.random.default_rng(0)
+    for _ in range(500):
+        cell = tuple(rng.integers(0, len(v)) for v in sweep['values'])
+        inputs = dict(BASE, **{name: float(v[i]) for name, v, i in zip(sweep['axes'], sweep['values'], cell)})
+        assert risk_model.predict_risk(*(inputs[f] for f in risk_model._FIELDS), inputs['notes'])['score'] \
+            == sweep['score'][cell]
+    # every reported crossing really changes the category, and only just
+    now = risk_model.predict_risk(*(BASE[f] for f in risk_model._FIELDS), BASE['notes'])['risk']
+    for c in sweep['crossings']:
+        inside = c['value'] if c['op'] in ('>=', '<=') else np.nextafter(c['value'], np.inf if c['op'] == '>' else -np.inf)
+        moved = risk_model.predict_risk(*(inside if f == c['field'] else BASE[f] for f in risk_model._FIELDS), BASE['notes'])
+        assert moved['risk'] == c['risk'] != now, c
+    print(f"equivalence: {sweep['score'].size} cells identical to predict_risk_batch, "
+          f"{len(sweep['crossings'])} crossings verified")
+
+def time_it(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--points', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--batch-max', type=int, default=1_000_000,
+                        help='skip the predict_risk_batch comparison above this many cells')
+    args = parser.parse_args()
+
+    check_equivalence()
+    print(f"{'cells':>10} {'sweep ms':>10} {'batch ms':>10} {'speedup':>8}")
+    for points in args.points:
+        axes = grid(points)
+        sweep = risk_model.sweep(BASE, axes)
+        cells = sweep['score'].size
+        t_sweep = time_it(lambda: risk_model.sweep(BASE, axes))
+        if cells <= args.batch_max:
+            cols = flatten(sweep)
+            t_batch = time_it(lambda: risk_model.predict_risk_batch(cols), repeat=1)
+            batch, speedup = f"{t_batch * 1000:10.1f}", f"{t_batch / t_sweep:7.0f}x"
+        else:
+            batch, speedup = f"{'-':>10}", f"{'-':>8}"
+        print(f"{cells:>10} {t_sweep * 1000:10.1f} {batch} {speedup}")
+
+if __name__ == '__main__':
+    main()
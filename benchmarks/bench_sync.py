@@ -0,0 +1,127 @@
+# Two-device sync harness: a hub database and two CHV devices, all local files.
+#
+#   python benchmarks/bench_sync.py                          # hubs of 2k and 20k mothers
+#   python benchmarks/bench_sync.py --sizes 100000 --edits 500
+#
+# For each hub size: both devices download everything, then go "offline" and
+# edit records - some of the same mothers on both, so they conflict - and
+# sync A, B, A. Reports changes and bytes moved per sync, and fails unless
+# all three databases end up identical. Delta bytes should track --edits,
+# not the hub size. A second scenario has each device record an ANC visit for
+# the same mother on the same day, so her derived risk depends on which of the
+# two counts as the latest.
+import argparse
+import random
+import sys
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import db
+import importer
+import sync
+from bench_import import make_rows
+
+@contextmanager
+def on(path):
+    # db.py's write helpers use the default database: point it at one device
+    previous, db.DB_PATH = db.DB_PATH, path
+    try:
+        yield
+    finally:
+        db.DB_PATH = previous
+
+def snapshot(path):
+    conn = db.get_conn(path)
+    state = {}
+    for table, key in db.SYNC_TABLES.items():
+        columns = db.sync_columns(conn, table)
+        state[table] = [tuple(r) for r in conn.execute(
+            f"SELECT {', '.join(columns)} FROM {table} ORDER BY {key}")]
+    state['risk'] = [tuple(r) for r in conn.execute("SELECT mother_id, risk, risk_score FROM mothers ORDER BY mother_id")]
+    return state
+
+def offline_edits(path, rng, n_mothers, edits, tag):
+    with on(path):
+        for _ in range(edits):
+            mother = db.get_mother_by_id.uncached(f"AFY-{rng.randrange(n_mothers):08d}")
+            db.edit_mother(mother['mother_id'], dict(mother, notes=f"seen by {tag}", hb=round(rng.uniform(7, 14), 1)))
+            db.add_anc_visit({'mother_id': mother['mother_id'], 'visit_date': '2026-03-01',
+                              'bp_systolic': rng.randint(100, 160), 'hb': 11.0, 'notes': f"visit by {tag}"})
+        db.add_chat_log(None, f"question from {tag}", "answer")
+        db.delete_mother(f"AFY-{rng.randrange(n_mothers):08d}")
+
+def line(label, report):
+    print(f"  {label:<22} {report['pushed']:>7} up {report['pulled']:>7} down "
+          f"{report['bytes_up'] + report['bytes_down']:>11,} bytes {report['skipped']:>5} stale "
+          f"{report['seconds'] * 1000:>8.1f} ms")
+
+def run(tmp, n_mothers, edits, batch_size):
+    hub, a, b = (Path(tmp) / f"{name}-{n_mothers}.db" for name in ('hub', 'a', 'b'))
+    for path in (hub, a, b):
+        with on(path):
+            db.init_db()
+    with on(hub):
+        importer.import_rows('mothers', enumerate(make_rows(n_mothers), start=2))
+    peer = sync.LocalPeer(hub)
+
+    print(f"hub of {n_mothers} mothers, {edits} offline edits per device")
+    line("A first sync", sync.sync(peer, a, batch_size))
+    line("B first sync", sync.sync(peer, b, batch_size))
+
+    # both devices edit some of the same mothers while offline
+    offline_edits(a, random.Random(1), n_mothers, edits, 'A')
+    offline_edits(b, random.Random(2), min(n_mothers, edits * 4), edits, 'B')
+    line("A delta sync", sync.sync(peer, a, batch_size))
+    line("B delta sync", sync.sync(peer, b, batch_size))
+    line("A catch-up", sync.sync(peer, a, batch_size))
+    line("B idle", sync.sync(peer, b, batch_size))
+
+    states = [snapshot(p) for p in (hub, a, b)]
+    converged = states[0] == states[1] == states[2]
+    print(f"  converged: {'yes' if converged else 'NO'} "
+          f"({len(states[0]['mothers'])} mothers, {len(states[0]['anc_visits'])} ANC visits, "
+          f"{len(states[0]['followups'])} follow-ups)")
+    return converged
+
+def same_day(tmp, batch_size):
+    hub, a, b = (Path(tmp) / f"{name}-same-day.db" for name in ('hub', 'a', 'b'))
+    for path in (hub, a, b):
+        with on(path):
+            db.init_db()
+    with on(hub):
+        db.add_mother({'mother_id': 'AFY-SAMEDAY', 'name': 'Same Day', 'age': 28, 'bp_systolic': 118,
+                       'bp_diastolic': 76, 'hb': 12.0})
+    peer = sync.LocalPeer(hub)
+    for path in (a, b):
+        sync.sync(peer, path, batch_size)
+    # one normal and one severe reading: the mother's risk follows whichever is "latest"
+    for path, (sbp, dbp, hb) in ((a, (112, 72, 12.5)), (b, (168, 112, 7.0))):
+        with on(path):
+            db.add_anc_visit({'mother_id': 'AFY-SAMEDAY', 'visit_date': '2026-03-01', 'bp_systolic': sbp,
+                              'bp_diastolic': dbp, 'hb': hb})
+    for path in (a, b, a):
+        sync.sync(peer, path, batch_size)
+
+    states = [snapshot(p) for p in (hub, a, b)]
+    converged = states[0] == states[1] == states[2]
+    risks = sorted({state['risk'][0][1:] for state in states})
+    print(f"same-day visits from two devices: converged: {'yes' if converged else 'NO'} (risk {risks})")
+    return converged
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2_000, 20_000])
+    parser.add_argument('--edits', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=sync.BATCH_SIZE)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        ok = all([run(tmp, n, args.edits, args.batch_size) for n in args.sizes])
+        ok = same_day(tmp, args.batch_size) and ok
+        db.close_all()
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# Benchmark: concurrent inserts, each committed on the caller's thread vs
+# through the write-behind queue (db.WRITE_BEHIND).
+#
+#   python benchmarks/bench_write_queue.py                      # 16 sessions x 200 writes
+#   python benchmarks/bench_write_queue.py --sessions 64 --writes 500
+#
+# Each session thread plays a Streamlit session: it adds chat logs,
+# follow-ups and ANC visits for registered mothers. Reports how long a
+# caller waits per write (p50/p99), total writes/sec, writes refused with
+# "database is locked" (busy timeout), and, for the queue, the batch sizes
+# and queue-to-commit latency; then checks every accepted write landed and
+# that a cached read right after a write sees it.
+import argparse
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+import db
+import importer
+import metrics
+from bench_import import make_rows
+
+def session(mother_ids, writes, seed, waits, refused):
+    rng = random.Random(seed)
+    for i in range(writes):
+        mother_id = rng.choice(mother_ids)
+        t0 = time.perf_counter()
+        kind = i % 10
+        try:
+            if kind < 6:
+                db.add_chat_log(mother_id, "when is the next ANC visit?", "At your next scheduled contact.")
+            elif kind < 9:
+                db.add_followup(mother_id, date(2026, 2, rng.randint(1, 28)).isoformat(), 'home visit')
+            else:
+                db.add_anc_visit({'mother_id': mother_id, 'visit_date': '2026-01-15',
+                                  'bp_systolic': rng.randint(100, 160), 'bp_diastolic': rng.randint(60, 100),
+                                  'hb': 11.0})
+        except sqlite3.OperationalError:
+            refused.append(i)
+        waits.append(time.perf_counter() - t0)
+
+def counts():
+    conn = db.get_conn()
+    return {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ('chat_logs', 'followups', 'anc_visits')}
+
+def run(mode, mother_ids, sessions, writes):
+    db.WRITE_BEHIND = mode == 'queue'
+    metrics.reset()
+    before = counts()
+    waits, refused = [], []
+    threads = [threading.Thread(target=session, args=(mother_ids, writes, s, waits, refused))
+               for s in range(sessions)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    returned = time.perf_counter() - t0
+    db.flush_writes()
+    committed = time.perf_counter() - t0
+    after = counts()
+    landed = sum(after.values()) - sum(before.values())
+    lost = sum(1 for e in metrics.errors() if e['where'] == 'write_queue')
+    assert landed == sessions * writes - len(refused) - lost, f"{landed} of {sessions * writes} writes landed"
+    waits.sort()
+    line = (f"{mode:<6} {waits[len(waits) // 2] * 1000:9.3f} {waits[int(len(waits) * 0.99)] * 1000:9.3f} "
+            f"{landed / committed:11,.0f} {len(refused) + lost:8,} {committed:8.2f}s")
+    if mode == 'queue':
+        stats = {r['metric']: r for r in metrics.summary()}
+        batches, latency = stats['write_queue_batch_rows'], stats['write_queue_latency_seconds']
+        line += (f"   {batches['count']:,} batches, mean {batches['mean']:.0f} writes, "
+                 f"queue-to-commit p95 {latency['p95'] * 1000:.0f} ms (callers done after {returned:.2f}s)")
+    print(line)
+
+def check_read_your_writes(mother_id):
+    db.WRITE_BEHIND = True
+    for i in range(50):
+        db.get_followups(mother_id)  # cache it
+        db.add_followup(mother_id, '2026-03-01', f'ryw {i}')
+        assert any(f['notes'] == f'ryw {i}' for f in db.get_followups(mother_id)), i
+    print("read-your-writes: 50 cached reads right after a queued write all saw it")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mothers', type=int, default=2_000)
+    parser.add_argument('--sessions', type=int, default=16)
+    parser.add_argument('--writes', type=int, default=200, help="writes per session")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / 'queue.db'
+        db.init_db()
+        importer.import_rows('mothers', enumerate(make_rows(args.mothers), start=2))
+        mother_ids = [r[0] for r in db.get_conn().execute("SELECT mother_id FROM mothers")]
+        print(f"{args.sessions} sessions x {args.writes} writes, {args.mothers:,} mothers")
+        print(f"{'mode':<6} {'p50 ms':>9} {'p99 ms':>9} {'writes/s':>11} {'refused':>8} {'total':>9}")
+        for mode in ('sync', 'queue'):
+            run(mode, mother_ids, args.sessions, args.writes)
+        check_read_your_writes(mother_ids[0])
+        db.close_all()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+# Seeded synthetic registry for benchmarks: mothers, ANC visit series,
+# children, follow-ups and chat logs, written through the real write paths.
+#
+#   python benchmarks/synthetic.py county.db                        # 10k mothers
+#   python benchmarks/synthetic.py county.db --mothers 100000 --seed 7    # ~1M records
+#
+# Mothers, visits and children go in through importer.import_rows(), so
+# validation, stored risk scores, ANC scheduling, trends, rollups, search
+# and the change log are all built as they would be in the field. Follow-ups
+# (referrals, CHV home visits) and chat logs have no import path and are
+# inserted in bulk. Per mother, on average: ~3 ANC visits, 0.3 children,
+# 0.5 follow-ups, 1.5 chat messages and ~5 scheduled ANC contacts, so
+# --mothers 100000 makes about a million records. The same seed always
+# gives the same records (dates are relative to --today).
+import argparse
+import math
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import ai_assistant
+import db
+import importer
+
+# (county, weight): roughly where CHVs register mothers
+LOCATIONS = [('Nairobi', 18), ('Kisumu', 12), ('Mombasa', 10), ('Nakuru', 10), ('Kakamega', 9),
+             ('Eldoret', 8), ('Kisii', 7), ('Machakos', 7), ('Garissa', 5), ('Turkana', 4),
+             ('Kilifi', 6), ('Bungoma', 4)]
+FIRST_NAMES = ['Achieng', 'Wanjiku', 'Akinyi', 'Njeri', 'Atieno', 'Chebet', 'Mwende', 'Nafula', 'Wairimu',
+               'Adhiambo', 'Jepkosgei', 'Halima', 'Amina', 'Zawadi', 'Neema', 'Faith', 'Mercy', 'Grace']
+LAST_NAMES = ['Otieno', 'Kamau', 'Mutua', 'Wafula', 'Kiprono', 'Ochieng', 'Njoroge', 'Omondi', 'Mohamed',
+              'Wekesa', 'Mwangi', 'Barasa', 'Kariuki', 'Chege', 'Hassan', 'Cherono']
+CHVS = [f"CHV-{i:03d}" for i in range(1, 41)]
+
+# (text, weight); danger signs are rare, as in real notes
+MOTHER_NOTES = [('', 60), ('first pregnancy', 8), ('mild nausea', 6), ('headache and blurred vision', 2),
+                ('reports some bleeding', 1), ('swollen hands and face', 2), ('previous C-section', 4),
+                ('HIV+ on ART', 3), ('twins suspected', 1), ('anaemia last pregnancy', 4), ('no complaints', 9)]
+SYMPTOMS = [('', 70), ('none', 10), ('headache', 5), ('mild swelling of feet', 4), ('nausea', 4),
+            ('reduced movement', 1), ('bleeding', 1), ('fever', 2), ('vomiting', 2), ('blurred vision', 1)]
+QUESTIONS = [('Mama has a headache and blurred vision', 2), ('Mama ana homa tangu jana', 3),
+             ('bleeding since morning', 1), ('What should she eat? lishe bora', 8),
+             ('baby immunization schedule', 6), ('persistent vomiting, cannot keep fluids', 2),
+             ('when is the next ANC visit?', 10), ('BP was 150/95 at the clinic', 3),
+             ('swollen face and hands', 2), ('Hb is low, what to do about anemia', 4),
+             ('hachezi - reduced movement today', 1), ('general question about pregnancy', 8)]
+PROTEIN = ['None', 'Trace', '+1', '+2', '+3']
+
+def _pick(rng, weighted):
+    return rng.choices([v for v, _ in weighted], [w for _, w in weighted])[0]
+
+def _clip(value, lo, hi):
+    return max(lo, min(hi, value))
+
+def make_mother(rng, i):
+    age = int(_clip(rng.gauss(26, 6), 14, 47))
+    hypertensive = rng.random() < 0.08
+    anaemic = rng.random() < 0.2
+    parity = int(_clip(rng.gauss(max(0, (age - 18) / 4), 1.2), 0, 12))
+    sbp = rng.gauss(145 if hypertensive else 116, 12)
+    return {
+        'mother_id': f"SYN-{i:07d}",
+        'name': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        'age': age,
+        'phone': f"07{rng.randint(10000000, 99999999)}",
+        'location': _pick(rng, LOCATIONS),
+        'gestational_age_weeks': rng.randint(6, 40),
+        'parity': parity,
+        'bp_systolic': int(_clip(sbp, 85, 210)),
+        'bp_diastolic': int(_clip(sbp * 0.64 + rng.gauss(0, 6), 50, 130)),
+        'hb': round(_clip(rng.gauss(9.6 if anaemic else 11.9, 1.1), 5, 17), 1),
+        'bmi': round(_clip(math.exp(rng.gauss(math.log(24), 0.17)), 15, 48), 1),
+        'notes': _pick(rng, MOTHER_NOTES),
+        'status': 'active',
+    }
+
+def make_visits(rng, mother, today):
+    # contacts every ~4-6 weeks up to her current gestation, with a per-mother
+    # drift: most are stable, some develop hypertension or anaemia
+    gest = mother['gestational_age_weeks']
+    weeks = []
+    week = rng.randint(8, 16)
+    while week <= gest:
+        weeks.append(week)
+        week += rng.randint(4, 6)
+    sbp_drift = rng.choice([0, 0, 0, 0.3, 1.2]) if mother['bp_systolic'] < 140 else rng.gauss(0.5, 0.5)
+    hb_drift = rng.choice([0, 0, 0.02, -0.05, -0.12])
+    weight = _clip(mother['bmi'] * 2.6, 40, 130)
+    visits = []
+    for week in weeks:
+        sbp = mother['bp_systolic'] + sbp_drift * (week - weeks[0]) + rng.gauss(0, 5)
+        dbp = mother['bp_diastolic'] + 0.6 * sbp_drift * (week - weeks[0]) + rng.gauss(0, 4)
+        high = sbp >= 140 or dbp >= 90
+        visits.append({
+            'mother_id': mother['mother_id'],
+            'visit_date': (today - timedelta(weeks=gest - week)).isoformat(),
+            'bp_systolic': int(_clip(sbp, 80, 230)),
+            'bp_diastolic': int(_clip(dbp, 45, 140)),
+            'hb': round(_clip(mother['hb'] + hb_drift * (week - weeks[0]) + rng.gauss(0, 0.4), 4, 17), 1),
+            'weight': round(weight + 0.4 * (week - weeks[0]) + rng.gauss(0, 0.6), 1),
+            'urine_protein': rng.choice(PROTEIN[1:] if high and rng.random() < 0.4 else PROTEIN[:2]),
+            'fetal_hr': rng.randint(115, 160) if week >= 20 else None,
+            'fundal_height': round(_clip(week + rng.gauss(0, 1.5), 0, 45), 1) if week >= 20 else None,
+            'symptoms': _pick(rng, SYMPTOMS) or None,
+            'notes': None,
+        })
+    return visits
+
+def make_children(rng, mother, today):
+    # older siblings registered with the mother
+    count = min(mother['parity'], rng.choice([0, 0, 0, 1, 1]))
+    return [{
+        'mother_id': mother['mother_id'],
+        'child_name': f"{rng.choice(FIRST_NAMES)} {mother['name'].split()[-1]}",
+        'dob': (today - timedelta(days=rng.randint(200, 1800))).isoformat(),
+        'birth_weight': round(_clip(rng.gauss(3.1, 0.5), 1.0, 5.5), 2),
+        'delivery_type': 'CS' if rng.random() < 0.15 else 'SVD',
+        'notes': None,
+    } for _ in range(count)]
+
+def make_followups(rng, mother, today):
+    rows = []
+    if (mother['bp_systolic'] >= 150 or mother['hb'] < 8) and rng.random() < 0.7:
+        rows.append((mother['mother_id'], (today + timedelta(days=rng.randint(-5, 3))).isoformat(),
+                     f"{db.REFERRAL_PREFIX} refer for urgent review", rng.choice(CHVS), 'referral'))
+    if rng.random() < 0.4:
+        rows.append((mother['mother_id'], (today + timedelta(days=rng.randint(-20, 30))).isoformat(),
+                     'home visit', rng.choice(CHVS), None))
+    return rows
+
+def make_chats(rng, mother):
+    n = rng.choice([0, 0, 1, 1, 2, 3, 4])
+    return [(mother['mother_id'], q, ai_assistant.offline_ai_response(q))
+            for q in (_pick(rng, QUESTIONS) for _ in range(n))]
+
+def generate(mothers=10_000, seed=0, today=None, batch_size=importer.BATCH_SIZE):
+    """Fill the current database (db.DB_PATH) with `mothers` synthetic mothers and their records.
+
+    Returns counts and seconds per table.
+    """
+    today = today or date.today()
+    report = {'seed': seed, 'today': today.isoformat(), 'tables': {}}
+    t0 = time.perf_counter()
+    # one stream per mother, so a record depends only on (seed, index)
+    streams = (random.Random(f"{seed}:{i}") for i in range(mothers))
+    people = [(rng, make_mother(rng, i)) for i, rng in enumerate(streams)]
+    visits, children, followups, chats = [], [], [], []
+    for rng, mother in people:
+        visits += make_visits(rng, mother, today)
+        children += make_children(rng, mother, today)
+        followups += make_followups(rng, mother, today)
+        chats += make_chats(rng, mother)
+    report['generate_seconds'] = time.perf_counter() - t0
+
+    for kind, rows in (('mothers', [m for _, m in people]), ('anc_visits', visits), ('children', children)):
+        result = importer.import_rows(kind, enumerate(rows, start=2), batch_size)
+        if result['errors']:
+            raise ValueError(f"{kind}: {len(result['errors'])} rows rejected, first {result['errors'][0]}")
+        report['tables'][kind] = {'rows': len(rows), 'seconds': result['seconds']}
+
+    now = datetime.utcnow().isoformat()
+    for table, sql, rows in (
+            ('followups', "INSERT INTO followups (mother_id, due_date, notes, assigned_to, kind, created_at) "
+                          "VALUES (?, ?, ?, ?, ?, ?)", followups),
+            ('chat_logs', "INSERT INTO chat_logs (mother_id, user_input, assistant_response, created_at) "
+                          "VALUES (?, ?, ?, ?)", chats)):
+        t = time.perf_counter()
+        for i in range(0, len(rows), batch_size):
+            with db.transaction(invalidates=(table,)) as conn:
+                conn.executemany(sql, [row + (now,) for row in rows[i:i + batch_size]])
+        report['tables'][table] = {'rows': len(rows), 'seconds': time.perf_counter() - t}
+    report['anc_contacts'] = db.get_conn().execute("SELECT COUNT(*) FROM followups WHERE kind = 'anc'").fetchone()[0]
+    report['records'] = sum(t['rows'] for t in report['tables'].values()) + report['anc_contacts']
+    report['seconds'] = time.perf_counter() - t0
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a seeded synthetic registry")
+    parser.add_argument('path', help="database file to create or add to")
+    parser.add_argument('--mothers', type=int, default=10_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--today', type=date.fromisoformat, default=None, help="anchor date (default: today)")
+    args = parser.parse_args()
+    db.DB_PATH = Path(args.path)
+    db.init_db()
+    report = generate(args.mothers, args.seed, args.today)
+    for table, t in report['tables'].items():
+        print(f"{table:>10}: {t['rows']:>9,} rows in {t['seconds']:7.2f}s")
+    print(f"{'scheduled':>10}: {report['anc_contacts']:>9,} ANC contacts")
+    print(f"{report['records']:,} records in {report['seconds']:.1f}s ({args.path})")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+# Batch danger-sign triage over stored free text: chat logs, mothers' clinical
+# notes and ANC visit notes/symptoms. Each run only reads records added since
+# the last one (a per-source high-water mark in triage_state) plus records
+# whose text was edited (triage_pending), classifies them with the assistant's
+# triage rules on a process pool, and stores the signs found in triage_signs.
+# Flagged mothers are then a plain query on the flagged_mothers view, cached
+# by db.py until one of the tables behind it is written.
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+
+import ai_assistant
+import db
+
+CHUNK_SIZE = 2000
+
+# source table -> SQL expression for the text to triage
+SOURCES = {
+    'chat_logs': "user_input",
+    'mothers': "notes",
+    'anc_visits': "COALESCE(symptoms, '') || ' ' || COALESCE(notes, '')",
+}
+
+def classify_chunk(texts):
+    # runs in worker processes: only danger signs are kept
+    danger = set(ai_assistant.DANGER_SIGNS)
+    return [[sign for sign in ai_assistant.triage(text) if sign in danger] for text in texts]
+
+def _iter_chunks(source, last_id, chunk_size):
+    # new records above the high-water mark, in id order
+    text = SOURCES[source]
+    while True:
+        rows = db.get_conn().execute(
+            f"SELECT id, mother_id, {text} AS text FROM {source} WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, chunk_size)).fetchall()
+        if not rows:
+            return
+        yield [tuple(r) for r in rows]
+        last_id = rows[-1][0]
+
+def _pending_chunks(source, chunk_size):
+    # edited records, in id order; a bulk edit can queue many, so page through them
+    text = SOURCES[source]
+    last_id = 0
+    while True:
+        rows = db.get_conn().execute(
+            f"SELECT t.id, t.mother_id, {text} AS text FROM triage_pending p JOIN {source} t ON t.id = p.record_id "
+            f"WHERE p.source = ? AND p.record_id > ? ORDER BY p.record_id LIMIT ?",
+            (source, last_id, chunk_size)).fetchall()
+        if not rows:
+            return
+        yield [tuple(r) for r in rows]
+        last_id = rows[-1][0]
+
+def _store(source, rows, results, advance_mark):
+    now = datetime.utcnow().isoformat()
+    signs = [(source, record_id, mother_id, sign, now)
+             for (record_id, mother_id, _), found in zip(rows, results) for sign in found]
+    with db.transaction(invalidates=('triage_signs',)) as conn:
+        conn.executemany("DELETE FROM triage_signs WHERE source = ? AND record_id = ?",
+                         [(source, r[0]) for r in rows])
+        conn.executemany("INSERT OR REPLACE INTO triage_signs (source, record_id, mother_id, sign, detected_at) "
+                         "VALUES (?,?,?,?,?)", signs)
+        conn.executemany("DELETE FROM triage_pending WHERE source = ? AND record_id = ?",
+                         [(source, r[0]) for r in rows])
+        if advance_mark:
+            # same transaction as the results: a crash never skips or repeats a chunk
+            conn.execute("INSERT INTO triage_state (source, last_id) VALUES (?, ?) "
+                         "ON CONFLICT (source) DO UPDATE SET last_id = MAX(last_id, excluded.last_id)",
+                         (source, rows[-1][0]))
+    return len(signs)
+
+def _run_source(source, classify, chunk_size, in_flight):
+    stats = {'records': 0, 'signs': 0}
+    for pending in _pending_chunks(source, chunk_size):
+        stats['signs'] += _store(source, pending, classify([r[2] for r in pending]).result(), False)
+        stats['records'] += len(pending)
+
+    row = db.get_conn().execute("SELECT last_id FROM triage_state WHERE source = ?", (source,)).fetchone()
+    queue = deque()
+    # keep a bounded number of chunks in the pool; store results in id order
+    for rows in _iter_chunks(source, row[0] if row else 0, chunk_size):
+        queue.append((rows, classify([r[2] for r in rows])))
+        if len(queue) >= in_flight:
+            done_rows, future = queue.popleft()
+            stats['signs'] += _store(source, done_rows, future.result(), True)
+            stats['records'] += len(done_rows)
+    while queue:
+        done_rows, future = queue.popleft()
+        stats['signs'] += _store(source, done_rows, future.result(), True)
+        stats['records'] += len(done_rows)
+    return stats
+
+def _classify_now(texts):
+    # in-process path (workers=0), shaped like pool.submit()
+    future = Future()
+    future.set_result(classify_chunk(texts))
+    return future
+
+def run(workers=None, chunk_size=CHUNK_SIZE, sources=None):
+    """Triage every unprocessed record; returns per-source counts and timing.
+
+    workers=None uses one process per CPU; workers=0 classifies in-process,
+    which is quicker for the few rows an incremental run usually sees.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    t0 = time.perf_counter()
+    report = {}
+    if workers:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for source in sources or SOURCES:
+                report[source] = _run_source(source, partial(pool.submit, classify_chunk), chunk_size, 2 * workers)
+    else:
+        for source in sources or SOURCES:
+            report[source] = _run_source(source, _classify_now, chunk_size, 1)
+    report['seconds'] = time.perf_counter() - t0
+    return report
+
+# signs are also removed by triggers on the source tables
+@db.cached('triage_signs', 'mothers', 'anc_visits', 'chat_logs')
+def get_flagged_mothers(sign=None, location=None, limit=100):
+    """Mothers with at least one danger sign on record, most recently flagged first."""
+    clauses, params = [], []
+    if sign:
+        clauses.append("mother_id IN (SELECT mother_id FROM triage_signs WHERE sign = ?)")
+        params.append(sign)
+    if location:
+        clauses.append("location = ?")
+        params.append(location)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = db.get_conn().execute(
+        f"SELECT * FROM flagged_mothers {where} ORDER BY last_detected_at DESC LIMIT ?", params + [limit])
+    return [dict(r) for r in rows]
+
+# ------------------ Command line ------------------ #
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Triage stored notes and chat logs for danger signs")
+    parser.add_argument("--workers", type=int, default=None, help="processes (0 = in-process)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+    db.init_db()
+    report = run(args.workers, args.chunk_size)
+    for source in SOURCES:
+        print(f"{source:>10}: {report[source]['records']} records, {report[source]['signs']} signs")
+    print(f"done in {report['seconds']:.2f}s")
@@ -1,16 +1,839 @@
+import atexit
+import functools
+import os
 import sqlite3
-from datetime import datetime
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 from pathlib import Path
 
+import metrics
+import risk_model
+
 DB_PATH = Path(__file__).parent / "afyamama.db"
 
-def get_conn():
-    conn = sqlite3.connect(DB_PATH)
+# ------------------ Connection pool ------------------ #
+# One long-lived connection per (thread, database file). Streamlit serves each
+# session from its own script thread, so every session reuses its connection
+# across reruns instead of paying connect/close on each call.
+
+BUSY_TIMEOUT_MS = 5000
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+)
+
+_local = threading.local()
+_all_conns = set()
+_all_conns_lock = threading.Lock()
+_generation = 0  # bumped by close_all() so other threads drop stale handles
+
+# statement kinds labelled in metrics; anything else is 'other'
+_STATEMENTS = {'select', 'with', 'insert', 'update', 'delete', 'replace', 'begin', 'commit', 'rollback',
+               'savepoint', 'release', 'pragma', 'create', 'drop', 'explain'}
+_PLANNED = {'select', 'with', 'insert', 'update', 'delete', 'replace'}
+
+class _TimedCursor(sqlite3.Cursor):
+    """Times a statement from execute() until its last row is fetched (or the cursor
+    is closed): a SELECT does most of its work in the fetches, not in execute()."""
+
+    _sql = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()  # the cursor's previous statement
+        self._sql, self._params, self._seconds = sql, parameters, 0.0
+        self._timed(super().execute, sql, parameters)
+        if self.description is None:
+            self._finish()  # no rows to fetch
+        return self
+
+    def _timed(self, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self._seconds += time.perf_counter() - t0
+
+    def _finish(self):
+        if self._sql is not None:
+            sql, self._sql = self._sql, None
+            self.connection._observe(sql, self._seconds, self._params)
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._timed(super().fetchmany, size)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # a read abandoned before its last row is still recorded
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+class _TimedConnection(sqlite3.Connection):
+    """Times every statement into metrics - execute() through the last fetch, see
+    _TimedCursor; slow ones are logged with their plan."""
+
+    def _observe(self, sql, seconds, params=None):
+        word = sql.lstrip()[:9].split(None, 1)[0].lower() if sql.strip() else ''
+        kind = word if word in _STATEMENTS else 'other'
+        metrics.observe('db_query_seconds', seconds, statement=kind)
+        if seconds >= metrics.SLOW_QUERY_SECONDS:
+            plan = None
+            if kind in _PLANNED and params is not None:
+                try:
+                    plan = [r[3] for r in super().execute("EXPLAIN QUERY PLAN " + sql, params)]
+                except sqlite3.Error:
+                    pass
+            metrics.slow_query(sql, seconds, plan, params)
+
+    def cursor(self, factory=_TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        t0 = time.perf_counter()
+        cursor = super().executemany(sql, seq_of_parameters)
+        self._observe(sql, time.perf_counter() - t0)  # the parameters are consumed: no plan
+        return cursor
+
+def _connect(path):
+    # isolation_level=None: we issue BEGIN/COMMIT ourselves in transaction()
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None, check_same_thread=False,
+                           factory=_TimedConnection if metrics.ENABLED else sqlite3.Connection)
     conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
     return conn
 
-def init_db():
-    conn = get_conn()
+def current_path():
+    """The database this thread's db.py calls use: using()'s path, else DB_PATH."""
+    return getattr(_local, "path", None) or DB_PATH
+
+@contextmanager
+def using(path):
+    """Point this thread's db.py calls (reads, writes, cache) at another database file.
+
+    shards.py uses this to run the ordinary functions against one shard.
+    """
+    previous = getattr(_local, "path", None)
+    _local.path = Path(path)
+    try:
+        yield
+    finally:
+        _local.path = previous
+
+def get_conn(path=None):
+    """Return this thread's pooled connection to `path` (default current_path()).
+
+    The connection stays open for the life of the thread; do not close it.
+    """
+    key = str(path or current_path())
+    conns = getattr(_local, "conns", None)
+    if conns is None or _local.generation != _generation:
+        conns = _local.conns = {}
+        _local.generation = _generation
+    conn = conns.get(key)
+    if conn is None:
+        conn = conns[key] = _connect(key)
+        with _all_conns_lock:
+            _all_conns.add(conn)
+    return conn
+
+@contextmanager
+def transaction(path=None, invalidates=()):
+    """Run a block of writes in one IMMEDIATE transaction on the pooled connection.
+
+    Commits on success, rolls back on error. Nested use joins the outer
+    transaction, so helpers can be composed into larger batches.
+    `invalidates` names the tables the block writes; cached reads of them
+    are dropped once the outermost transaction commits.
+    """
+    conn = get_conn(path)
+    pending = _local.__dict__.setdefault("pending_invalidations", {})
+    if conn.in_transaction:
+        pending.setdefault(id(conn), set()).update(invalidates)
+        yield conn
+        return
+    pending[id(conn)] = set(invalidates)
+    t0 = time.perf_counter()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        metrics.observe('db_transaction_seconds', time.perf_counter() - t0, outcome='rollback')
+        raise
+    else:
+        conn.commit()
+        metrics.observe('db_transaction_seconds', time.perf_counter() - t0, outcome='commit')
+        invalidate(*pending[id(conn)], path=path)
+    finally:
+        pending.pop(id(conn), None)
+
+def close_conn(path=None):
+    """Close the calling thread's connection to `path`, if open."""
+    conns = getattr(_local, "conns", None) or {}
+    if getattr(_local, "generation", None) != _generation:
+        return
+    conn = conns.pop(str(path or current_path()), None)
+    if conn is not None:
+        with _all_conns_lock:
+            _all_conns.discard(conn)
+        conn.close()
+
+def close_all():
+    """Close every pooled connection in the process (shutdown / tests)."""
+    global _generation
+    close_write_queues()
+    with _all_conns_lock:
+        conns = list(_all_conns)
+        _all_conns.clear()
+        _generation += 1
+    _initialized.clear()
+    for conn in conns:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+    cache_clear()
+
+_initialized = set()  # db paths init_db() has run for in this process
+_init_lock = threading.Lock()
+
+def init_db(force=False):
+    """Bring current_path()'s schema up to date and start rescoring stale risk scores.
+
+    Runs once per database per process: Streamlit calls this on every rerun,
+    and later calls return at once. `force` runs it again (e.g. after the
+    file was replaced underneath us).
+    """
+    path = str(current_path())
+    if path in _initialized and not force:
+        return
+    with _init_lock:
+        if path in _initialized and not force:
+            return
+        # an up-to-date schema needs no write lock (other processes may be writing)
+        if schema_version() < len(MIGRATIONS):
+            with transaction() as conn:
+                migrate(conn)
+        cache_clear()
+        if has_stale_risk():
+            rescore_stale_async()
+        _initialized.add(path)
+
+# ------------------ Write-behind queue ------------------ #
+# Opt-in (AFYAMAMA_WRITE_BEHIND=1). add_chat_log, add_followup and
+# add_anc_visit hand their insert to one writer thread per database instead
+# of taking the write lock on the caller's thread. The writer commits what
+# has queued up - up to WRITE_QUEUE_MAX_ROWS, waiting at most
+# WRITE_QUEUE_FLUSH_MS for more - in one transaction, so concurrent sessions
+# share a lock acquisition and a commit. @cached reads of a table with
+# queued writes flush first, so every caller reads its own writes;
+# flush_writes() does the same for raw SQL readers. close_all() and
+# interpreter exit drain the queue; a hard kill loses at most the writes of
+# the last flush interval.
+
+WRITE_BEHIND = os.environ.get('AFYAMAMA_WRITE_BEHIND') == '1'
+WRITE_QUEUE_FLUSH_MS = 50
+WRITE_QUEUE_MAX_ROWS = 500
+WRITE_QUEUE_MAX_PENDING = 10_000  # producers block beyond this rather than grow memory without bound
+
+class _WriteQueue:
+    """One database's queued writes and the thread that commits them.
+
+    Items are (fn, args, invalidates, queued_at); the writer calls
+    fn(conn, *args) inside its batch transaction. `enqueued` and `done` are
+    sequence numbers: a write is committed (or has failed) once done >= its
+    number.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.items = deque()
+        self.pending_tables = Counter()
+        self.cond = threading.Condition()
+        self.enqueued = self.done = self.flush_target = self.failed = 0
+        self.stopping = False
+        self.thread = threading.Thread(target=self._run, name="afyamama-writer", daemon=True)
+        self.thread.start()
+
+    def put(self, fn, args, invalidates):
+        """Queue one write; False if the queue is closing and the caller must write it itself."""
+        with self.cond:
+            self.cond.wait_for(lambda: len(self.items) < WRITE_QUEUE_MAX_PENDING or self.stopping)
+            if self.stopping:
+                return False
+            self.enqueued += 1
+            self.items.append((fn, args, invalidates, time.perf_counter()))
+            self.pending_tables.update(invalidates)
+            self.cond.notify_all()
+            return True
+
+    def has_pending(self, tables):
+        with self.cond:
+            return any(self.pending_tables[t] for t in tables)
+
+    def flush(self, timeout=None):
+        """Wait until every write queued so far is committed; True unless `timeout` ran out."""
+        if threading.current_thread() is self.thread:
+            return True  # a queued write reading through @cached: its batch is this one
+        with self.cond:
+            target = self.flush_target = max(self.flush_target, self.enqueued)
+            self.cond.notify_all()
+            return self.cond.wait_for(lambda: self.done >= target, timeout)
+
+    def close(self):
+        """Commit everything still queued and stop the writer."""
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+        self.thread.join()
+
+    def _take(self):
+        # the next batch: block for a first write, then gather more until the
+        # batch is full, the flush interval is up, someone flushes, or we stop
+        with self.cond:
+            self.cond.wait_for(lambda: self.items or self.stopping)
+            deadline = time.monotonic() + WRITE_QUEUE_FLUSH_MS / 1000
+            while (self.items and len(self.items) < WRITE_QUEUE_MAX_ROWS and not self.stopping
+                   and self.flush_target <= self.done):
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self.cond.wait(left)
+            batch = [self.items.popleft() for _ in range(min(len(self.items), WRITE_QUEUE_MAX_ROWS))]
+            self.cond.notify_all()  # room for producers blocked on a full queue
+            return batch
+
+    def _commit(self, batch):
+        try:
+            with transaction(self.path, invalidates=set().union(*(item[2] for item in batch))) as conn:
+                for fn, args, _, _ in batch:
+                    fn(conn, *args)
+        except Exception:
+            # one bad write must not sink the others: redo them one at a time
+            for fn, args, invalidates, _ in batch:
+                try:
+                    with transaction(self.path, invalidates=invalidates) as conn:
+                        fn(conn, *args)
+                except Exception as e:
+                    self.failed += 1
+                    metrics.record_error('write_queue', e)
+        committed = time.perf_counter()
+        metrics.observe('write_queue_batch_rows', len(batch))
+        for item in batch:
+            metrics.observe('write_queue_latency_seconds', committed - item[3])
+
+    def _run(self):
+        with using(self.path):  # queued writes may read (e.g. rescoring): from this database
+            try:
+                while True:
+                    batch = self._take()
+                    if not batch:
+                        return  # stopping, and drained
+                    self._commit(batch)
+                    with self.cond:
+                        self.done += len(batch)
+                        for item in batch:
+                            self.pending_tables.subtract(item[2])
+                        self.cond.notify_all()
+            finally:
+                close_conn(self.path)
+
+_write_queues = {}  # db path -> _WriteQueue
+_write_queues_lock = threading.Lock()
+
+def _write(fn, args, invalidates):
+    """Run fn(conn, *args) in a transaction now, or queue it when WRITE_BEHIND is on."""
+    if WRITE_BEHIND and not get_conn().in_transaction:  # inside a caller's transaction: stay part of it
+        path = str(current_path())
+        queue = _write_queues.get(path)
+        if queue is None:
+            with _write_queues_lock:
+                queue = _write_queues.get(path) or _write_queues.setdefault(path, _WriteQueue(path))
+        if queue.put(fn, args, invalidates):
+            return
+    with transaction(invalidates=invalidates) as conn:
+        fn(conn, *args)
+
+def _flush_for_read(path, tables):
+    # read-your-writes for @cached readers; never from inside a write
+    # transaction, which would hold the lock the writer is waiting for
+    queue = _write_queues.get(path)
+    if queue is not None and queue.has_pending(tables) and not get_conn().in_transaction:
+        queue.flush()
+
+def flush_writes(timeout=None):
+    """Wait until every queued write to current_path() is committed; True unless `timeout` ran out."""
+    queue = _write_queues.get(str(current_path()))
+    return queue.flush(timeout) if queue is not None else True
+
+def close_write_queues():
+    """Commit all queued writes and stop the writer threads (close_all() and exit do this)."""
+    with _write_queues_lock:
+        queues = dict(_write_queues)
+    # a queue stays registered until it has drained: a write arriving meanwhile
+    # finds it closing and commits on its own thread instead of starting a
+    # second queue nobody would close
+    for queue in queues.values():
+        queue.close()
+    with _write_queues_lock:
+        for path, queue in queues.items():
+            if _write_queues.get(path) is queue:
+                del _write_queues[path]
+
+@atexit.register
+def _close_write_queues_at_exit():
+    global WRITE_BEHIND
+    WRITE_BEHIND = False  # writes made during shutdown go straight to the database
+    close_write_queues()
+
+def write_queue_stats():
+    """Per database: writes queued now, queued and committed since start, and failed."""
+    stats = {}
+    for path, queue in list(_write_queues.items()):
+        with queue.cond:
+            stats[path] = {'depth': len(queue.items), 'enqueued': queue.enqueued, 'done': queue.done,
+                           'failed': queue.failed}
+    return stats
+
+@metrics.register_collector
+def _write_queue_metrics():
+    samples = []
+    for path, s in write_queue_stats().items():
+        labels = {'db': Path(path).name}
+        samples.append(('write_queue_depth', 'gauge', "Writes queued, not yet committed", labels, s['depth']))
+        samples.append(('write_queue_writes_total', 'counter', "Writes queued since start", labels, s['enqueued']))
+        samples.append(('write_queue_failed_total', 'counter', "Queued writes that failed to commit", labels,
+                        s['failed']))
+    return samples
+
+# ------------------ Read cache ------------------ #
+# Streamlit reruns app.py top to bottom on every widget change, so the same
+# reads repeat many times per minute. Read functions are memoized here (not
+# with st.cache_data: importer, the triage job and the CLI use db.py without
+# Streamlit). Each entry remembers the version of every table it read;
+# transaction(invalidates=...) bumps those versions on commit, so a write
+# only evicts the reads that depend on it. The TTL bounds staleness from
+# writes made by other processes.
+
+CACHE_TTL_SECONDS = 30
+CACHE_MAX_ENTRIES = 1024
+
+_cache = OrderedDict()  # key -> (expires_at, table_versions, value)
+_cache_lock = threading.Lock()
+_table_versions = {}    # (db path, table) -> int
+_cache_stats = {}       # function name -> {'hits', 'misses'}
+_cache_invalidations = 0
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+def _row_count(value):
+    # lists of rows, or (rows, cursor) pages
+    if isinstance(value, list):
+        return len(value)
+    if isinstance(value, tuple) and value and isinstance(value[0], list):
+        return len(value[0])
+    return None
+
+def cached(*tables):
+    """Memoize a read function whose result depends on `tables`.
+
+    Cached values are shared between callers: treat them as read-only.
+    """
+    def decorate(fn):
+        stats = _cache_stats.setdefault(fn.__name__, {'hits': 0, 'misses': 0})
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            path = str(current_path())
+            if _write_queues:
+                _flush_for_read(path, tables)
+            key = (fn.__name__, path, _freeze(args), _freeze(kwargs))
+            now = time.monotonic()
+            with _cache_lock:
+                # read the versions before querying: a write that commits
+                # meanwhile makes this entry stale rather than wrong
+                versions = tuple(_table_versions.get((path, t), 0) for t in tables)
+                entry = _cache.get(key)
+                if entry is not None and entry[0] > now and entry[1] == versions:
+                    _cache.move_to_end(key)
+                    stats['hits'] += 1
+                    return entry[2]
+                stats['misses'] += 1
+            t0 = time.perf_counter()
+            value = fn(*args, **kwargs)
+            metrics.observe('db_call_seconds', time.perf_counter() - t0, fn=fn.__name__)
+            rows = _row_count(value)
+            if rows is not None:
+                metrics.observe('db_call_rows', rows, fn=fn.__name__)
+            with _cache_lock:
+                _cache[key] = (now + CACHE_TTL_SECONDS, versions, value)
+                _cache.move_to_end(key)
+                while len(_cache) > CACHE_MAX_ENTRIES:
+                    _cache.popitem(last=False)
+            return value
+
+        wrapper.uncached = fn
+        return wrapper
+    return decorate
+
+def invalidate(*tables, path=None):
+    """Drop cached reads of `tables`; call after writing them outside transaction(invalidates=...)."""
+    global _cache_invalidations
+    path = str(path or current_path())
+    with _cache_lock:
+        for table in tables:
+            _table_versions[(path, table)] = _table_versions.get((path, table), 0) + 1
+        _cache_invalidations += len(tables)
+
+def cache_clear():
+    with _cache_lock:
+        _cache.clear()
+
+@metrics.register_collector
+def _cache_metrics():
+    stats = cache_stats()
+    samples = [('cache_entries', 'gauge', "Entries in the db.py read cache", {}, stats['entries'])]
+    for name, s in stats['functions'].items():
+        samples.append(('cache_hits_total', 'counter', "db.py read cache hits", {'fn': name}, s['hits']))
+        samples.append(('cache_misses_total', 'counter', "db.py read cache misses", {'fn': name}, s['misses']))
+    return samples
+
+def cache_stats():
+    """Hit/miss counters, overall and per cached function."""
+    with _cache_lock:
+        functions = {name: dict(s) for name, s in _cache_stats.items()}
+        hits = sum(s['hits'] for s in functions.values())
+        misses = sum(s['misses'] for s in functions.values())
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+            'entries': len(_cache),
+            'invalidations': _cache_invalidations,
+            'functions': functions,
+        }
+
+# ------------------ Schema migrations ------------------ #
+# Each step runs once, in order, inside the init transaction; the number of
+# applied steps is stored in PRAGMA user_version. Append new steps to
+# MIGRATIONS - never edit or reorder ones that have shipped.
+
+def schema_version(conn=None):
+    conn = conn or get_conn()
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn):
+    version = schema_version(conn)
+    for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+        step(conn)
+        conn.execute(f"PRAGMA user_version={number}")
+    return schema_version(conn)
+
+def _column_names(conn, table):
+    return {r['name'] for r in conn.execute(f"PRAGMA table_info({table})")}
+
+def _add_column(conn, table, column, decl):
+    # ALTER TABLE has no IF NOT EXISTS; check first so steps are re-runnable
+    if column not in _column_names(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+def _migration_001_base_tables(conn):
+    # CREATE IF NOT EXISTS: pre-migration afyamama.db files already have these
+    _create_tables(conn)
+
+def _migration_002_indexes(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_mothers_created_at ON mothers (created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_children_mother ON children (mother_id, dob)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_logs_mother ON chat_logs (mother_id, created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_followups_created_at ON followups (created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_followups_mother ON followups (mother_id, created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_followups_done_due ON followups (done, due_date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_anc_visits_mother_date ON anc_visits (mother_id, visit_date)")
+    conn.execute("ANALYZE")
+
+def _migration_003_mother_filter_indexes(conn):
+    # filtered registry pages keep created_at order, so it trails each index
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_mothers_location ON mothers (location, created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_mothers_status ON mothers (status, created_at)")
+
+def _migration_004_stored_risk(conn):
+    # filled in by _rescore_mother() on write and by rescore_stale() for old rows
+    _add_column(conn, 'mothers', 'risk', 'TEXT')
+    _add_column(conn, 'mothers', 'risk_score', 'INTEGER')
+    _add_column(conn, 'mothers', 'risk_reason_mask', 'INTEGER')
+    _add_column(conn, 'mothers', 'risk_version', 'TEXT')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_mothers_risk ON mothers (risk, created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_mothers_risk_version ON mothers (risk_version)")
+
+def _migration_005_rollups(conn):
+    conn.execute("""CREATE TABLE IF NOT EXISTS rollups (
+        metric TEXT NOT NULL,
+        day TEXT NOT NULL,
+        location TEXT NOT NULL,
+        risk TEXT NOT NULL,
+        n INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (metric, day, location, risk)
+    ) WITHOUT ROWID""")
+    _create_rollup_triggers(conn)
+    rebuild_rollups(conn)
+
+def _migration_006_structured_anc(conn):
+    _add_column(conn, 'anc_visits', 'urine_protein', 'TEXT')
+    _add_column(conn, 'anc_visits', 'fetal_hr', 'REAL')
+    _add_column(conn, 'anc_visits', 'fundal_height', 'REAL')
+    _add_column(conn, 'anc_visits', 'symptoms', 'TEXT')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_anc_visits_date ON anc_visits (visit_date)")
+    # one-time backfill from the notes formats older app versions wrote;
+    # notes are left as they were so nothing is lost
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, notes FROM anc_visits WHERE id > ? AND notes IS NOT NULL AND notes != '' ORDER BY id LIMIT ?",
+            (last_id, ANC_BACKFILL_BATCH_SIZE)).fetchall()
+        if not rows:
+            break
+        updates = []
+        for r in rows:
+            parsed = parse_anc_notes(r['notes'])
+            if any(parsed[k] is not None for k in ANC_DETAIL_FIELDS):
+                updates.append(tuple(parsed[k] for k in ANC_DETAIL_FIELDS) + (r['id'],))
+        conn.executemany("UPDATE anc_visits SET urine_protein=?, fetal_hr=?, fundal_height=?, symptoms=? WHERE id=?",
+                         updates)
+        last_id = rows[-1]['id']
+
+def _migration_007_triage(conn):
+    # danger signs found in free text by danger_signs.run(), one row per sign
+    conn.execute("""CREATE TABLE IF NOT EXISTS triage_signs (
+        source TEXT NOT NULL,
+        record_id INTEGER NOT NULL,
+        mother_id TEXT,
+        sign TEXT NOT NULL,
+        detected_at TEXT,
+        PRIMARY KEY (source, record_id, sign)
+    ) WITHOUT ROWID""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_triage_signs_mother ON triage_signs (mother_id, sign)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_triage_signs_sign ON triage_signs (sign, detected_at)")
+    # high-water mark: highest record id already triaged, per source table
+    conn.execute("""CREATE TABLE IF NOT EXISTS triage_state (
+        source TEXT PRIMARY KEY,
+        last_id INTEGER NOT NULL DEFAULT 0
+    )""")
+    # records below the mark whose text changed since they were triaged
+    conn.execute("""CREATE TABLE IF NOT EXISTS triage_pending (
+        source TEXT NOT NULL,
+        record_id INTEGER NOT NULL,
+        PRIMARY KEY (source, record_id)
+    ) WITHOUT ROWID""")
+    conn.execute("DROP TRIGGER IF EXISTS trg_triage_mother_notes")
+    conn.execute("""CREATE TRIGGER trg_triage_mother_notes AFTER UPDATE OF notes ON mothers
+        WHEN OLD.notes IS NOT NEW.notes BEGIN
+            DELETE FROM triage_signs WHERE source = 'mothers' AND record_id = NEW.id;
+            INSERT OR IGNORE INTO triage_pending (source, record_id) VALUES ('mothers', NEW.id);
+        END""")
+    conn.execute("DROP TRIGGER IF EXISTS trg_triage_mother_delete")
+    conn.execute("""CREATE TRIGGER trg_triage_mother_delete AFTER DELETE ON mothers BEGIN
+            DELETE FROM triage_signs WHERE mother_id = OLD.mother_id;
+        END""")
+    conn.execute("DROP VIEW IF EXISTS flagged_mothers")
+    conn.execute("""CREATE VIEW flagged_mothers AS
+        SELECT s.mother_id, m.name, m.location, m.risk,
+               GROUP_CONCAT(DISTINCT s.sign) AS signs,
+               COUNT(DISTINCT s.source || ':' || s.record_id) AS flagged_records,
+               MAX(s.detected_at) AS last_detected_at
+        FROM triage_signs s JOIN mothers m ON m.mother_id = s.mother_id
+        GROUP BY s.mother_id""")
+
+def _migration_008_fulltext(conn):
+    if not fts_available(conn):
+        return  # search_records() falls back to LIKE on this SQLite build
+    for table, columns in FTS_TABLES.items():
+        _create_fts(conn, table, columns)
+
+def _migration_009_followup_schedule(conn):
+    _add_column(conn, 'followups', 'assigned_to', 'TEXT')  # CHV responsible
+    _add_column(conn, 'followups', 'kind', 'TEXT')         # 'anc', 'referral' or NULL (manual)
+    _add_column(conn, 'followups', 'done_at', 'TEXT')
+    conn.execute(f"UPDATE followups SET kind = 'referral' WHERE notes LIKE '{REFERRAL_PREFIX}%'")
+    # worklists only ever read open rows, so index just those, by due date
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_followups_open_due ON followups (due_date, id) WHERE done = 0")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_followups_open_chv "
+                 "ON followups (assigned_to, due_date, id) WHERE done = 0")
+    # one generated ANC contact per mother and day: re-scheduling is idempotent
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_followups_anc_contact "
+                 "ON followups (mother_id, due_date) WHERE kind = 'anc'")
+    # an ANC visit completes the contacts due up to a week after it
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS trg_followups_anc_visit AFTER INSERT ON anc_visits BEGIN
+            UPDATE followups SET done = 1, done_at = NEW.created_at
+            WHERE mother_id = NEW.mother_id AND kind = 'anc' AND done = 0
+              AND due_date < date(NEW.visit_date, '+8 days');
+        END""")
+
+def _migration_010_change_log(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS sync_meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("INSERT OR IGNORE INTO sync_meta (key, value) VALUES ('device_id', lower(hex(randomblob(8))))")
+    # last change per row, newest seq last; deletes stay as tombstones
+    conn.execute("""CREATE TABLE IF NOT EXISTS sync_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        tbl TEXT NOT NULL,
+        row_key TEXT NOT NULL,
+        deleted INTEGER NOT NULL DEFAULT 0,
+        changed_at TEXT NOT NULL,
+        origin TEXT NOT NULL,
+        UNIQUE (tbl, row_key)
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sync_log_origin ON sync_log (origin, seq)")
+    # per-peer sync watermarks, on the device side
+    conn.execute("""CREATE TABLE IF NOT EXISTS sync_peers (
+        peer TEXT PRIMARY KEY,
+        pushed_seq INTEGER NOT NULL DEFAULT 0,
+        pulled_seq INTEGER NOT NULL DEFAULT 0
+    )""")
+    for table, key in SYNC_TABLES.items():
+        if key == 'uid':
+            _add_column(conn, table, 'uid', 'TEXT')
+            conn.execute(f"UPDATE {table} SET uid = lower(hex(randomblob(16))) WHERE uid IS NULL")
+            conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_uid ON {table} (uid)")
+        _create_sync_triggers(conn, table, key)
+        # everything already on file is one big first changeset
+        conn.execute(f"""INSERT OR IGNORE INTO sync_log (tbl, row_key, changed_at, origin)
+            SELECT '{table}', {key}, {_SYNC_NOW}, {_SYNC_DEVICE} FROM {table} WHERE {key} IS NOT NULL ORDER BY id""")
+
+def _migration_011_anc_trends(conn):
+    # derived from anc_visits by triggers; local to each database, never synced
+    conn.execute("""CREATE TABLE IF NOT EXISTS anc_trends (
+        visit_id INTEGER PRIMARY KEY,
+        mother_id TEXT,
+        visit_date TEXT,
+        prev_visit_id INTEGER,
+        weeks_since_prev REAL,
+        sbp_change REAL,
+        dbp_change REAL,
+        hb_change REAL,
+        weight_gain_per_week REAL
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_anc_trends_mother ON anc_trends (mother_id, visit_date, visit_id)")
+    sums = ', '.join(f"{p}_{s} REAL NOT NULL DEFAULT 0" for p in TREND_SERIES for s in _TREND_SUMS)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS mother_trends (mother_id TEXT PRIMARY KEY, "
+                 f"visits INTEGER NOT NULL DEFAULT 0, {sums})")
+    _create_trend_triggers(conn)
+    rebuild_trends(conn)
+
+def _migration_012_outcomes(conn):
+    # labels for training the risk model (ml_model.py); one per pregnancy
+    conn.execute("""CREATE TABLE IF NOT EXISTS pregnancy_outcomes (
+        mother_id TEXT PRIMARY KEY,
+        outcome TEXT NOT NULL,
+        adverse INTEGER NOT NULL,
+        recorded_at TEXT
+    )""")
+
+def _migration_013_replicated_visit_order(conn):
+    # the latest / previous visit broke same-day ties on the local id, so two
+    # devices holding the same visits could score a mother differently
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_anc_visits_mother_date_uid ON anc_visits (mother_id, visit_date, uid)")
+    _create_trend_triggers(conn)
+    rebuild_trends(conn)
+    conn.execute("UPDATE mothers SET risk_version = NULL")
+
+def _migration_014_rollup_updates(conn):
+    # referral deletes/edits, ANC visits re-dated or re-assigned and events
+    # that arrived before their mother were not reflected in the counters
+    _create_rollup_triggers(conn)
+    rebuild_rollups(conn)
+
+def _migration_015_triage_visits_and_chats(conn):
+    # as for mothers' notes: edited visit / chat text is triaged again, and a
+    # deleted record takes its signs with it
+    for source, text in (('anc_visits', ('notes', 'symptoms')), ('chat_logs', ('user_input',))):
+        changed = ' OR '.join(f"OLD.{c} IS NOT NEW.{c}" for c in text + ('mother_id',))
+        conn.execute(f"DROP TRIGGER IF EXISTS trg_triage_{source}_text")
+        conn.execute(f"""CREATE TRIGGER trg_triage_{source}_text
+            AFTER UPDATE OF {', '.join(text)}, mother_id ON {source} WHEN {changed} BEGIN
+                DELETE FROM triage_signs WHERE source = '{source}' AND record_id = NEW.id;
+                INSERT OR IGNORE INTO triage_pending (source, record_id) VALUES ('{source}', NEW.id);
+            END""")
+        conn.execute(f"DROP TRIGGER IF EXISTS trg_triage_{source}_delete")
+        conn.execute(f"""CREATE TRIGGER trg_triage_{source}_delete AFTER DELETE ON {source} BEGIN
+                DELETE FROM triage_signs WHERE source = '{source}' AND record_id = OLD.id;
+                DELETE FROM triage_pending WHERE source = '{source}' AND record_id = OLD.id;
+            END""")
+    # signs of records deleted before these triggers existed
+    for source in ('anc_visits', 'chat_logs'):
+        conn.execute(f"DELETE FROM triage_signs WHERE source = '{source}' "
+                     f"AND record_id NOT IN (SELECT id FROM {source})")
+
+def _migration_016_triage_mother_delete(conn):
+    # deleting a mother cleared the signs of her visits and chats too; those
+    # records sit below the high-water mark, so if she was registered again
+    # they were never triaged again. Only her own record's signs go now: the
+    # flagged_mothers view already hides signs of a mother who is not there
+    conn.execute("DROP TRIGGER IF EXISTS trg_triage_mother_delete")
+    conn.execute("""CREATE TRIGGER trg_triage_mother_delete AFTER DELETE ON mothers BEGIN
+            DELETE FROM triage_signs WHERE source = 'mothers' AND record_id = OLD.id;
+            DELETE FROM triage_pending WHERE source = 'mothers' AND record_id = OLD.id;
+        END""")
+
+MIGRATIONS = [
+    _migration_001_base_tables,
+    _migration_002_indexes,
+    _migration_003_mother_filter_indexes,
+    _migration_004_stored_risk,
+    _migration_005_rollups,
+    _migration_006_structured_anc,
+    _migration_007_triage,
+    _migration_008_fulltext,
+    _migration_009_followup_schedule,
+    _migration_010_change_log,
+    _migration_011_anc_trends,
+    _migration_012_outcomes,
+    _migration_013_replicated_visit_order,
+    _migration_014_rollup_updates,
+    _migration_015_triage_visits_and_chats,
+    _migration_016_triage_mother_delete,
+]
+
+def _create_tables(conn):
     cur = conn.cursor()
 
     # Mothers table
@@ -78,151 +901,1047 @@ def init_db():
     )
     """)
 
-    conn.commit()
-    conn.close()
-
 # ------------------ Mother CRUD ------------------ #
 
 def add_mother(data: dict):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""INSERT OR IGNORE INTO mothers
-    (mother_id, name, age, phone, location, gestational_age_weeks, parity, bp_systolic, bp_diastolic, hb, bmi, notes, status, created_at)
-    VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-    """, (
-        data.get('mother_id'),
-        data.get('name'),
-        data.get('age'),
-        data.get('phone'),
-        data.get('location'),
-        data.get('gestational_age_weeks'),
-        data.get('parity'),
-        data.get('bp_systolic'),
-        data.get('bp_diastolic'),
-        data.get('hb'),
-        data.get('bmi'),
-        data.get('notes'),
-        data.get('status','active'),
-        datetime.utcnow().isoformat()
-    ))
-    conn.commit()
-    conn.close()
+    """Register a mother; returns False (and changes nothing) if her mother_id is already taken."""
+    with transaction(invalidates=('mothers', 'followups')) as conn:
+        cur = conn.execute("""INSERT OR IGNORE INTO mothers
+        (mother_id, name, age, phone, location, gestational_age_weeks, parity, bp_systolic, bp_diastolic, hb, bmi, notes, status, created_at)
+        VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+        """, (
+            data.get('mother_id'),
+            data.get('name'),
+            data.get('age'),
+            data.get('phone'),
+            data.get('location'),
+            data.get('gestational_age_weeks'),
+            data.get('parity'),
+            data.get('bp_systolic'),
+            data.get('bp_diastolic'),
+            data.get('hb'),
+            data.get('bmi'),
+            data.get('notes'),
+            data.get('status','active'),
+            datetime.utcnow().isoformat()
+        ))
+        if not cur.rowcount:
+            return False
+        _rescore_mother(conn, data.get('mother_id'))
+        _schedule_anc(conn, [data.get('mother_id')])
+    return True
 
 def edit_mother(mother_id, data: dict):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        UPDATE mothers SET
-        name=?, age=?, phone=?, location=?, gestational_age_weeks=?, parity=?,
-        bp_systolic=?, bp_diastolic=?, hb=?, bmi=?, notes=?, status=?
-        WHERE mother_id=?
-    """, (
-        data.get('name'),
-        data.get('age'),
-        data.get('phone'),
-        data.get('location'),
-        data.get('gestational_age_weeks'),
-        data.get('parity'),
-        data.get('bp_systolic'),
-        data.get('bp_diastolic'),
-        data.get('hb'),
-        data.get('bmi'),
-        data.get('notes'),
-        data.get('status', 'active'),
-        mother_id
-    ))
-    conn.commit()
-    conn.close()
+    with transaction(invalidates=('mothers', 'followups')) as conn:
+        conn.execute("""
+            UPDATE mothers SET
+            name=?, age=?, phone=?, location=?, gestational_age_weeks=?, parity=?,
+            bp_systolic=?, bp_diastolic=?, hb=?, bmi=?, notes=?, status=?
+            WHERE mother_id=?
+        """, (
+            data.get('name'),
+            data.get('age'),
+            data.get('phone'),
+            data.get('location'),
+            data.get('gestational_age_weeks'),
+            data.get('parity'),
+            data.get('bp_systolic'),
+            data.get('bp_diastolic'),
+            data.get('hb'),
+            data.get('bmi'),
+            data.get('notes'),
+            data.get('status', 'active'),
+            mother_id
+        ))
+        _rescore_mother(conn, mother_id)
+        # gestational age or status may have changed: redo her future contacts
+        _schedule_anc(conn, [mother_id])
 
 def delete_mother(mother_id):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM mothers WHERE mother_id=?", (mother_id,))
-    conn.commit()
-    conn.close()
+    with transaction(invalidates=('mothers', 'followups')) as conn:
+        # her open contacts would stay on the worklists (and the overdue
+        # rollups) with no one to visit; completed ones are kept as history
+        conn.execute("DELETE FROM followups WHERE mother_id=? AND NOT done", (mother_id,))
+        conn.execute("DELETE FROM mothers WHERE mother_id=?", (mother_id,))
 
+@cached('mothers')
 def get_mothers():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM mothers ORDER BY created_at DESC")
-    rows = cur.fetchall()
-    conn.close()
+    rows = get_conn().execute("SELECT * FROM mothers ORDER BY created_at DESC").fetchall()
     return [dict(r) for r in rows]
 
+# Columns a caller may project in query_mothers(); guards the f-string below.
+MOTHER_COLUMNS = (
+    'id', 'mother_id', 'name', 'age', 'phone', 'location', 'gestational_age_weeks', 'parity',
+    'bp_systolic', 'bp_diastolic', 'hb', 'bmi', 'notes', 'status', 'created_at',
+    'risk', 'risk_score', 'risk_reason_mask', 'risk_version',
+)
+
+def _mother_filters(search=None, location=None, status=None, risk=None):
+    clauses, params = [], []
+    if search and (fts := fts_query(search)) and _has_fts(get_conn()):
+        clauses.append("id IN (SELECT rowid FROM mothers_fts WHERE mothers_fts MATCH ?)")
+        params.append(fts)
+    elif search:
+        clauses.append("(name LIKE ? OR mother_id LIKE ?)")
+        params += [f"%{search}%", f"{search}%"]
+    if location:
+        clauses.append("location = ?")
+        params.append(location)
+    if status:
+        clauses.append("status = ?")
+        params.append(status)
+    if risk:
+        clauses.append("risk = ?")
+        params.append(risk)
+    return clauses, params
+
+@cached('mothers')
+def query_mothers(search=None, location=None, status=None, risk=None,
+                  after=None, limit=50, columns=None):
+    """One page of the registry, newest first, using keyset pagination.
+
+    `after` is the cursor returned with the previous page. Returns
+    (rows, next_cursor); next_cursor is None on the last page.
+    """
+    columns = tuple(columns or MOTHER_COLUMNS)
+    unknown = set(columns) - set(MOTHER_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown mother columns: {sorted(unknown)}")
+    # the cursor needs the sort key even when the caller didn't ask for it
+    select = list(columns) + [c for c in ('created_at', 'id') if c not in columns]
+
+    clauses, params = _mother_filters(search, location, status, risk)
+    if after:
+        clauses.append("(created_at, id) < (?, ?)")
+        params += list(after)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = get_conn().execute(
+        f"SELECT {', '.join(select)} FROM mothers {where} ORDER BY created_at DESC, id DESC LIMIT ?",
+        params + [limit + 1]).fetchall()
+
+    rows = [dict(r) for r in rows]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1]['created_at'], rows[-1]['id'])
+    return [{c: r[c] for c in columns} for r in rows], next_cursor
+
+@cached('mothers')
+def count_mothers(search=None, location=None, status=None, risk=None):
+    clauses, params = _mother_filters(search, location, status, risk)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return get_conn().execute(f"SELECT COUNT(*) FROM mothers {where}", params).fetchone()[0]
+
+@cached('mothers')
+def count_mothers_by_risk(location=None):
+    # read from the rollups; None counts mothers not scored yet
+    loc_sql, loc_params = ("AND location = ?", [location]) if location else ("", [])
+    rows = get_conn().execute(
+        f"SELECT risk, SUM(n) AS n FROM rollups WHERE metric = 'mothers' {loc_sql} GROUP BY risk HAVING SUM(n) > 0",
+        loc_params)
+    return {r['risk'] or None: r['n'] for r in rows}
+
+@cached('mothers')
+def get_mother_options(search=None, limit=50):
+    """Lightweight (mother_id, name) pairs for pickers: best match first, else newest first."""
+    if search and _has_fts(get_conn()):
+        return [(h['mother_id'], h['name']) for h in search_records(search, limit, kinds=('mothers',))]
+    rows, _ = query_mothers(search=search, limit=limit, columns=('mother_id', 'name'))
+    return [(r['mother_id'], r['name']) for r in rows]
+
+@cached('mothers')
+def has_mothers():
+    return get_conn().execute("SELECT 1 FROM mothers LIMIT 1").fetchone() is not None
+
+def _distinct_mother_values(column):
+    rows = get_conn().execute(
+        f"SELECT DISTINCT {column} FROM mothers WHERE {column} IS NOT NULL AND {column} != '' ORDER BY {column}").fetchall()
+    return [r[0] for r in rows]
+
+@cached('mothers')
+def get_locations():
+    return _distinct_mother_values('location')
+
+@cached('mothers')
+def get_statuses():
+    return _distinct_mother_values('status')
+
+@cached('mothers')
 def get_mother_by_id(mother_id):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM mothers WHERE mother_id = ?", (mother_id,))
-    row = cur.fetchone()
-    conn.close()
+    row = get_conn().execute("SELECT * FROM mothers WHERE mother_id = ?", (mother_id,)).fetchone()
     return dict(row) if row else None
 
 # ------------------ Children ------------------ #
 
 def add_child(data: dict):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""INSERT INTO children
-    (mother_id, child_name, dob, birth_weight, delivery_type, notes, created_at)
-    VALUES (?,?,?,?,?,?,?)
-    """, (
-        data.get('mother_id'),
-        data.get('child_name'),
-        data.get('dob'),
-        data.get('birth_weight'),
-        data.get('delivery_type'),
-        data.get('notes'),
-        datetime.utcnow().isoformat()
-    ))
-    conn.commit()
-    conn.close()
+    with transaction(invalidates=('children',)) as conn:
+        conn.execute("""INSERT INTO children
+        (mother_id, child_name, dob, birth_weight, delivery_type, notes, created_at)
+        VALUES (?,?,?,?,?,?,?)
+        """, (
+            data.get('mother_id'),
+            data.get('child_name'),
+            data.get('dob'),
+            data.get('birth_weight'),
+            data.get('delivery_type'),
+            data.get('notes'),
+            datetime.utcnow().isoformat()
+        ))
 
 # ------------------ Chat Logs ------------------ #
 
+def _insert_chat_log(conn, row):
+    conn.execute("INSERT INTO chat_logs (mother_id, user_input, assistant_response, created_at) VALUES (?,?,?,?)", row)
+
 def add_chat_log(mother_id, user_input, assistant_response):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("INSERT INTO chat_logs (mother_id, user_input, assistant_response, created_at) VALUES (?,?,?,?)",
-                (mother_id, user_input, assistant_response, datetime.utcnow().isoformat()))
-    conn.commit()
-    conn.close()
+    _write(_insert_chat_log, ((mother_id, user_input, assistant_response, datetime.utcnow().isoformat()),),
+           ('chat_logs',))
 
 # ------------------ Follow-ups ------------------ #
 
-def add_followup(mother_id, due_date, notes=''):
+def _insert_followup(conn, row):
+    conn.execute("INSERT INTO followups (mother_id, due_date, notes, assigned_to, kind, created_at) "
+                 "VALUES (?,?,?,?,?,?)", row)
+
+def add_followup(mother_id, due_date, notes='', assigned_to=None, kind=None):
+    _write(_insert_followup, ((mother_id, due_date, notes, assigned_to, kind, datetime.utcnow().isoformat()),),
+           ('followups',))
+
+@cached('followups')
+def get_followups(mother_id=None):
     conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("INSERT INTO followups (mother_id, due_date, notes, created_at) VALUES (?,?,?,?)",
-                (mother_id, due_date, notes, datetime.utcnow().isoformat()))
-    conn.commit()
-    conn.close()
+    if mother_id:
+        rows = conn.execute("SELECT * FROM followups WHERE mother_id=? ORDER BY created_at DESC", (mother_id,)).fetchall()
+    else:
+        rows = conn.execute("SELECT * FROM followups ORDER BY created_at DESC").fetchall()
+    return [dict(r) for r in rows]
+
+def mark_followup_done(followup_id):
+    mark_followups_done([followup_id])
+
+# ------------------ Follow-up scheduling ------------------ #
+# Worklists of open follow-ups by due date - overdue, due today, upcoming -
+# optionally for one CHV (assigned_to) or one location, read page by page
+# off the partial index of open follow-ups. Registering a pregnant mother
+# schedules her remaining ANC contacts; an ANC visit completes the ones due
+# by then (trigger in migration 009).
+
+# WHO 2016 ANC model: eight contacts, by gestational week
+ANC_CONTACT_WEEKS = (12, 20, 26, 30, 34, 36, 38, 40)
+
+FOLLOWUP_WORKLISTS = ('overdue', 'today', 'upcoming')
+
+UPCOMING_DAYS = 7
+
+SCHEDULE_BATCH_SIZE = 2000
+
+def anc_contact_dates(registered_on, gestational_age_weeks, today):
+    """(week, due date) of the ANC contacts still ahead, given the gestation at registration."""
+    if gestational_age_weeks is None:
+        return []
+    contacts = [(week, registered_on + timedelta(weeks=week - gestational_age_weeks)) for week in ANC_CONTACT_WEEKS]
+    return [(week, due) for week, due in contacts if due >= today]
+
+def _schedule_anc(conn, mother_ids, today=None):
+    # replace the open, future ANC contacts of these mothers; past and done ones stay
+    today = today or datetime.utcnow().date()
+    marks = ', '.join('?' * len(mother_ids))
+    rows = conn.execute(
+        f"SELECT mother_id, gestational_age_weeks, created_at FROM mothers WHERE mother_id IN ({marks}) "
+        f"AND COALESCE(status, 'active') = 'active' AND gestational_age_weeks IS NOT NULL", list(mother_ids))
+    now = datetime.utcnow().isoformat()
+    contacts = [(r['mother_id'], due.isoformat(), f"ANC contact at {week} weeks", now)
+                for r in rows
+                for week, due in anc_contact_dates(date.fromisoformat((r['created_at'] or now)[:10]),
+                                                   r['gestational_age_weeks'], today)]
+    # contacts whose date is unchanged are kept, so an edit only touches
+    # (and sync only ships) the ones that moved
+    keep = {(c[0], c[1]) for c in contacts}
+    stale = conn.execute(f"SELECT id, mother_id, due_date FROM followups WHERE kind = 'anc' AND done = 0 "
+                         f"AND due_date >= ? AND mother_id IN ({marks})", [today.isoformat()] + list(mother_ids))
+    conn.executemany("DELETE FROM followups WHERE id = ?",
+                     [(r['id'],) for r in stale if (r['mother_id'], r['due_date']) not in keep])
+    conn.executemany("INSERT OR IGNORE INTO followups (mother_id, due_date, notes, kind, created_at) "
+                     "VALUES (?, ?, ?, 'anc', ?)", contacts)
+    return len(contacts)
+
+def schedule_anc_followups(mother_ids=None, today=None, batch_size=SCHEDULE_BATCH_SIZE):
+    """(Re)generate upcoming ANC contacts for the given mothers, or all of them.
+
+    Runs in id-ordered batches, one transaction each. Returns the number of
+    contacts written.
+    """
+    if mother_ids is not None:
+        mother_ids = list(mother_ids)
+        total = 0
+        for i in range(0, len(mother_ids), batch_size):
+            with transaction(invalidates=('followups',)) as conn:
+                total += _schedule_anc(conn, mother_ids[i:i + batch_size], today)
+        return total
+    total, last_id = 0, 0
+    while True:
+        with transaction(invalidates=('followups',)) as conn:
+            rows = conn.execute("SELECT id, mother_id FROM mothers WHERE id > ? ORDER BY id LIMIT ?",
+                                (last_id, batch_size)).fetchall()
+            if not rows:
+                return total
+            total += _schedule_anc(conn, [r['mother_id'] for r in rows], today)
+        last_id = rows[-1]['id']
+
+def _worklist_filters(which, chv=None, location=None, today=None):
+    # each worklist is a [start, end) range of due dates; ISO strings compare as dates
+    today = today or datetime.utcnow().date()
+    tomorrow = today + timedelta(days=1)
+    bounds = {
+        'overdue': ('0000', today.isoformat()),
+        'today': (today.isoformat(), tomorrow.isoformat()),
+        'upcoming': (tomorrow.isoformat(), (tomorrow + timedelta(days=UPCOMING_DAYS)).isoformat()),
+    }
+    if which not in bounds:
+        raise ValueError(f"Unknown worklist: {which}")
+    clauses, params = ["f.done = 0", "f.due_date >= ?", "f.due_date < ?"], list(bounds[which])
+    if chv:
+        clauses.append("f.assigned_to = ?")
+        params.append(chv)
+    if location:
+        clauses.append("m.location = ?")
+        params.append(location)
+    return clauses, params
+
+@cached('followups', 'mothers')
+def get_followup_worklist(which, chv=None, location=None, after=None, limit=50, today=None):
+    """One page of open follow-ups, earliest due first (keyset pagination).
+
+    Returns (rows, next_cursor) like query_mothers().
+    """
+    clauses, params = _worklist_filters(which, chv, location, today)
+    if after:
+        clauses.append("(f.due_date, f.id) > (?, ?)")
+        params += list(after)
+    rows = get_conn().execute(
+        f"SELECT f.id, f.mother_id, m.name, m.phone, m.location, f.due_date, f.kind, f.assigned_to, f.notes "
+        f"FROM followups f LEFT JOIN mothers m ON m.mother_id = f.mother_id "
+        f"WHERE {' AND '.join(clauses)} ORDER BY f.due_date, f.id LIMIT ?", params + [limit + 1]).fetchall()
+    rows = [dict(r) for r in rows]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1]['due_date'], rows[-1]['id'])
+    return rows, next_cursor
+
+@cached('followups', 'mothers')
+def count_followup_worklists(chv=None, location=None, today=None):
+    counts = {}
+    for which in FOLLOWUP_WORKLISTS:
+        clauses, params = _worklist_filters(which, chv, location, today)
+        counts[which] = get_conn().execute(
+            f"SELECT COUNT(*) FROM followups f LEFT JOIN mothers m ON m.mother_id = f.mother_id "
+            f"WHERE {' AND '.join(clauses)}", params).fetchone()[0]
+    return counts
+
+@cached('followups')
+def get_followup_chvs():
+    rows = get_conn().execute("SELECT DISTINCT assigned_to FROM followups WHERE done = 0 "
+                              "AND assigned_to IS NOT NULL AND assigned_to != '' ORDER BY assigned_to")
+    return [r[0] for r in rows]
+
+def mark_followups_done(followup_ids):
+    """Close many follow-ups in one transaction; returns how many were still open."""
+    now = datetime.utcnow().isoformat()
+    with transaction(invalidates=('followups',)) as conn:
+        cur = conn.executemany("UPDATE followups SET done = 1, done_at = ? WHERE id = ? AND done = 0",
+                               [(now, fid) for fid in followup_ids])
+        return cur.rowcount
+
+def assign_followups(followup_ids, chv):
+    with transaction(invalidates=('followups',)) as conn:
+        conn.executemany("UPDATE followups SET assigned_to = ? WHERE id = ?",
+                         [(chv or None, fid) for fid in followup_ids])
 
 # ------------------ ANC Visits ------------------ #
 
-def add_anc_visit(data: dict):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
+URINE_PROTEIN_LEVELS = ["None", "Trace", "+1", "+2", "+3", "+4"]
+
+ANC_DETAIL_FIELDS = ('urine_protein', 'fetal_hr', 'fundal_height', 'symptoms')
+
+ANC_BACKFILL_BATCH_SIZE = 5000
+
+def _insert_anc_visit(conn, row):
+    conn.execute("""
         INSERT INTO anc_visits
-        (mother_id, visit_date, bp_systolic, bp_diastolic, hb, weight, notes, created_at)
-        VALUES (?,?,?,?,?,?,?,?)
-    """, (
-        data.get('mother_id'),
-        data.get('visit_date'),
-        data.get('bp_systolic'),
-        data.get('bp_diastolic'),
-        data.get('hb'),
-        data.get('weight'),
-        data.get('notes'),
-        datetime.utcnow().isoformat()
-    ))
-    conn.commit()
-    conn.close()
+        (mother_id, visit_date, bp_systolic, bp_diastolic, hb, weight,
+         urine_protein, fetal_hr, fundal_height, symptoms, notes, created_at)
+        VALUES (?,?,?,?,?,?,?,?,?,?,?,?)
+    """, row)
+    _rescore_mother(conn, row[0])
 
+def add_anc_visit(data: dict):
+    row = tuple(data.get(f) for f in ('mother_id', 'visit_date', 'bp_systolic', 'bp_diastolic', 'hb', 'weight',
+                                      'urine_protein', 'fetal_hr', 'fundal_height', 'symptoms', 'notes'))
+    _write(_insert_anc_visit, (row + (datetime.utcnow().isoformat(),),), ('anc_visits', 'mothers', 'followups'))
+
+@cached('anc_visits')
 def get_anc_visits(mother_id):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM anc_visits WHERE mother_id=? ORDER BY visit_date DESC", (mother_id,))
-    rows = cur.fetchall()
-    conn.close()
+    rows = get_conn().execute("SELECT * FROM anc_visits WHERE mother_id=? ORDER BY visit_date DESC", (mother_id,)).fetchall()
     return [dict(r) for r in rows]
+
+@cached('anc_visits')
+def get_anc_trend(mother_id, fields=('bp_systolic', 'bp_diastolic', 'hb', 'weight', 'fetal_hr', 'fundal_height')):
+    """Numeric visit columns for charting, oldest first (served by the mother/date index)."""
+    unknown = set(fields) - {'bp_systolic', 'bp_diastolic', 'hb', 'weight', 'fetal_hr', 'fundal_height'}
+    if unknown:
+        raise ValueError(f"Unknown ANC trend fields: {sorted(unknown)}")
+    rows = get_conn().execute(
+        f"SELECT visit_date, {', '.join(fields)} FROM anc_visits WHERE mother_id=? ORDER BY visit_date, id",
+        (mother_id,)).fetchall()
+    return [dict(r) for r in rows]
+
+# Keys used in notes by app versions before the structured columns, normalized
+# (lower-case, no spaces): "FetalHR: 140; ..." and "Fetal HR: 140\n..." both parse.
+_ANC_NOTE_KEYS = {
+    'urineprotein': 'urine_protein',
+    'fetalhr': 'fetal_hr',
+    'fundalheight': 'fundal_height',
+    'symptoms': 'symptoms',
+    'notes': 'notes',
+}
+
+def parse_anc_notes(text):
+    """Split a legacy ANC notes string into the structured fields plus leftover free text."""
+    parsed = dict.fromkeys(ANC_DETAIL_FIELDS)
+    free = []
+    for part in (text or '').replace('\n', ';').split(';'):
+        part = part.strip()
+        if not part:
+            continue
+        key, sep, value = part.partition(':')
+        field = _ANC_NOTE_KEYS.get(key.replace(' ', '').lower()) if sep else None
+        value = value.strip()
+        if field in ('fetal_hr', 'fundal_height'):
+            try:
+                parsed[field] = float(value)
+            except ValueError:
+                pass
+        elif field == 'notes' or field is None:
+            free.append(value if field else part)
+        else:
+            parsed[field] = value or None
+    parsed['notes'] = '; '.join(p for p in free if p) or None
+    return parsed
+
+# ------------------ ANC trends and timeline ------------------ #
+# Trend features are kept up to date by triggers on anc_visits, so every
+# write path (the app, importer, sync) maintains them and readers never
+# rescan a mother's history:
+#   anc_trends     one row per visit: change since her previous visit
+#   mother_trends  running least-squares sums per vital (count, t, y, t*t,
+#                  t*y with t in weeks); a visit adds its terms, a delete
+#                  subtracts them, and the slope is a closed-form expression
+# mother_trend_features combines the two into one row per mother.
+
+# prefix -> anc_visits column
+TREND_SERIES = {'sbp': 'bp_systolic', 'dbp': 'bp_diastolic', 'hb': 'hb', 'weight': 'weight'}
+
+_TREND_SUMS = ('n', 't', 'y', 'tt', 'ty')
+_TREND_EPOCH = '2020-01-01'  # keeps t small, so the sums stay precise
+
+_TREND_COLUMNS = ('visit_id', 'mother_id', 'visit_date', 'prev_visit_id', 'weeks_since_prev',
+                  'sbp_change', 'dbp_change', 'hb_change', 'weight_gain_per_week')
+
+_TREND_ROW_SQL = """
+    SELECT v.id, v.mother_id, v.visit_date, p.id,
+           (julianday(v.visit_date) - julianday(p.visit_date)) / 7.0,
+           v.bp_systolic - p.bp_systolic, v.bp_diastolic - p.bp_diastolic, v.hb - p.hb,
+           CASE WHEN julianday(v.visit_date) > julianday(p.visit_date)
+                THEN (v.weight - p.weight) * 7.0 / (julianday(v.visit_date) - julianday(p.visit_date)) END
+    FROM anc_visits v
+    LEFT JOIN anc_visits p ON p.id = (
+        SELECT id FROM anc_visits WHERE mother_id = v.mother_id AND (visit_date, uid) < (v.visit_date, v.uid)
+        ORDER BY visit_date DESC, uid DESC LIMIT 1)"""
+
+def _next_visit_sql(row, uid=None):
+    uid = uid or f"{row}.uid"
+    return (f"(SELECT id FROM anc_visits WHERE mother_id = {row}.mother_id "
+            f"AND (visit_date, uid) > ({row}.visit_date, {uid}) ORDER BY visit_date, uid LIMIT 1)")
+
+def _refresh_trend_sql(visit_id):
+    return (f"DELETE FROM anc_trends WHERE visit_id = {visit_id}; "
+            f"INSERT INTO anc_trends ({', '.join(_TREND_COLUMNS)}) {_TREND_ROW_SQL} WHERE v.id = {visit_id};")
+
+def _trend_sums_sql(row, sign):
+    # add (sign=1) or remove (sign=-1) one visit's terms from its mother's sums
+    t = f"((julianday({row}.visit_date) - julianday('{_TREND_EPOCH}')) / 7.0)"
+    terms = {}
+    for p, column in TREND_SERIES.items():
+        y = f"{row}.{column}"
+        for s, expr in zip(_TREND_SUMS, ('1', t, y, f"{t} * {t}", f"{t} * {y}")):
+            terms[f"{p}_{s}"] = f"CASE WHEN {y} IS NOT NULL AND {t} IS NOT NULL THEN {sign} * {expr} ELSE 0 END"
+    columns = ', '.join(terms)
+    return (f"INSERT INTO mother_trends (mother_id, visits, {columns}) "
+            f"SELECT {row}.mother_id, {sign}, {', '.join(terms.values())} WHERE {row}.mother_id IS NOT NULL "
+            f"ON CONFLICT (mother_id) DO UPDATE SET visits = visits + excluded.visits, "
+            f"{', '.join(f'{c} = {c} + excluded.{c}' for c in terms)};")
+
+def _slope_sql(p, sums='s'):
+    # least-squares slope per week from the running sums of series `p`
+    n, t, y, tt, ty = (f"{sums}.{p}_{x}" for x in _TREND_SUMS)
+    return (f"CASE WHEN {n} >= 2 AND {n} * {tt} - {t} * {t} > 1e-6 "
+            f"THEN ({n} * {ty} - {t} * {y}) / ({n} * {tt} - {t} * {t}) END")
+
+def _create_trend_triggers(conn):
+    def trigger(name, event, body):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.execute(f"CREATE TRIGGER {name} AFTER {event} BEGIN {' '.join(body)} END")
+
+    # a visit's features depend on the visit before it, so a backdated insert
+    # or a delete also refreshes the visit that follows it. Same-day visits are
+    # ordered by uid, which every device agrees on (local ids differ), so a new
+    # visit needs its uid before it is placed; the sync trigger leaves it be
+    new_uid = "(SELECT uid FROM anc_visits WHERE id = NEW.id)"
+    trigger("trg_trends_anc_ins", "INSERT ON anc_visits",
+            ["UPDATE anc_visits SET uid = lower(hex(randomblob(16))) WHERE id = NEW.id AND uid IS NULL;",
+             _trend_sums_sql('NEW', 1), _refresh_trend_sql('NEW.id'),
+             _refresh_trend_sql(_next_visit_sql('NEW', new_uid))])
+    trigger("trg_trends_anc_del", "DELETE ON anc_visits",
+            [_trend_sums_sql('OLD', -1), "DELETE FROM anc_trends WHERE visit_id = OLD.id;",
+             _refresh_trend_sql(_next_visit_sql('OLD'))])
+    trigger("trg_trends_anc_upd", f"UPDATE OF mother_id, visit_date, {', '.join(TREND_SERIES.values())} ON anc_visits",
+            [_trend_sums_sql('OLD', -1), _trend_sums_sql('NEW', 1), _refresh_trend_sql('NEW.id'),
+             _refresh_trend_sql(_next_visit_sql('OLD')), _refresh_trend_sql(_next_visit_sql('NEW'))])
+
+    slopes = ', '.join(f"{_slope_sql(p)} AS {p}_slope" for p in TREND_SERIES)
+    conn.execute("DROP VIEW IF EXISTS mother_trend_features")
+    conn.execute(f"""CREATE VIEW mother_trend_features AS
+        SELECT s.mother_id, s.visits, {slopes},
+               l.visit_id AS last_visit_id, l.visit_date AS last_visit_date, l.weeks_since_prev,
+               l.sbp_change, l.dbp_change, l.hb_change, l.weight_gain_per_week
+        FROM mother_trends s
+        LEFT JOIN anc_trends l ON l.visit_id = (
+            SELECT id FROM anc_visits WHERE mother_id = s.mother_id
+            ORDER BY visit_date DESC, uid DESC LIMIT 1)""")
+
+def rebuild_trends(conn=None):
+    """Recompute anc_trends and mother_trends from anc_visits (backfill / repair)."""
+    def run(conn):
+        conn.execute("DELETE FROM anc_trends")
+        conn.execute(f"INSERT INTO anc_trends ({', '.join(_TREND_COLUMNS)}) {_TREND_ROW_SQL}")
+        conn.execute("DELETE FROM mother_trends")
+        t = f"((julianday(visit_date) - julianday('{_TREND_EPOCH}')) / 7.0)"
+        sums = []
+        for p, y in TREND_SERIES.items():
+            for expr in ('1', t, y, f"{t} * {t}", f"{t} * {y}"):
+                sums.append(f"TOTAL(CASE WHEN {y} IS NOT NULL AND {t} IS NOT NULL THEN {expr} END)")
+        columns = ', '.join(f"{p}_{s}" for p in TREND_SERIES for s in _TREND_SUMS)
+        conn.execute(f"INSERT INTO mother_trends (mother_id, visits, {columns}) "
+                     f"SELECT mother_id, COUNT(*), {', '.join(sums)} FROM anc_visits "
+                     f"WHERE mother_id IS NOT NULL GROUP BY mother_id")
+
+    if conn is not None:
+        run(conn)
+    else:
+        with transaction(invalidates=('anc_visits',)) as conn:
+            run(conn)
+
+@cached('anc_visits')
+def get_mother_trends(mother_id):
+    """Stored trend features for one mother: per-week slopes of each vital over
+    all her visits, plus the changes at her latest visit. None without visits."""
+    row = get_conn().execute("SELECT * FROM mother_trend_features WHERE mother_id = ?", (mother_id,)).fetchone()
+    return dict(row) if row and row['visits'] else None
+
+_TIMELINE_SQL = """
+    SELECT substr(created_at, 1, 10) AS date, 'registration' AS event, id AS ref_id,
+           bp_systolic, bp_diastolic, hb, NULL AS weight, NULL AS urine_protein, notes AS detail,
+           NULL AS weeks_since_prev, NULL AS sbp_change, NULL AS dbp_change, NULL AS hb_change,
+           NULL AS weight_gain_per_week, NULL AS done
+    FROM mothers WHERE mother_id = :m
+    UNION ALL
+    SELECT v.visit_date, 'anc_visit', v.id, v.bp_systolic, v.bp_diastolic, v.hb, v.weight, v.urine_protein,
+           COALESCE(v.symptoms, v.notes), t.weeks_since_prev, t.sbp_change, t.dbp_change, t.hb_change,
+           t.weight_gain_per_week, NULL
+    FROM anc_visits v LEFT JOIN anc_trends t ON t.visit_id = v.id WHERE v.mother_id = :m
+    UNION ALL
+    SELECT dob, 'child', id, NULL, NULL, NULL, birth_weight, NULL, child_name,
+           NULL, NULL, NULL, NULL, NULL, NULL
+    FROM children WHERE mother_id = :m
+    UNION ALL
+    SELECT due_date, 'followup', id, NULL, NULL, NULL, NULL, NULL, notes,
+           NULL, NULL, NULL, NULL, NULL, done
+    FROM followups WHERE mother_id = :m
+    ORDER BY date, ref_id"""
+
+@cached('mothers', 'anc_visits', 'children', 'followups')
+def get_mother_timeline(mother_id):
+    """Registration, ANC visits (with their stored trend features), children and
+    follow-ups for one mother, oldest first, in one query over the mother_id indexes."""
+    return [dict(r) for r in get_conn().execute(_TIMELINE_SQL, {'m': mother_id})]
+
+# ------------------ Stored risk scores ------------------ #
+# Each mother row carries the result of risk_model for her latest inputs:
+# registration vitals, overridden by the most recent ANC visit's BP and Hb,
+# and the notes of both, plus her trend state (risk_model.TREND_STATE) for
+# the visit-history rules. Scores come from the active scorer (the rules, or
+# a trained model: see risk_model, "Scorers"), and rows stamped with another
+# version than risk_model.scorer_version() are stale and get re-scored in
+# the background.
+
+# the trend state is read from the stored sums and the latest visit's
+# anc_trends row: lookups by key, not a scan of her visits
+_RISK_INPUTS_SQL = f"""
+    SELECT m.id, m.mother_id, m.age, m.bmi, m.parity,
+           COALESCE(v.bp_systolic, m.bp_systolic) AS bp_systolic,
+           COALESCE(v.bp_diastolic, m.bp_diastolic) AS bp_diastolic,
+           COALESCE(v.hb, m.hb) AS hb,
+           COALESCE(m.notes, '') || ' ' || COALESCE(v.symptoms, '') || ' ' || COALESCE(v.notes, '') AS notes,
+           s.visits, {_slope_sql('sbp')} AS sbp_slope, {_slope_sql('hb')} AS hb_slope,
+           t.sbp_change, t.dbp_change, t.hb_change, t.weight_gain_per_week,
+           v.bp_systolic AS last_bp_systolic, v.bp_diastolic AS last_bp_diastolic,
+           v.urine_protein AS last_urine_protein
+    FROM mothers m
+    LEFT JOIN anc_visits v ON v.id = (
+        SELECT id FROM anc_visits WHERE mother_id = m.mother_id
+        ORDER BY visit_date DESC, uid DESC LIMIT 1)
+    LEFT JOIN anc_trends t ON t.visit_id = v.id
+    LEFT JOIN mother_trends s ON s.mother_id = m.mother_id
+"""
+
+_RISK_INPUT_COLUMNS = ('age', 'bp_systolic', 'bp_diastolic', 'hb', 'bmi', 'parity', 'notes') + risk_model.TREND_STATE
+
+_RISK_UPDATE_SQL = "UPDATE mothers SET risk=?, risk_score=?, risk_reason_mask=?, risk_version=? WHERE id=?"
+
+RESCORE_BATCH_SIZE = 2000
+
+def _rescore_mother(conn, mother_id):
+    row = conn.execute(_RISK_INPUTS_SQL + " WHERE m.mother_id = ?", (mother_id,)).fetchone()
+    if row is None:
+        return None
+    r = risk_model.score({name: row[name] for name in _RISK_INPUT_COLUMNS})
+    conn.execute(_RISK_UPDATE_SQL, (r['risk'], r['score'], risk_model.reasons_to_mask(r['reasons']),
+                                    r['version'], row['id']))
+    return r
+
+def rescore_mother(mother_id):
+    with transaction(invalidates=('mothers',)) as conn:
+        return _rescore_mother(conn, mother_id)
+
+def stored_risk(mother):
+    """predict_risk()-style dict from a mother row's stored score, or None if stale."""
+    if mother.get('risk_version') != risk_model.scorer_version():
+        return None
+    return {
+        'risk': mother['risk'],
+        'score': mother['risk_score'],
+        'reasons': risk_model.reasons_from_mask(mother['risk_reason_mask'] or 0),
+    }
+
+def has_stale_risk():
+    row = get_conn().execute("SELECT 1 FROM mothers WHERE risk_version IS NOT ? LIMIT 1",
+                             (risk_model.scorer_version(),)).fetchone()
+    return row is not None
+
+def rescore_stale(batch_size=RESCORE_BATCH_SIZE, path=None):
+    """Re-score every mother whose stored score came from another scorer version.
+
+    Works in id order, one short transaction per batch, so writers are never
+    blocked for long. Returns the number of rows re-scored.
+    """
+    total, last_id = 0, 0
+    version = risk_model.scorer_version()
+    while True:
+        with transaction(path, invalidates=('mothers',)) as conn:
+            rows = conn.execute(
+                _RISK_INPUTS_SQL + " WHERE m.risk_version IS NOT ? AND m.id > ? ORDER BY m.id LIMIT ?",
+                (version, last_id, batch_size)).fetchall()
+            if not rows:
+                return total
+            columns = {name: [r[name] for r in rows] for name in _RISK_INPUT_COLUMNS}
+            scored = risk_model.score_batch(columns)
+            conn.executemany(_RISK_UPDATE_SQL, [
+                (risk, int(score), int(mask), scored['version'], r['id'])
+                for r, risk, score, mask in zip(rows, scored['risk'], scored['score'], scored['reason_mask'])
+            ])
+        total += len(rows)
+        last_id = rows[-1]['id']
+
+_rescoring = set()  # db paths with a rescore_stale_async() thread running
+_rescoring_lock = threading.Lock()
+
+def rescore_stale_async():
+    """Start rescore_stale() on a daemon thread unless one is already running for this database."""
+    path = current_path()
+    with _rescoring_lock:
+        if str(path) in _rescoring:
+            return None
+        _rescoring.add(str(path))
+
+    def run():
+        try:
+            rescore_stale(path=path)
+        finally:
+            close_conn(path)
+            with _rescoring_lock:
+                _rescoring.discard(str(path))
+
+    thread = threading.Thread(target=run, name="afyamama-rescore", daemon=True)
+    thread.start()
+    return thread
+
+# ------------------ Pregnancy outcomes ------------------ #
+# What happened at the end of each pregnancy: the labels ml_model.py trains
+# on. Not synced; each database trains on the outcomes recorded there.
+
+OUTCOMES = {
+    'Live birth, no complications': 0,
+    'Pre-eclampsia / eclampsia': 1,
+    'Postpartum haemorrhage': 1,
+    'Preterm birth': 1,
+    'Stillbirth': 1,
+    'Maternal death': 1,
+    'Other complication': 1,
+}
+
+def record_outcome(mother_id, outcome, adverse=None):
+    """Record (or correct) a mother's pregnancy outcome; `adverse` defaults from OUTCOMES."""
+    if adverse is None:
+        if outcome not in OUTCOMES:
+            raise ValueError(f"Unknown outcome {outcome!r}; pass adverse= explicitly")
+        adverse = OUTCOMES[outcome]
+    with transaction(invalidates=('pregnancy_outcomes',)) as conn:
+        conn.execute("DELETE FROM pregnancy_outcomes WHERE mother_id = ?", (mother_id,))
+        conn.execute("INSERT INTO pregnancy_outcomes (mother_id, outcome, adverse, recorded_at) VALUES (?, ?, ?, ?)",
+                     (mother_id, outcome, int(bool(adverse)), datetime.now().isoformat()))
+
+@cached('pregnancy_outcomes')
+def get_outcome(mother_id):
+    row = get_conn().execute("SELECT * FROM pregnancy_outcomes WHERE mother_id = ?", (mother_id,)).fetchone()
+    return dict(row) if row else None
+
+def get_training_data(path=None):
+    """Risk inputs (as for rescore_stale) and 0/1 adverse labels of every mother with an outcome."""
+    rows = get_conn(path).execute(f"""
+        SELECT i.*, o.adverse FROM ({_RISK_INPUTS_SQL}
+            WHERE m.mother_id IN (SELECT mother_id FROM pregnancy_outcomes)) i
+        JOIN pregnancy_outcomes o ON o.mother_id = i.mother_id ORDER BY i.id""").fetchall()
+    return {name: [r[name] for r in rows] for name in _RISK_INPUT_COLUMNS}, [r['adverse'] for r in rows]
+
+# ------------------ Dashboard rollups ------------------ #
+# Counters in the rollups table, keyed by (metric, day, location, risk) and
+# kept current by triggers, so every write path - including batch re-scores
+# and the app.py fallbacks - updates them in the same transaction. Metrics:
+#   mothers         existing mothers by registration day and current risk band
+#   anc_visits      visits by visit_date
+#   followups_open  open follow-ups by due_date (overdue = due before today)
+#   referrals       referral follow-ups by creation day
+# ANC visits and follow-ups are counted under the mother's current location.
+# Empty string stands in for a missing location or risk so keys stay unique.
+
+REFERRAL_PREFIX = "Referral:"
+
+# base tables the rollups are derived from: what cached rollup reads depend on
+_ROLLUP_TABLES = ('mothers', 'anc_visits', 'followups')
+
+_MOTHER_LOCATION_SQL = "COALESCE((SELECT location FROM mothers WHERE mother_id = {row}.mother_id), '')"
+
+def _bump_sql(metric, day, location, risk, delta):
+    risk = risk or "NULL"
+    return (f"INSERT INTO rollups (metric, day, location, risk, n) "
+            f"VALUES ('{metric}', COALESCE(substr({day}, 1, 10), ''), COALESCE({location}, ''), "
+            f"COALESCE({risk}, ''), {delta}) "
+            f"ON CONFLICT (metric, day, location, risk) DO UPDATE SET n = n + excluded.n;")
+
+# (metric, table, day column, row filter) for counters keyed by the mother's location
+_MOTHER_EVENT_METRICS = [
+    ('anc_visits', 'anc_visits', 'visit_date', "1"),
+    ('followups_open', 'followups', 'due_date', "NOT done"),
+    ('referrals', 'followups', 'created_at', f"notes LIKE '{REFERRAL_PREFIX}%'"),
+]
+
+def _move_mother_events_sql(mother_id, old_location, new_location):
+    # when a mother moves (or is deleted) her visit/follow-up counters follow her
+    statements = []
+    for metric, table, day, where in _MOTHER_EVENT_METRICS:
+        for location, sign in ((old_location, '-'), (new_location, '')):
+            statements.append(
+                f"INSERT INTO rollups (metric, day, location, risk, n) "
+                f"SELECT '{metric}', COALESCE(substr({day}, 1, 10), ''), COALESCE({location}, ''), '', {sign}COUNT(*) "
+                f"FROM {table} WHERE mother_id = {mother_id} AND {where} GROUP BY 2 "
+                f"ON CONFLICT (metric, day, location, risk) DO UPDATE SET n = n + excluded.n;")
+    return statements
+
+def _create_rollup_triggers(conn):
+    def trigger(name, event, body, when=None):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        when_sql = f" WHEN {when}" if when else ""
+        conn.execute(f"CREATE TRIGGER {name} AFTER {event}{when_sql} BEGIN {' '.join(body)} END")
+
+    mother_old = ('OLD.created_at', 'OLD.location', 'OLD.risk')
+    mother_new = ('NEW.created_at', 'NEW.location', 'NEW.risk')
+    trigger("trg_rollup_mothers_ins", "INSERT ON mothers", [_bump_sql('mothers', *mother_new, 1)])
+    # visits and follow-ups that arrived before their mother (sync, imports) were counted under ''
+    trigger("trg_rollup_mothers_adopt", "INSERT ON mothers",
+            _move_mother_events_sql('NEW.mother_id', "''", 'NEW.location'),
+            when="NEW.mother_id IS NOT NULL AND COALESCE(NEW.location, '') != ''")
+    trigger("trg_rollup_mothers_del", "DELETE ON mothers",
+            [_bump_sql('mothers', *mother_old, -1)] + _move_mother_events_sql('OLD.mother_id', 'OLD.location', 'NULL'))
+    trigger("trg_rollup_mothers_move", "UPDATE OF location ON mothers",
+            _move_mother_events_sql('NEW.mother_id', 'OLD.location', 'NEW.location'),
+            when="OLD.location IS NOT NEW.location")
+    trigger("trg_rollup_mothers_upd", "UPDATE OF created_at, location, risk ON mothers",
+            [_bump_sql('mothers', *mother_old, -1), _bump_sql('mothers', *mother_new, 1)],
+            when="OLD.created_at IS NOT NEW.created_at OR OLD.location IS NOT NEW.location "
+                 "OR OLD.risk IS NOT NEW.risk")
+
+    new_loc, old_loc = _MOTHER_LOCATION_SQL.format(row='NEW'), _MOTHER_LOCATION_SQL.format(row='OLD')
+    trigger("trg_rollup_anc_ins", "INSERT ON anc_visits", [_bump_sql('anc_visits', 'NEW.visit_date', new_loc, None, 1)])
+    trigger("trg_rollup_anc_del", "DELETE ON anc_visits", [_bump_sql('anc_visits', 'OLD.visit_date', old_loc, None, -1)])
+    trigger("trg_rollup_anc_upd", "UPDATE OF visit_date, mother_id ON anc_visits",
+            [_bump_sql('anc_visits', 'OLD.visit_date', old_loc, None, -1),
+             _bump_sql('anc_visits', 'NEW.visit_date', new_loc, None, 1)],
+            when="OLD.visit_date IS NOT NEW.visit_date OR OLD.mother_id IS NOT NEW.mother_id")
+
+    trigger("trg_rollup_followups_ins", "INSERT ON followups",
+            [_bump_sql('followups_open', 'NEW.due_date', new_loc, None, 1)], when="NOT NEW.done")
+    trigger("trg_rollup_followups_del", "DELETE ON followups",
+            [_bump_sql('followups_open', 'OLD.due_date', old_loc, None, -1)], when="NOT OLD.done")
+    # re-keying an open follow-up (or re-opening it) is a -1 on the old key and a +1 on the new one
+    trigger("trg_rollup_followups_upd_old", "UPDATE OF done, due_date, mother_id ON followups",
+            [_bump_sql('followups_open', 'OLD.due_date', old_loc, None, -1)], when="NOT OLD.done")
+    trigger("trg_rollup_followups_upd_new", "UPDATE OF done, due_date, mother_id ON followups",
+            [_bump_sql('followups_open', 'NEW.due_date', new_loc, None, 1)], when="NOT NEW.done")
+    old_referral, new_referral = (f"{row}.notes LIKE '{REFERRAL_PREFIX}%'" for row in ('OLD', 'NEW'))
+    trigger("trg_rollup_referrals_ins", "INSERT ON followups",
+            [_bump_sql('referrals', 'NEW.created_at', new_loc, None, 1)], when=new_referral)
+    trigger("trg_rollup_referrals_del", "DELETE ON followups",
+            [_bump_sql('referrals', 'OLD.created_at', old_loc, None, -1)], when=old_referral)
+    trigger("trg_rollup_referrals_upd_old", "UPDATE OF notes, created_at, mother_id ON followups",
+            [_bump_sql('referrals', 'OLD.created_at', old_loc, None, -1)], when=old_referral)
+    trigger("trg_rollup_referrals_upd_new", "UPDATE OF notes, created_at, mother_id ON followups",
+            [_bump_sql('referrals', 'NEW.created_at', new_loc, None, 1)], when=new_referral)
+
+def rebuild_rollups(conn=None):
+    """Recompute every rollup counter from the base tables (backfill / repair)."""
+    def run(conn):
+        conn.execute("DELETE FROM rollups")
+        conn.execute("""INSERT INTO rollups (metric, day, location, risk, n)
+            SELECT 'mothers', COALESCE(substr(created_at, 1, 10), ''), COALESCE(location, ''), COALESCE(risk, ''), COUNT(*)
+            FROM mothers GROUP BY 2, 3, 4""")
+        loc = _MOTHER_LOCATION_SQL.format(row='t')
+        for metric, table, day, where in _MOTHER_EVENT_METRICS:
+            conn.execute(f"""INSERT INTO rollups (metric, day, location, risk, n)
+                SELECT '{metric}', COALESCE(substr({day}, 1, 10), ''), {loc}, '', COUNT(*)
+                FROM {table} t WHERE {where} GROUP BY 2, 3""")
+
+    if conn is not None:
+        run(conn)
+    else:
+        with transaction(invalidates=_ROLLUP_TABLES) as conn:
+            run(conn)
+
+@cached(*_ROLLUP_TABLES)
+def get_dashboard_summary(location=None, days=30):
+    """Dashboard figures from the rollups; cost depends on days x locations, not registry size."""
+    today = datetime.utcnow().date()
+    since = (today - timedelta(days=days - 1)).isoformat()
+    loc_sql, loc_params = ("AND location = ?", [location]) if location else ("", [])
+    conn = get_conn()
+
+    risk = count_mothers_by_risk(location)
+    overdue = conn.execute(
+        f"SELECT COALESCE(SUM(n), 0) FROM rollups WHERE metric = 'followups_open' AND day != '' AND day < ? {loc_sql}",
+        [today.isoformat()] + loc_params).fetchone()[0]
+    daily = {}
+    for r in conn.execute(
+            f"SELECT day, metric, SUM(n) AS n FROM rollups "
+            f"WHERE metric IN ('mothers', 'anc_visits', 'referrals') AND day >= ? AND day <= ? {loc_sql} "
+            f"GROUP BY day, metric", [since, today.isoformat()] + loc_params):
+        daily.setdefault(r['day'], {'registrations': 0, 'anc_visits': 0, 'referrals': 0})
+        daily[r['day']]['registrations' if r['metric'] == 'mothers' else r['metric']] = r['n']
+
+    return {
+        'total_mothers': sum(risk.values()),
+        'risk': risk,
+        'overdue_followups': overdue,
+        'daily': [dict(day=day, **counts) for day, counts in sorted(daily.items())],
+    }
+
+@cached(*_ROLLUP_TABLES)
+def get_rollup_locations():
+    rows = get_conn().execute("SELECT DISTINCT location FROM rollups WHERE location != '' ORDER BY location")
+    return [r['location'] for r in rows]
+
+# ------------------ Full-text search ------------------ #
+# FTS5 indexes over the free-text columns, stored as external-content tables
+# (the text lives only in the base table) and kept in sync by triggers. The
+# update triggers list their columns, so risk re-scores never touch the index.
+
+FTS_TABLES = {
+    'mothers': ('mother_id', 'name', 'phone', 'location', 'notes'),
+    'anc_visits': ('symptoms', 'notes'),
+    'chat_logs': ('user_input', 'assistant_response'),
+}
+
+# bm25 column weights: a hit on a name or ID outranks one buried in notes
+_FTS_WEIGHTS = {
+    'mothers': (10.0, 8.0, 5.0, 2.0, 1.0),
+    'anc_visits': (2.0, 1.0),
+    'chat_logs': (1.0, 0.2),
+}
+
+SEARCH_KINDS = {'mothers': 'mother', 'anc_visits': 'anc_visit', 'chat_logs': 'chat'}
+
+SEARCH_CANDIDATES = 2000
+
+def fts_available(conn=None):
+    conn = conn or get_conn()
+    return any(r[0] == 'ENABLE_FTS5' for r in conn.execute("PRAGMA compile_options"))
+
+def _has_fts(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'mothers_fts'").fetchone() is not None
+
+def _create_fts(conn, table, columns):
+    fts = f"{table}_fts"
+    cols, new_cols, old_cols = ", ".join(columns), ", ".join(f"new.{c}" for c in columns), ", ".join(f"old.{c}" for c in columns)
+    # prefix indexes make search-as-you-type prefix queries cheap
+    conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{table}', "
+                 f"content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+    delete = f"INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols});"
+    insert = f"INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {new_cols});"
+    for name, event, body in (
+            (f"trg_{fts}_ins", f"INSERT ON {table}", insert),
+            (f"trg_{fts}_del", f"DELETE ON {table}", delete),
+            (f"trg_{fts}_upd", f"UPDATE OF {cols} ON {table}", delete + " " + insert)):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.execute(f"CREATE TRIGGER {name} AFTER {event} BEGIN {body} END")
+    conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+def fts_query(text):
+    """Turn free user input into a safe FTS5 query: every word must match, as a prefix."""
+    words = "".join(c if c.isalnum() else " " for c in (text or "")).split()
+    return " ".join(f'"{w}"*' for w in words)
+
+@cached(*FTS_TABLES)
+def search_records(text, limit=20, kinds=None):
+    """Ranked full-text hits across mothers, ANC visit notes and chat logs.
+
+    Returns dicts with kind, record id, mother_id, name, a highlighted
+    snippet and rank (lower is better), best first. A broad query only
+    ranks its newest SEARCH_CANDIDATES matches per table, which keeps a
+    one-word search on a large registry in the tens of milliseconds.
+    """
+    query = fts_query(text)
+    kinds = kinds or list(FTS_TABLES)
+    if not query:
+        return []
+    conn = get_conn()
+    if not _has_fts(conn):
+        if 'mothers' not in kinds:
+            return []
+        rows, _ = query_mothers(search=text, limit=limit, columns=('id', 'mother_id', 'name', 'notes'))
+        return [{'kind': 'mother', 'id': r['id'], 'mother_id': r['mother_id'], 'name': r['name'],
+                 'snippet': r['notes'] or '', 'rank': 0.0} for r in rows]
+    hits = []
+    for table in kinds:
+        fts = f"{table}_fts"
+        weights = ", ".join(map(str, _FTS_WEIGHTS[table]))
+        # newest matches straight off the index (rowid order needs no sort), ranked here
+        rows = conn.execute(
+            f"SELECT rowid AS id, snippet({fts}, -1, '**', '**', '…', 10) AS snippet, "
+            f"bm25({fts}, {weights}) AS rank FROM {fts} WHERE {fts} MATCH ? ORDER BY rowid DESC LIMIT ?",
+            (query, SEARCH_CANDIDATES)).fetchall()
+        hits += [dict(r, kind=SEARCH_KINDS[table], table=table) for r in sorted(rows, key=lambda r: r['rank'])[:limit]]
+    hits.sort(key=lambda h: h['rank'])
+    hits = hits[:limit]
+    for table in kinds:
+        ids = [h['id'] for h in hits if h['table'] == table]
+        if not ids:
+            continue
+        name_sql, join_sql = ("t.name", "") if table == 'mothers' else \
+            ("m.name", "LEFT JOIN mothers m ON m.mother_id = t.mother_id")
+        owners = {r['id']: r for r in conn.execute(
+            f"SELECT t.id, t.mother_id, {name_sql} AS name FROM {table} t {join_sql} "
+            f"WHERE t.id IN ({', '.join('?' * len(ids))})", ids)}
+        for h in hits:
+            if h['table'] == table:
+                h.update(mother_id=owners[h['id']]['mother_id'], name=owners[h['id']]['name'])
+    for h in hits:
+        del h['table']
+    return hits
+
+
+# ------------------ Change tracking ------------------ #
+# Every insert, update and delete on a synced table leaves one row in
+# sync_log, keyed by the row's global key (mother_id, or a random uid for
+# the other tables) and stamped with when and on which device it changed.
+# A row changed twice keeps only its latest entry, so the log - and every
+# delta read from it - grows with the number of changed rows, not with
+# how often they change or how big the database is. sync.py builds the
+# changesets; risk columns are derived locally and never tracked.
+
+# synced table -> global key column
+SYNC_TABLES = {
+    'mothers': 'mother_id',
+    'children': 'uid',
+    'anc_visits': 'uid',
+    'followups': 'uid',
+    'chat_logs': 'uid',
+}
+
+SYNC_LOCAL_COLUMNS = {'id', 'risk', 'risk_score', 'risk_reason_mask', 'risk_version'}
+
+_SYNC_NOW = "strftime('%Y-%m-%dT%H:%M:%f', 'now')"
+_SYNC_DEVICE = "(SELECT value FROM sync_meta WHERE key = 'device_id')"
+
+def sync_columns(conn, table):
+    return [c for c in _column_names(conn, table) if c not in SYNC_LOCAL_COLUMNS]
+
+def _create_sync_triggers(conn, table, key):
+    # column lists are fixed at creation: re-run after adding a synced column
+    # delete-then-insert rather than OR REPLACE: an outer statement's conflict
+    # clause (e.g. an upsert applying a changeset) overrides the trigger's
+    log = (f"DELETE FROM sync_log WHERE tbl = '{table}' AND row_key = {{row}}.{key}; "
+           f"INSERT INTO sync_log (tbl, row_key, deleted, changed_at, origin) "
+           f"VALUES ('{table}', {{row}}.{key}, {{deleted}}, {_SYNC_NOW}, {_SYNC_DEVICE});")
+    columns = [c for c in sync_columns(conn, table) if c != 'uid']
+    inserted = log.format(row='NEW', deleted=0)
+    if key == 'uid':
+        # rows made here get a fresh uid; rows applied from a peer bring theirs
+        uid = f"(SELECT uid FROM {table} WHERE id = NEW.id)"
+        inserted = (f"UPDATE {table} SET uid = lower(hex(randomblob(16))) WHERE id = NEW.id AND uid IS NULL; "
+                    f"DELETE FROM sync_log WHERE tbl = '{table}' AND row_key = {uid}; "
+                    f"INSERT INTO sync_log (tbl, row_key, deleted, changed_at, origin) "
+                    f"VALUES ('{table}', {uid}, 0, {_SYNC_NOW}, {_SYNC_DEVICE});")
+    for name, event, row, body in (
+            (f"trg_sync_{table}_ins", f"INSERT ON {table}", 'NEW', inserted),
+            (f"trg_sync_{table}_upd", f"UPDATE OF {', '.join(columns)} ON {table}", 'NEW', log.format(row='NEW', deleted=0)),
+            (f"trg_sync_{table}_del", f"DELETE ON {table}", 'OLD', log.format(row='OLD', deleted=1))):
+        # a mother saved without an ID has no global key, so she stays local
+        when = f"WHEN {row}.{key} IS NOT NULL " if key != 'uid' else ""
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.execute(f"CREATE TRIGGER {name} AFTER {event} {when}BEGIN {body} END")
+
+def device_id(path=None):
+    return get_conn(path).execute("SELECT value FROM sync_meta WHERE key = 'device_id'").fetchone()[0]
+
+# ------------------ Command line ------------------ #
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Afyamama database maintenance")
+    parser.add_argument("command", choices=["migrate", "rescore", "rebuild-rollups", "rebuild-trends", "schedule-anc"])
+    args = parser.parse_args()
+    with transaction() as conn:
+        migrate(conn)
+    if args.command == "rescore":
+        print(f"re-scored {rescore_stale()} mothers")
+    elif args.command == "rebuild-rollups":
+        rebuild_rollups()
+        print("rollups rebuilt")
+    elif args.command == "rebuild-trends":
+        rebuild_trends()
+        # scores were computed from the old trend state
+        with transaction(invalidates=('mothers',)) as conn:
+            conn.execute("UPDATE mothers SET risk_version = NULL")
+        print(f"trends rebuilt, re-scored {rescore_stale()} mothers")
+    elif args.command == "schedule-anc":
+        print(f"scheduled {schedule_anc_followups()} ANC contacts")
+    print(f"schema version {schema_version()}")
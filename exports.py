@@ -0,0 +1,191 @@
+# Streaming exports of the registry tables to CSV or Parquet.
+# Rows are read from SQLite in fixed-size chunks and written straight out, so
+# memory stays bounded by the chunk size however many rows are exported.
+import csv
+import io
+import tempfile
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import db
+
+CHUNK_SIZE = 5000
+
+# table -> column the date filter applies to
+EXPORT_TABLES = {
+    'mothers': 'created_at',
+    'children': 'dob',
+    'anc_visits': 'visit_date',
+    'followups': 'due_date',
+}
+
+FORMATS = ['csv', 'parquet']
+
+_ARROW_TYPES = {'INTEGER': 'int64', 'REAL': 'float64', 'TEXT': 'string'}
+
+def _day(value):
+    return value.isoformat() if isinstance(value, date) else str(value)[:10]
+
+def _query(table, since=None, until=None, location=None):
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Unknown export table: {table}")
+    date_col = EXPORT_TABLES[table]
+    clauses, params = [], []
+    if since:
+        clauses.append(f"{date_col} >= ?")
+        params.append(_day(since))
+    if until:
+        # dates are ISO strings, some with a time part: compare against the next day
+        clauses.append(f"{date_col} < ?")
+        params.append((date.fromisoformat(_day(until)) + timedelta(days=1)).isoformat())
+    if location:
+        if table == 'mothers':
+            clauses.append("location = ?")
+        else:
+            clauses.append("mother_id IN (SELECT mother_id FROM mothers WHERE location = ?)")
+        params.append(location)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return f"SELECT * FROM {table} {where} ORDER BY id", params
+
+def iter_chunks(table, since=None, until=None, location=None, chunk_size=CHUNK_SIZE, path=None):
+    """Yield (columns, rows) chunks of at most chunk_size rows, from `path` (default: db.py's database).
+
+    The whole export reads from one snapshot (WAL), so concurrent writes
+    never produce a torn file.
+    """
+    sql, params = _query(table, since, until, location)
+    cur = db.get_conn(path).cursor()
+    try:
+        cur.execute(sql, params)
+        columns = [d[0] for d in cur.description]
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield columns, [tuple(r) for r in rows]
+    finally:
+        cur.close()
+
+def count_rows(table, since=None, until=None, location=None, path=None):
+    """Rows the export with these filters would write, from `path` (default: db.py's database).
+
+    Cached: the Reports page shows it on every rerun.
+    """
+    with db.using(path or db.current_path()):
+        return _count_rows(table, since, until, location)
+
+@db.cached(*EXPORT_TABLES)
+def _count_rows(table, since, until, location):
+    sql, params = _query(table, since, until, location)
+    return db.get_conn().execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+
+def iter_csv(table, chunk_size=CHUNK_SIZE, **filters):
+    """Yield the export as UTF-8 CSV byte strings, one per chunk."""
+    yield from _csv_bytes(table, iter_chunks(table, chunk_size=chunk_size, **filters), filters.get('path'))
+
+def _csv_bytes(table, chunks, path=None):
+    header = None
+    for columns, rows in chunks:
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        if header is None:
+            header = columns
+            writer.writerow(columns)
+        writer.writerows(rows)
+        yield buf.getvalue().encode()
+    if header is None:
+        # an empty export still gets its header row
+        buf = io.StringIO()
+        csv.writer(buf).writerow(_column_types(table, path))
+        yield buf.getvalue().encode()
+
+def _column_types(table, path=None):
+    return {r['name']: (r['type'] or 'TEXT').upper() for r in db.get_conn(path).execute(f"PRAGMA table_info({table})")}
+
+def _arrow_types(table, since=None, until=None, location=None, path=None):
+    # SQLite does not enforce declared types (an INTEGER column can hold 24.5
+    # or 'unknown'), so each column's Arrow type follows what the exported
+    # rows actually hold; the declared type only decides for all-NULL columns
+    declared = _column_types(table, path)
+    sql, params = _query(table, since, until, location)
+    held = db.get_conn(path).execute(
+        f"SELECT {', '.join(f'group_concat(DISTINCT typeof({name}))' for name in declared)} FROM ({sql})",
+        params).fetchone()
+    types = {}
+    for (name, declared_type), kinds in zip(declared.items(), held):
+        kinds = set((kinds or '').split(',')) - {'', 'null'}
+        if not kinds:
+            types[name] = _ARROW_TYPES.get(declared_type, 'string')
+        elif kinds == {'integer'}:
+            types[name] = 'int64'
+        elif kinds <= {'integer', 'real'}:
+            types[name] = 'float64'
+        elif kinds == {'blob'}:
+            types[name] = 'binary'
+        else:
+            types[name] = 'string'  # mixed: numbers are written as text
+    return types
+
+@contextmanager
+def _read_snapshot(path=None):
+    # hold one read transaction, so separate queries see the same data; inside
+    # a caller's transaction that one already does
+    conn = db.get_conn(path)
+    if conn.in_transaction:
+        yield
+        return
+    conn.execute("BEGIN")
+    try:
+        yield
+    finally:
+        conn.commit()  # read-only: nothing to keep or undo
+
+def _write_parquet(table, fileobj, chunk_size, filters):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)") from None
+    rows_written = 0
+    # the schema pass and the rows it describes come from the same snapshot
+    with _read_snapshot(filters.get('path')):
+        types = _arrow_types(table, **filters)
+        schema = pa.schema(list(types.items()))
+        with pq.ParquetWriter(fileobj, schema) as writer:
+            for columns, rows in iter_chunks(table, chunk_size=chunk_size, **filters):
+                # one row group per chunk
+                arrays = []
+                for i, name in enumerate(columns):
+                    values = [r[i] for r in rows]
+                    if types[name] == 'string':
+                        values = [v if v is None or isinstance(v, str) else str(v) for v in values]
+                    arrays.append(pa.array(values, type=schema.field(name).type))
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+                rows_written += len(rows)
+    return rows_written
+
+def write_export(table, fileobj, fmt='csv', chunk_size=CHUNK_SIZE, **filters):
+    """Stream an export into a binary file object; returns the number of data rows."""
+    if fmt == 'parquet':
+        return _write_parquet(table, fileobj, chunk_size, filters)
+    if fmt != 'csv':
+        raise ValueError(f"Unknown export format: {fmt}")
+    rows_written = 0
+
+    def counted(chunks):
+        nonlocal rows_written
+        for columns, rows in chunks:
+            rows_written += len(rows)
+            yield columns, rows
+
+    for data in _csv_bytes(table, counted(iter_chunks(table, chunk_size=chunk_size, **filters)), filters.get('path')):
+        fileobj.write(data)
+    return rows_written
+
+def export_tempfile(table, fmt='csv', chunk_size=CHUNK_SIZE, **filters):
+    """Write an export to a spooled temp file and return it rewound, ready to read."""
+    # spills to disk past 8 MB, so a national export never sits in RAM
+    tmp = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    write_export(table, tmp, fmt, chunk_size, **filters)
+    tmp.seek(0)
+    return tmp
@@ -0,0 +1,280 @@
+# Bulk import of mothers, children and ANC visits from CSV or JSONL
+# (paper register transcriptions, CHV tablet dumps).
+# Rows are validated and normalized one by one; bad rows are reported with
+# their line number and skipped, the rest go in with executemany() in large
+# transactions. Mothers are upserted on mother_id.
+import csv
+import json
+import sqlite3
+import time
+import uuid
+from datetime import date, datetime
+from pathlib import Path
+
+import db
+import risk_model
+
+BATCH_SIZE = 5000
+
+# field -> (type, min, max, required); ranges match the app's input widgets
+SCHEMAS = {
+    'mothers': {
+        'mother_id': (str, None, None, False),
+        'name': (str, None, None, True),
+        'age': (int, 10, 60, False),
+        'phone': (str, None, None, False),
+        'location': (str, None, None, False),
+        'gestational_age_weeks': (int, 0, 45, False),
+        'parity': (int, 0, 20, False),
+        'bp_systolic': (int, 0, 250, False),
+        'bp_diastolic': (int, 0, 200, False),
+        'hb': (float, 0, 30, False),
+        'bmi': (float, 0, 60, False),
+        'notes': (str, None, None, False),
+        'status': (str, None, None, False),
+    },
+    'children': {
+        'mother_id': (str, None, None, True),
+        'child_name': (str, None, None, False),
+        'dob': (date, None, None, False),
+        'birth_weight': (float, 0, 8, False),
+        'delivery_type': (str, None, None, False),
+        'notes': (str, None, None, False),
+    },
+    'anc_visits': {
+        'mother_id': (str, None, None, True),
+        'visit_date': (date, None, None, True),
+        'bp_systolic': (int, 0, 250, False),
+        'bp_diastolic': (int, 0, 200, False),
+        'hb': (float, 0, 30, False),
+        'weight': (float, 20, 250, False),
+        'urine_protein': (str, None, None, False),
+        'fetal_hr': (float, 60, 240, False),
+        'fundal_height': (float, 0, 60, False),
+        'symptoms': (str, None, None, False),
+        'notes': (str, None, None, False),
+    },
+}
+
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y')
+
+# ------------------ Reading ------------------ #
+
+def read_rows(path, fmt=None):
+    """Yield (line_number, dict) from a CSV or JSONL file, streaming."""
+    path = Path(path)
+    fmt = fmt or ('jsonl' if path.suffix.lower() in ('.jsonl', '.ndjson', '.json') else 'csv')
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if fmt == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        elif fmt == 'jsonl':
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_no, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_no, ValueError(f"invalid JSON: {e.msg}")
+        else:
+            raise ValueError(f"Unknown import format: {fmt}")
+
+# ------------------ Validation ------------------ #
+
+def _parse_date(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date().isoformat()
+        except ValueError:
+            pass
+    raise ValueError(f"unrecognised date {value!r}")
+
+def new_mother_id():
+    return "AFY-" + uuid.uuid4().hex[:8].upper()
+
+def normalize_row(kind, raw):
+    """Return a clean dict for `kind`, or raise ValueError describing the first problem."""
+    if not isinstance(raw, dict):
+        raise ValueError("row is not an object")
+    clean = {}
+    for field, (typ, lo, hi, required) in SCHEMAS[kind].items():
+        value = raw.get(field)
+        if isinstance(value, str):
+            value = value.strip()
+        if value in (None, ''):
+            if required:
+                raise ValueError(f"{field} is required")
+            clean[field] = None
+            continue
+        try:
+            if typ is date:
+                value = _parse_date(str(value))
+            elif typ is int:
+                as_float = float(value)
+                if as_float != int(as_float):
+                    raise ValueError
+                value = int(as_float)
+            elif typ is float:
+                value = float(value)
+            else:
+                value = str(value)
+        except ValueError:
+            raise ValueError(f"{field}: invalid {typ.__name__} {raw.get(field)!r}") from None
+        if lo is not None and not lo <= value <= hi:
+            raise ValueError(f"{field}: {value} outside {lo}-{hi}")
+        clean[field] = value
+    if kind == 'mothers':
+        clean['mother_id'] = clean['mother_id'] or new_mother_id()
+        clean['status'] = clean['status'] or 'active'
+    if kind == 'anc_visits' and clean['urine_protein'] not in (None, *db.URINE_PROTEIN_LEVELS):
+        raise ValueError(f"urine_protein: expected one of {db.URINE_PROTEIN_LEVELS}")
+    return clean
+
+# ------------------ Writing ------------------ #
+
+_RISK_FIELDS = ['risk', 'risk_score', 'risk_reason_mask', 'risk_version']
+
+def _insert_sql(kind):
+    fields = list(SCHEMAS[kind])
+    if kind == 'mothers':
+        fields += _RISK_FIELDS
+    fields.append('created_at')
+    sql = f"INSERT INTO {kind} ({', '.join(fields)}) VALUES ({', '.join('?' * len(fields))})"
+    if kind == 'mothers':
+        # upsert: keep the original created_at; an existing mother may have ANC
+        # visits that change her score, so leave it stale for rescore_stale()
+        updates = ', '.join(f"{f}=excluded.{f}" for f in fields[1:-2])
+        sql += f" ON CONFLICT(mother_id) DO UPDATE SET {updates}, risk_version=NULL"
+    return sql, fields
+
+def _score_batch(rows):
+    # new mothers are scored here, in one vectorized pass, so each row is written once
+    scored = risk_model.score_batch(
+        {f: [row[f] for row in rows] for f in ('age', 'bp_systolic', 'bp_diastolic', 'hb', 'bmi', 'parity', 'notes')})
+    return [[risk, int(score), int(mask), scored['version']]
+            for risk, score, mask in zip(scored['risk'], scored['score'], scored['reason_mask'])]
+
+def _existing_mother_ids(conn, ids):
+    found = set()
+    ids = list(set(ids))
+    for i in range(0, len(ids), 500):  # stay under SQLite's bound-parameter limit
+        chunk = ids[i:i + 500]
+        found.update(r[0] for r in conn.execute(
+            f"SELECT mother_id FROM mothers WHERE mother_id IN ({', '.join('?' * len(chunk))})", chunk))
+    return found
+
+def _write_batch(conn, kind, batch, report, row_by_row=False):
+    sql, fields = _insert_sql(kind)
+    now = datetime.utcnow().isoformat()
+    ids = [row['mother_id'] for _, row in batch]
+    known = _existing_mother_ids(conn, ids)
+    if kind != 'mothers':
+        for line_no, row in batch:
+            if row['mother_id'] not in known:
+                report['errors'].append((line_no, f"unknown mother_id {row['mother_id']!r}"))
+        batch = [(line_no, row) for line_no, row in batch if row['mother_id'] in known]
+    columns = list(SCHEMAS[kind])
+    params = [(line_no, [row[f] for f in columns]) for line_no, row in batch]
+    if kind == 'mothers' and params:
+        for (_, p), risk in zip(params, _score_batch([row for _, row in batch])):
+            p += risk
+    for _, p in params:
+        p.append(now)
+
+    if not row_by_row:
+        # no SAVEPOINT here: an open savepoint makes every trigger-heavy
+        # insert slower as the database grows; on error the caller rolls
+        # the whole batch back and retries it with row_by_row=True
+        conn.executemany(sql, [p for _, p in params])
+        written = params
+    else:
+        # something in the batch is bad: write it row by row so only that row is lost
+        written = []
+        for line_no, p in params:
+            conn.execute("SAVEPOINT import_row")
+            try:
+                conn.execute(sql, p)
+                written.append((line_no, p))
+            except sqlite3.Error as e:
+                conn.execute("ROLLBACK TO import_row")
+                report['errors'].append((line_no, str(e)))
+            conn.execute("RELEASE import_row")
+
+    if kind == 'mothers':
+        for _, p in written:
+            # an id repeated within the file is an update the second time round
+            report['updated' if p[0] in known else 'inserted'] += 1
+            known.add(p[0])
+        # joins this batch's transaction
+        db.schedule_anc_followups([p[0] for _, p in written])
+    else:
+        report['inserted'] += len(written)
+        # new visits change the latest vitals: let rescore_stale() pick these mothers up
+        conn.executemany("UPDATE mothers SET risk_version=NULL WHERE mother_id=?",
+                         [(m,) for m in {p[0] for _, p in written}])
+
+def import_rows(kind, rows, batch_size=BATCH_SIZE):
+    """Validate and insert an iterable of (line_number, raw_dict) rows.
+
+    Returns a report dict: rows, inserted, updated, errors [(line, message)],
+    seconds. Stored risk scores are refreshed once at the end, in bulk.
+    """
+    if kind not in SCHEMAS:
+        raise ValueError(f"Unknown import kind: {kind}")
+    report = {'kind': kind, 'rows': 0, 'inserted': 0, 'updated': 0, 'errors': [], 'seconds': 0.0}
+    t0 = time.perf_counter()
+    batch = []
+
+    def flush():
+        # an ANC batch also marks its mothers' scores stale
+        errors = len(report['errors'])
+        try:
+            with db.transaction(invalidates=(kind, 'mothers', 'followups')) as conn:
+                _write_batch(conn, kind, batch, report)
+        except sqlite3.Error:
+            del report['errors'][errors:]  # rolled back: the retry reports them again
+            with db.transaction(invalidates=(kind, 'mothers', 'followups')) as conn:
+                _write_batch(conn, kind, batch, report, row_by_row=True)
+        batch.clear()
+
+    for line_no, raw in rows:
+        report['rows'] += 1
+        try:
+            if isinstance(raw, Exception):
+                raise raw
+            batch.append((line_no, normalize_row(kind, raw)))
+        except ValueError as e:
+            report['errors'].append((line_no, str(e)))
+            continue
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    if kind in ('mothers', 'anc_visits'):
+        db.rescore_stale()
+    report['errors'].sort(key=lambda e: e[0])
+    report['seconds'] = time.perf_counter() - t0
+    return report
+
+def import_file(kind, path, fmt=None, batch_size=BATCH_SIZE):
+    return import_rows(kind, read_rows(path, fmt), batch_size)
+
+# ------------------ Command line ------------------ #
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Bulk import into the Afyamama database")
+    parser.add_argument("kind", choices=list(SCHEMAS))
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "jsonl"])
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+    db.init_db()
+    report = import_file(args.kind, args.path, args.format, args.batch_size)
+    print(f"{report['rows']} rows: {report['inserted']} inserted, {report['updated']} updated, "
+          f"{len(report['errors'])} errors in {report['seconds']:.2f}s")
+    for line_no, message in report['errors'][:50]:
+        print(f"  line {line_no}: {message}")
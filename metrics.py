@@ -0,0 +1,219 @@
+# In-process instrumentation: latency and size histograms, counters, a
+# slow-query log and an error log, exported as Prometheus text.
+#
+# db.py times every statement on its pooled connections, each cache-missing
+# read function and each transaction; app.py times page runs, the backend
+# times requests, risk_model times scoring batches. Recording is a bucket
+# lookup and three additions under a lock, so it stays on in production
+# (AFYAMAMA_METRICS=0 turns it off). Slow statements (AFYAMAMA_SLOW_QUERY_MS,
+# default 100) are kept with their EXPLAIN QUERY PLAN and, if
+# AFYAMAMA_SLOW_LOG is set, appended to that file as JSON lines.
+# AFYAMAMA_METRICS_FILE names a Prometheus textfile to refresh (e.g. for
+# node_exporter's textfile collector); the backend also serves GET /metrics.
+import bisect
+import json
+import os
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+
+ENABLED = os.environ.get('AFYAMAMA_METRICS', '1') != '0'
+SLOW_QUERY_SECONDS = float(os.environ.get('AFYAMAMA_SLOW_QUERY_MS', 100)) / 1000
+SLOW_LOG_PATH = os.environ.get('AFYAMAMA_SLOW_LOG')
+TEXTFILE_PATH = os.environ.get('AFYAMAMA_METRICS_FILE')
+TEXTFILE_INTERVAL_SECONDS = 15
+
+PREFIX = 'afyamama_'
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'db_query_seconds': ('histogram', "SQLite statement time, execute() through the last fetch, by statement", LATENCY_BUCKETS),
+    'db_call_seconds': ('histogram', "db.py read function time on a cache miss", LATENCY_BUCKETS),
+    'db_call_rows': ('histogram', "Rows returned by db.py read functions on a cache miss", ROW_BUCKETS),
+    'db_transaction_seconds': ('histogram', "Write transaction time, BEGIN IMMEDIATE to COMMIT/ROLLBACK",
+                               LATENCY_BUCKETS),
+    'page_render_seconds': ('histogram', "Streamlit page script run time", LATENCY_BUCKETS),
+    'http_request_seconds': ('histogram', "Backend request time by route", LATENCY_BUCKETS),
+    'risk_batch_seconds': ('histogram', "Risk scoring time per batch, by scorer", LATENCY_BUCKETS),
+    'write_queue_batch_rows': ('histogram', "Writes committed per write-behind batch", ROW_BUCKETS),
+    'write_queue_latency_seconds': ('histogram', "Write-behind time from queueing a write to its commit",
+                                    LATENCY_BUCKETS),
+    'slow_queries_total': ('counter', "Statements slower than the slow-query threshold", None),
+    'errors_total': ('counter', "Errors caught and handled, by where they happened", None),
+}
+
+SLOW_QUERIES = deque(maxlen=100)
+ERRORS = deque(maxlen=100)
+
+_series = {}  # (name, labels) -> [bucket counts, sum, count] for histograms, [value] for counters
+_lock = threading.Lock()
+_collectors = []
+_textfile_written = 0.0
+
+# ------------------ Recording ------------------ #
+
+def observe(name, value, **labels):
+    """Add one observation to histogram `name`."""
+    if not ENABLED:
+        return
+    buckets = METRICS[name][2]
+    i = bisect.bisect_left(buckets, value)  # le semantics: value <= bucket bound
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        series = _series.get(key)
+        if series is None:
+            series = _series[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+        series[0][i] += 1
+        series[1] += value
+        series[2] += 1
+
+def inc(name, amount=1, **labels):
+    if not ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        series = _series.setdefault(key, [0])
+        series[0] += amount
+
+@contextmanager
+def timed(name, **labels):
+    """Observe the time the block takes, whether or not it raises."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - t0, **labels)
+
+def slow_query(sql, seconds, plan=None, params=None):
+    """Log a slow statement; `plan` is its EXPLAIN QUERY PLAN detail lines."""
+    entry = {'at': time.time(), 'ms': round(seconds * 1000, 2), 'sql': ' '.join(sql.split()),
+             'params': repr(params)[:200] if params is not None else None, 'plan': plan}
+    inc('slow_queries_total')
+    with _lock:
+        SLOW_QUERIES.append(entry)
+    if SLOW_LOG_PATH:
+        try:
+            with open(SLOW_LOG_PATH, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+        except OSError:
+            pass  # the log must never break the query that triggered it
+
+def record_error(where, exc):
+    """Count and keep a handled exception, for code that recovers from it."""
+    inc('errors_total', where=where, type=type(exc).__name__)
+    with _lock:
+        ERRORS.append({'at': time.time(), 'where': where, 'type': type(exc).__name__, 'message': str(exc),
+                       'trace': ''.join(traceback.format_exception(type(exc), exc, exc.__traceback__, limit=5))})
+
+def register_collector(fn):
+    """`fn()` returns (name, type, help, labels dict, value) samples computed at export time."""
+    _collectors.append(fn)
+    return fn
+
+def reset():
+    with _lock:
+        _series.clear()
+        SLOW_QUERIES.clear()
+        ERRORS.clear()
+
+# ------------------ Reading ------------------ #
+
+def _is_histogram(name):
+    return METRICS[name][0] == 'histogram'
+
+def _quantile(buckets, counts, total, q):
+    # linear interpolation inside the bucket holding the q-th observation, as Prometheus does
+    rank, seen, lower = q * total, 0, 0.0
+    for bound, count in zip(buckets, counts):
+        if count and seen + count >= rank:
+            return lower + (bound - lower) * (rank - seen) / count
+        seen += count
+        lower = bound
+    return buckets[-1]  # in the +Inf bucket: all we know is "above the last bound"
+
+def summary():
+    """One dict per histogram series: count, sum, mean and estimated p50/p95/p99."""
+    with _lock:
+        items = [(key, [list(s[0]), s[1], s[2]]) for key, s in _series.items() if _is_histogram(key[0])]
+    rows = []
+    for (name, labels), (counts, total, count) in sorted(items):
+        buckets = METRICS[name][2]
+        rows.append({'metric': name, 'labels': dict(labels), 'count': count, 'sum': total,
+                     'mean': total / count if count else 0.0,
+                     **{f"p{int(q * 100)}": _quantile(buckets, counts, count, q) for q in (0.5, 0.95, 0.99)}})
+    return rows
+
+def counters():
+    with _lock:
+        return [{'metric': name, 'labels': dict(labels), 'value': s[0]}
+                for (name, labels), s in sorted(_series.items()) if not _is_histogram(name)]
+
+def slow_queries():
+    with _lock:
+        return list(SLOW_QUERIES)
+
+def errors():
+    with _lock:
+        return list(ERRORS)
+
+# ------------------ Prometheus export ------------------ #
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(pairs):
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}' if pairs else ''
+
+def render_prometheus():
+    """Every metric in the Prometheus text exposition format."""
+    with _lock:
+        items = [(key, [list(s[0]), s[1], s[2]] if _is_histogram(key[0]) else [s[0]]) for key, s in _series.items()]
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        series = sorted((labels, s) for (n, labels), s in items if n == name)
+        if not series:
+            continue
+        lines += [f"# HELP {PREFIX}{name} {help_text}", f"# TYPE {PREFIX}{name} {kind}"]
+        for labels, s in series:
+            if kind == 'counter':
+                lines.append(f"{PREFIX}{name}{_labels(labels)} {s[0]}")
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + (float('inf'),), s[0]):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                lines.append(f"{PREFIX}{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {s[1]!r}")
+            lines.append(f"{PREFIX}{name}_count{_labels(labels)} {s[2]}")
+    samples = [sample for collect in _collectors for sample in collect()]
+    described = set()
+    for name, kind, help_text, labels, value in sorted(samples, key=lambda sample: sample[0]):
+        if name not in described:  # each family's samples together, under one HELP/TYPE
+            lines += [f"# HELP {PREFIX}{name} {help_text}", f"# TYPE {PREFIX}{name} {kind}"]
+            described.add(name)
+        lines.append(f"{PREFIX}{name}{_labels(tuple(sorted(labels.items())))} {value}")
+    return '\n'.join(lines) + '\n'
+
+def write_textfile(path=None):
+    """Write render_prometheus() to `path` (default TEXTFILE_PATH) atomically."""
+    path = path or TEXTFILE_PATH
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(render_prometheus())
+    os.replace(tmp, path)
+    return path
+
+def write_textfile_if_due():
+    """write_textfile() at most every TEXTFILE_INTERVAL_SECONDS, if TEXTFILE_PATH is set."""
+    global _textfile_written
+    if not TEXTFILE_PATH or time.monotonic() - _textfile_written < TEXTFILE_INTERVAL_SECONDS:
+        return
+    _textfile_written = time.monotonic()
+    try:
+        write_textfile()
+    except OSError as e:
+        record_error('metrics_textfile', e)
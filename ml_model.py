@@ -0,0 +1,222 @@
+# Trained risk model: L2-regularised logistic regression in plain NumPy.
+#
+#   python ml_model.py train               # fit on the outcomes in the db, write risk_model.MODEL_PATH
+#   python ml_model.py train --out other.npz --l2 0.5
+#   python ml_model.py info                # what the active model file holds
+#
+# Fitted offline on mothers with a recorded pregnancy outcome
+# (db.record_outcome), from the same inputs the rules see: registration
+# vitals overridden by the latest ANC visit, her trend state, and the rules'
+# own score and reason flags as features. The fitted weights, the
+# standardisation and the probability cut-offs for the three risk
+# categories go in one compressed .npz of a few KB. risk_model loads it
+# lazily as the active scorer; scores are the outcome probability in
+# percent, and reasons still come from the rules.
+import hashlib
+import json
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+import risk_model
+
+NUMERIC_FEATURES = ('age', 'bp_systolic', 'bp_diastolic', 'hb', 'bmi', 'parity',
+                    'visits', 'sbp_slope', 'hb_slope', 'sbp_change', 'hb_change', 'weight_gain_per_week')
+
+# outcome probability at or above which a mother is Moderate / High Risk
+MODERATE_PROBABILITY = 0.2
+HIGH_PROBABILITY = 0.5
+
+MIN_TRAINING_ROWS = 200
+
+FORMAT_VERSION = 1
+
+# ------------------ Features ------------------ #
+
+def feature_names():
+    return NUMERIC_FEATURES + ('rule_score',) + tuple(f"rule:{reason}" for reason in risk_model.REASONS)
+
+def feature_matrix(columns, names, rules=None):
+    """(rows x features) float matrix for `names`; NaN where unknown.
+
+    `rules` is predict_risk_batch(columns), if the caller already has it.
+    """
+    rules = risk_model.predict_risk_batch(columns) if rules is None else rules
+    n = len(rules['score'])
+    X = np.empty((n, len(names)))
+    for j, name in enumerate(names):
+        if name == 'rule_score':
+            X[:, j] = rules['score']
+        elif name.startswith('rule:'):
+            reason = name[len('rule:'):]
+            if reason not in risk_model.REASONS:
+                raise ValueError(f"Model uses a rule that no longer exists: {reason}")
+            X[:, j] = rules['reason_mask'] >> risk_model.REASONS.index(reason) & 1
+        elif name in NUMERIC_FEATURES:
+            X[:, j] = risk_model._column(columns, name, n)
+        else:
+            raise ValueError(f"Unknown model feature: {name}")
+    return X
+
+# ------------------ Model ------------------ #
+
+class LogisticModel:
+    """A fitted model behind risk_model's scorer interface."""
+
+    name = 'logistic'
+
+    def __init__(self, features, mean, scale, weights, bias, thresholds, meta=None):
+        self.features = tuple(features)
+        self.mean = np.asarray(mean, dtype=float)
+        self.scale = np.asarray(scale, dtype=float)
+        self.weights = np.asarray(weights, dtype=float)
+        self.bias = float(bias)
+        self.thresholds = tuple(float(t) for t in thresholds)
+        self.meta = meta or {}
+        digest = hashlib.sha1(repr(self.features).encode())
+        for array in (self.mean, self.scale, self.weights, np.array([self.bias, *self.thresholds])):
+            digest.update(array.tobytes())
+        self.version = 'lr-' + digest.hexdigest()[:12]
+
+    def _probability(self, X):
+        # unknown values sit at the training mean, i.e. contribute nothing
+        Z = np.nan_to_num((X - self.mean) / self.scale, nan=0.0)
+        return 1.0 / (1.0 + np.exp(-(Z @ self.weights + self.bias)))
+
+    def probability(self, columns):
+        return self._probability(feature_matrix(columns, self.features))
+
+    def score_batch(self, columns):
+        rules = risk_model.predict_risk_batch(columns)
+        p = self._probability(feature_matrix(columns, self.features, rules))
+        band = (p >= self.thresholds[0]).astype(np.int64) + (p >= self.thresholds[1])
+        return {
+            'score': np.rint(p * 100).astype(np.int64),
+            'risk': np.array(risk_model.RISK_CATEGORIES, dtype=object)[band],
+            'reason_mask': rules['reason_mask'],
+            'probability': p,
+        }
+
+    def score(self, inputs):
+        scored = self.score_batch({name: [inputs.get(name)] for name in
+                                   risk_model._FIELDS + ['notes', *risk_model.TREND_STATE]})
+        return {
+            'risk': scored['risk'][0],
+            'score': int(scored['score'][0]),
+            'reasons': risk_model.reasons_from_mask(scored['reason_mask'][0]),
+            'probability': float(scored['probability'][0]),
+        }
+
+def save(model, path):
+    path = Path(path)
+    with open(path, 'wb') as f:  # a file object, so numpy doesn't append .npz
+        np.savez_compressed(f, format=np.array(FORMAT_VERSION), features=np.array(model.features),
+                            mean=model.mean, scale=model.scale, weights=model.weights,
+                            bias=np.array(model.bias), thresholds=np.array(model.thresholds),
+                            meta=np.array(json.dumps(model.meta)))
+    return path
+
+def load(path):
+    with np.load(path, allow_pickle=False) as f:
+        if int(f['format']) != FORMAT_VERSION:
+            raise ValueError(f"Unsupported model format: {int(f['format'])}")
+        model = LogisticModel([str(name) for name in f['features']], f['mean'], f['scale'], f['weights'],
+                              float(f['bias']), f['thresholds'], json.loads(str(f['meta'])))
+    feature_matrix({}, model.features)  # fail now, not per batch, if the rules it uses are gone
+    return model
+
+# ------------------ Training ------------------ #
+
+def _fit_logistic(Z, y, l2, max_iter=50, tol=1e-8):
+    # Newton-Raphson on the penalised log-likelihood; the bias is not penalised
+    Zb = np.hstack([Z, np.ones((len(Z), 1))])
+    w = np.zeros(Zb.shape[1])
+    penalty = np.full(Zb.shape[1], l2)
+    penalty[-1] = 0.0
+    for _ in range(max_iter):
+        p = 1.0 / (1.0 + np.exp(-(Zb @ w)))
+        gradient = Zb.T @ (p - y) + penalty * w
+        hessian = (Zb * (p * (1 - p))[:, None]).T @ Zb + np.diag(penalty + 1e-9)
+        step = np.linalg.solve(hessian, gradient)
+        w -= step
+        if np.abs(step).max() < tol:
+            break
+    return w[:-1], w[-1]
+
+def auc(y, p):
+    """Area under the ROC curve: the chance a random positive outranks a random negative."""
+    y = np.asarray(y, dtype=bool)
+    positives, negatives = y.sum(), (~y).sum()
+    if not positives or not negatives:
+        return float('nan')
+    _, inverse, counts = np.unique(p, return_inverse=True, return_counts=True)
+    # tied scores share their average rank
+    ranks = (np.cumsum(counts) - (counts - 1) / 2.0)[inverse]
+    return float((ranks[y].sum() - positives * (positives + 1) / 2.0) / (positives * negatives))
+
+def train(columns, labels, l2=1.0, thresholds=(MODERATE_PROBABILITY, HIGH_PROBABILITY), holdout=0.2, seed=0):
+    """Fit a LogisticModel on input columns and 0/1 outcome labels.
+
+    A random `holdout` share of rows is kept out of the fit to report AUC for
+    the model and for the rules' score; the saved model is then refitted on
+    every row.
+    """
+    y = np.asarray(labels, dtype=float)
+    if len(y) < MIN_TRAINING_ROWS:
+        raise ValueError(f"Need at least {MIN_TRAINING_ROWS} mothers with outcomes, have {len(y)}")
+    if y.min() == y.max():
+        raise ValueError("Outcomes are all the same; nothing to learn")
+    names = feature_names()
+    rules = risk_model.predict_risk_batch(columns)
+    X = feature_matrix(columns, names, rules)
+
+    def fit(rows):
+        with warnings.catch_warnings():  # a feature nobody in `rows` has: NaN, handled below
+            warnings.simplefilter('ignore', RuntimeWarning)
+            mean = np.nanmean(X[rows], axis=0)
+            scale = np.nanstd(X[rows], axis=0)
+        mean = np.where(np.isnan(mean), 0.0, mean)
+        scale = np.where(np.isnan(scale) | (scale == 0), 1.0, scale)
+        weights, bias = _fit_logistic(np.nan_to_num((X[rows] - mean) / scale, nan=0.0), y[rows], l2)
+        return LogisticModel(names, mean, scale, weights, bias, thresholds)
+
+    t0 = time.perf_counter()
+    test = np.random.default_rng(seed).random(len(y)) < holdout
+    meta = {'rows': int(len(y)), 'positives': int(y.sum()), 'l2': l2}
+    if test.any() and y[test].min() != y[test].max():
+        model = fit(~test)
+        meta.update(holdout_rows=int(test.sum()),
+                    holdout_auc=auc(y[test], model._probability(X[test])),
+                    rules_holdout_auc=auc(y[test], rules['score'][test]))
+    model = fit(np.ones(len(y), dtype=bool))
+    meta.update(trained_at=time.strftime('%Y-%m-%dT%H:%M:%S'), fit_seconds=round(time.perf_counter() - t0, 3))
+    model.meta = meta
+    return model
+
+# ------------------ Command line ------------------ #
+
+if __name__ == "__main__":
+    import argparse
+
+    import db
+    parser = argparse.ArgumentParser(description="Train or inspect the risk model")
+    parser.add_argument("command", choices=["train", "info"])
+    parser.add_argument("--out", default=risk_model.MODEL_PATH, help="model file to write (train)")
+    parser.add_argument("--l2", type=float, default=1.0, help="L2 penalty on standardised weights")
+    parser.add_argument("--moderate", type=float, default=MODERATE_PROBABILITY)
+    parser.add_argument("--high", type=float, default=HIGH_PROBABILITY)
+    args = parser.parse_args()
+    if args.command == "train":
+        db.init_db()
+        columns, labels = db.get_training_data()
+        model = train(columns, labels, args.l2, (args.moderate, args.high))
+        path = save(model, args.out)
+        print(f"{model.version}: {json.dumps(model.meta)}")
+        print(f"wrote {path} ({path.stat().st_size:,} bytes); run `python db.py rescore` to re-score with it")
+    else:
+        model = load(risk_model.MODEL_PATH)
+        print(f"{model.version} from {risk_model.MODEL_PATH}: {json.dumps(model.meta)}")
+        for name, weight in sorted(zip(model.features, model.weights), key=lambda fw: -abs(fw[1])):
+            print(f"  {weight:+8.3f}  {name}")
@@ -1,41 +1,447 @@
 # Simple rule-based risk predictor for maternal risk categories.
-# Replace with an ML model later if you collect labelled data.
+# A model trained on recorded outcomes (ml_model.py) can take over scoring;
+# see "Scorers" below. The rules stay the fallback and explain every score.
+import hashlib
+import os
+import threading
+import time
+import warnings
+from collections import deque
+from pathlib import Path
 
-def predict_risk(age, bp_systolic, bp_diastolic, hb, bmi, parity, notes=''):
+import metrics
+
+# Vital-sign rules, checked in order: (field, comparison, threshold, points, reason).
+# A missing value (None) never triggers a rule.
+RULES = [
+    ('age', '>=', 35, 2, 'Advanced maternal age (>=35)'),
+    ('bp_systolic', '>=', 140, 3, 'High systolic blood pressure (>=140)'),
+    ('bp_diastolic', '>=', 90, 2, 'High diastolic blood pressure (>=90)'),
+    ('hb', '<', 11, 2, 'Low haemoglobin (<11 g/dL)'),
+    ('bmi', '>=', 30, 1, 'High BMI (>=30)'),
+    ('parity', '>=', 5, 1, 'High parity (>=5)'),
+]
+
+# Free-text rules: (substring of lower-cased notes, points, reason).
+NOTE_RULES = [
+    ('bleed', 4, 'Reported bleeding'),
+]
+
+# Visit-history rules, scored from a mother's trend state (see "Trend
+# rules" below): (feature, comparison, threshold, points, reason).
+TREND_RULES = [
+    ('sbp_rise', '>=', 15, 2, 'Systolic BP up >=15 mmHg since last visit'),
+    ('sbp_slope', '>=', 1.5, 1, 'Systolic BP rising across visits (>=1.5 mmHg/week)'),
+    ('high_bp_repeat', '>=', 1, 2, 'High BP at two visits in a row'),
+    ('proteinuria_high_bp', '>=', 1, 4, 'Proteinuria with high BP (possible pre-eclampsia)'),
+    ('hb_drop', '>=', 1, 2, 'Haemoglobin down >=1 g/dL since last visit'),
+    ('hb_slope', '<=', -0.1, 1, 'Haemoglobin falling across visits'),
+    ('weight_gain_per_week', '<', 0, 1, 'Weight loss between visits'),
+]
+
+HIGH_SBP = 140
+HIGH_DBP = 90
+PROTEINURIA_LEVELS = ('+1', '+2', '+3', '+4')
+MIN_VISITS_FOR_SLOPE = 3  # with two visits the slope is just the last change
+
+HIGH_RISK_SCORE = 6
+MODERATE_RISK_SCORE = 3
+
+RISK_CATEGORIES = ['Low Risk', 'Moderate Risk', 'High Risk']
+
+# Stamped on scores stored in the db. Editing any rule or threshold above
+# changes it, which marks every stored score stale for re-scoring.
+RULES_VERSION = hashlib.sha1(
+    repr((RULES, NOTE_RULES, TREND_RULES, HIGH_SBP, HIGH_DBP, PROTEINURIA_LEVELS, MIN_VISITS_FOR_SLOPE,
+          HIGH_RISK_SCORE, MODERATE_RISK_SCORE)).encode()).hexdigest()[:12]
+
+_FIELDS = [rule[0] for rule in RULES]
+
+_COMPARE = {
+    '>=': lambda value, threshold: value >= threshold,
+    '<': lambda value, threshold: value < threshold,
+    '<=': lambda value, threshold: value <= threshold,
+}
+
+def risk_category(score):
+    if score >= HIGH_RISK_SCORE:
+        return 'High Risk'
+    elif score >= MODERATE_RISK_SCORE:
+        return 'Moderate Risk'
+    return 'Low Risk'
+
+def predict_risk(age, bp_systolic, bp_diastolic, hb, bmi, parity, notes='', trend=None):
+    """Score one mother's vitals and notes; `trend` (her TREND_STATE, if she
+    has ANC visits) adds the visit-history rules."""
+    values = {
+        'age': age,
+        'bp_systolic': bp_systolic,
+        'bp_diastolic': bp_diastolic,
+        'hb': hb,
+        'bmi': bmi,
+        'parity': parity,
+    }
     score = 0
     reasons = []
 
-    if age is not None and age >= 35:
-        score += 2
-        reasons.append('Advanced maternal age (>=35)')
-    if bp_systolic is not None and bp_systolic >= 140:
-        score += 3
-        reasons.append('High systolic blood pressure (>=140)')
-    if bp_diastolic is not None and bp_diastolic >= 90:
-        score += 2
-        reasons.append('High diastolic blood pressure (>=90)')
-    if hb is not None and hb < 11:
-        score += 2
-        reasons.append('Low haemoglobin (<11 g/dL)')
-    if bmi is not None and bmi >= 30:
-        score += 1
-        reasons.append('High BMI (>=30)')
-    if parity is not None and parity >= 5:
-        score += 1
-        reasons.append('High parity (>=5)')
-    if 'bleed' in (notes or '').lower():
-        score += 4
-        reasons.append('Reported bleeding')
-
-    if score >= 6:
-        risk = 'High Risk'
-    elif score >= 3:
-        risk = 'Moderate Risk'
-    else:
-        risk = 'Low Risk'
+    for field, op, threshold, points, reason in RULES:
+        value = values[field]
+        if value is not None and _COMPARE[op](value, threshold):
+            score += points
+            reasons.append(reason)
+    text = (notes or '').lower()
+    for keyword, points, reason in NOTE_RULES:
+        if keyword in text:
+            score += points
+            reasons.append(reason)
+    if trend:
+        scored = predict_trend_risk(trend)
+        score += scored['score']
+        reasons += scored['reasons']
 
     return {
-        'risk': risk,
+        'risk': risk_category(score),
         'score': score,
         'reasons': reasons
     }
+
+# ------------------ Trend rules ------------------ #
+# A second engine over the ANC visit history. It never reads past visits:
+# it scores a small per-mother state that db.py updates as each visit is
+# recorded (slopes and last changes from mother_trend_features, plus the
+# latest visit's readings), so a new visit costs the same however many
+# came before it.
+
+TREND_STATE = ('visits', 'sbp_slope', 'hb_slope', 'sbp_change', 'dbp_change', 'hb_change',
+               'weight_gain_per_week', 'last_bp_systolic', 'last_bp_diastolic', 'last_urine_protein')
+
+def trend_features(state):
+    """TREND_RULES features from one mother's TREND_STATE; None where unknown."""
+    def num(name):
+        value = state.get(name)
+        return None if value is None else float(value)
+
+    def high(sbp, dbp):
+        return (sbp is not None and sbp >= HIGH_SBP) or (dbp is not None and dbp >= HIGH_DBP)
+
+    sbp, dbp = num('last_bp_systolic'), num('last_bp_diastolic')
+    sbp_change, dbp_change, hb_change = num('sbp_change'), num('dbp_change'), num('hb_change')
+    # her previous visit's BP, recovered from the last change
+    prev_sbp = sbp - sbp_change if sbp is not None and sbp_change is not None else None
+    prev_dbp = dbp - dbp_change if dbp is not None and dbp_change is not None else None
+    enough = (state.get('visits') or 0) >= MIN_VISITS_FOR_SLOPE
+    return {
+        'sbp_rise': sbp_change,
+        'sbp_slope': num('sbp_slope') if enough else None,
+        'high_bp_repeat': float(high(sbp, dbp) and high(prev_sbp, prev_dbp)),
+        'proteinuria_high_bp': float(state.get('last_urine_protein') in PROTEINURIA_LEVELS and high(sbp, dbp)),
+        'hb_drop': -hb_change if hb_change is not None else None,
+        'hb_slope': num('hb_slope') if enough else None,
+        'weight_gain_per_week': num('weight_gain_per_week'),
+    }
+
+def predict_trend_risk(state):
+    """Points and reasons from the visit-history rules alone."""
+    features = trend_features(state)
+    score, reasons = 0, []
+    for feature, op, threshold, points, reason in TREND_RULES:
+        value = features[feature]
+        if value is not None and _COMPARE[op](value, threshold):
+            score += points
+            reasons.append(reason)
+    return {'score': score, 'reasons': reasons}
+
+# ------------------ Batch scoring ------------------ #
+# Bit i of a reason mask is set when REASONS[i] applies; the order matches the
+# order predict_risk() lists its reasons in.
+
+REASONS = [rule[4] for rule in RULES] + [rule[2] for rule in NOTE_RULES] + [rule[4] for rule in TREND_RULES]
+
+def reasons_from_mask(mask):
+    return [reason for bit, reason in enumerate(REASONS) if int(mask) >> bit & 1]
+
+def reasons_to_mask(reasons):
+    return sum(1 << REASONS.index(reason) for reason in reasons)
+
+def _column(columns, name, n):
+    import numpy as np
+    if name not in columns:
+        return np.full(n, np.nan)
+    # None / NaN become NaN, and NaN fails every comparison - same as the None guard
+    return np.asarray(columns[name], dtype=float)
+
+def _trend_feature_columns(columns, n):
+    # trend_features(), one array per feature; NaN where unknown
+    import numpy as np
+
+    def col(name):
+        return _column(columns, name, n)
+
+    sbp, dbp = col('last_bp_systolic'), col('last_bp_diastolic')
+    high_now = (sbp >= HIGH_SBP) | (dbp >= HIGH_DBP)
+    high_prev = (sbp - col('sbp_change') >= HIGH_SBP) | (dbp - col('dbp_change') >= HIGH_DBP)
+    enough = np.nan_to_num(col('visits')) >= MIN_VISITS_FOR_SLOPE
+    protein = columns['last_urine_protein'] if 'last_urine_protein' in columns else [None] * n
+    proteinuria = np.fromiter((p in PROTEINURIA_LEVELS for p in protein), dtype=bool, count=n)
+    return {
+        'sbp_rise': col('sbp_change'),
+        'sbp_slope': np.where(enough, col('sbp_slope'), np.nan),
+        'high_bp_repeat': (high_now & high_prev).astype(float),
+        'proteinuria_high_bp': (proteinuria & high_now).astype(float),
+        'hb_drop': -col('hb_change'),
+        'hb_slope': np.where(enough, col('hb_slope'), np.nan),
+        'weight_gain_per_week': col('weight_gain_per_week'),
+    }
+
+def predict_risk_batch(columns):
+    """Score many mothers in one vectorized pass.
+
+    `columns` is a DataFrame or a mapping of equal-length arrays with any of
+    age, bp_systolic, bp_diastolic, hb, bmi, parity and notes, plus the
+    TREND_STATE columns to apply the visit-history rules. Returns a dict of
+    NumPy arrays: 'score', 'risk' and 'reason_mask' (see reasons_from_mask),
+    row for row identical to predict_risk().
+    """
+    import numpy as np
+
+    present = [name for name in _FIELDS + ['notes', *TREND_STATE] if name in columns]
+    n = len(columns[present[0]]) if present else 0
+    score = np.zeros(n, dtype=np.int64)
+    mask = np.zeros(n, dtype=np.int64)
+    bit = 0
+    for field, op, threshold, points, _ in RULES:
+        hit = _COMPARE[op](_column(columns, field, n), threshold)
+        score += hit * points
+        mask |= hit.astype(np.int64) << bit
+        bit += 1
+
+    notes = columns['notes'] if 'notes' in columns else [None] * n
+    lowered = [text.lower() if isinstance(text, str) else '' for text in notes]
+    for keyword, points, _ in NOTE_RULES:
+        hit = np.fromiter((keyword in text for text in lowered), dtype=bool, count=n)
+        score += hit * points
+        mask |= hit.astype(np.int64) << bit
+        bit += 1
+
+    if any(name in columns for name in TREND_STATE):
+        features = _trend_feature_columns(columns, n)
+        for feature, op, threshold, points, _ in TREND_RULES:
+            hit = _COMPARE[op](features[feature], threshold)
+            score += hit * points
+            mask |= hit.astype(np.int64) << bit
+            bit += 1
+
+    band = (score >= MODERATE_RISK_SCORE).astype(np.int64) + (score >= HIGH_RISK_SCORE)
+    risk = np.array(RISK_CATEGORIES, dtype=object)[band]
+    return {'score': score, 'risk': risk, 'reason_mask': mask}
+
+# ------------------ What-if sweeps ------------------ #
+# Each vital-sign rule reads one field, so a mother's score is a constant
+# (notes, trend and the fields held fixed) plus one term per varied field.
+# A sweep scores each axis's values once and broadcast-adds them, so a grid
+# of a million points costs a few array additions, not a million rows.
+
+def _field_points(field, values):
+    import numpy as np
+    values = np.asarray(values, dtype=float)
+    points = np.zeros(len(values), dtype=np.int64)
+    mask = np.zeros(len(values), dtype=np.int64)
+    for bit, (rule_field, op, threshold, rule_points, _) in enumerate(RULES):
+        if rule_field == field:
+            hit = _COMPARE[op](values, threshold)
+            points += hit * rule_points
+            mask |= hit.astype(np.int64) << bit
+    return points, mask
+
+def _band(score):
+    import numpy as np
+    return (score >= MODERATE_RISK_SCORE).astype(np.int8) + (score >= HIGH_RISK_SCORE).astype(np.int8)
+
+def sweep(base, axes, trend=None):
+    """Score `base` over every combination of the `axes` values.
+
+    `base` maps predict_risk() arguments (age, bp_systolic, ..., notes) to a
+    mother's values; `axes` maps some of the vital-sign fields to 1-d arrays
+    of values to try, the others staying at their base value. `trend` is held
+    fixed. Returns 'axes' (field names, in order), 'values', and grids shaped
+    (len(values[0]), len(values[1]), ...): 'score', 'band' (index into
+    RISK_CATEGORIES) and 'reason_mask' - cell for cell what predict_risk()
+    gives. 'base' is predict_risk() of `base` itself and 'crossings' its
+    category_changes().
+    """
+    import numpy as np
+
+    names = tuple(axes)
+    unknown = [name for name in names if name not in _FIELDS]
+    if unknown:
+        raise ValueError(f"Cannot sweep {unknown}; choose from {_FIELDS}")
+    fixed = predict_risk(*(None if field in axes else base.get(field) for field in _FIELDS),
+                         base.get('notes'), trend)
+    values = tuple(np.asarray(axes[name], dtype=float) for name in names)
+    shape = tuple(len(v) for v in values)
+    score = np.full(shape, fixed['score'], dtype=np.int64)
+    mask = np.full(shape, reasons_to_mask(fixed['reasons']), dtype=np.int64)
+    for i, (name, v) in enumerate(zip(names, values)):
+        points, bits = _field_points(name, v)
+        along = [1] * len(shape)
+        along[i] = len(v)
+        score += points.reshape(along)
+        mask |= bits.reshape(along)
+    return {
+        'axes': names,
+        'values': values,
+        'score': score,
+        'band': _band(score),
+        'reason_mask': mask,
+        'base': predict_risk(*(base.get(field) for field in _FIELDS), base.get('notes'), trend),
+        'crossings': category_changes(base, trend),
+    }
+
+def category_changes(base, trend=None):
+    """What single change of one vital would move `base` to another category.
+
+    For each field with a known value, the nearest boundary up and down from
+    it where the category changes, everything else held: dicts of field,
+    direction ('up' / 'down'), op and value ('>= 140' reads "at or above
+    140"), and the new risk and score.
+    """
+    import numpy as np
+
+    now = predict_risk(*(base.get(field) for field in _FIELDS), base.get('notes'), trend)
+    changes = []
+    for field in _FIELDS:
+        value = base.get(field)
+        if value is None:
+            continue
+        # the score only changes at a threshold: try each, and either side of it
+        candidates = []
+        for rule_field, _, threshold, _, _ in RULES:
+            if rule_field == field:
+                candidates += [(np.nextafter(threshold, -np.inf), '<', threshold), (threshold, '<=', threshold),
+                               (threshold, '>=', threshold), (np.nextafter(threshold, np.inf), '>', threshold)]
+        fixed = predict_risk(*(None if f == field else base.get(f) for f in _FIELDS), base.get('notes'), trend)
+        points, _ = _field_points(field, [c[0] for c in candidates])
+        best = {}
+        for (x, op, threshold), p in zip(candidates, points):
+            score = fixed['score'] + int(p)
+            risk = risk_category(score)
+            if risk == now['risk']:
+                continue
+            if x > value and op in ('>=', '>') and ('up' not in best or x < best['up'][0]):
+                best['up'] = (x, op, threshold, risk, score)
+            elif x < value and op in ('<=', '<') and ('down' not in best or x > best['down'][0]):
+                best['down'] = (x, op, threshold, risk, score)
+        for direction, (_, op, threshold, risk, score) in sorted(best.items(), reverse=True):
+            changes.append({'field': field, 'direction': direction, 'op': op, 'value': threshold,
+                            'risk': risk, 'score': score})
+    return changes
+
+# ------------------ Scorers ------------------ #
+# Stored scores come from the active scorer: the rules above, or the trained
+# model at MODEL_PATH when that file exists (ml_model.py writes it). A scorer
+# has a `name`, a `version` stamped on stored scores - so switching scorers
+# marks them stale - and score(inputs) / score_batch(columns) returning the
+# same shapes as predict_risk() / predict_risk_batch(). The model file is
+# loaded on first use, once per process. If it is missing, unreadable or
+# fails on a batch, the rules score instead.
+
+MODEL_PATH = os.environ.get('AFYAMAMA_RISK_MODEL', str(Path(__file__).parent / 'risk_model.npz'))
+
+class RuleScorer:
+    """predict_risk() / predict_risk_batch() behind the scorer interface."""
+
+    name = 'rules'
+    version = RULES_VERSION
+
+    def score(self, inputs):
+        trend = {name: inputs.get(name) for name in TREND_STATE} if inputs.get('visits') else None
+        return predict_risk(*(inputs.get(field) for field in _FIELDS), inputs.get('notes'), trend)
+
+    def score_batch(self, columns):
+        return predict_risk_batch(columns)
+
+RULE_SCORER = RuleScorer()
+
+_scorer = None
+_scorer_lock = threading.Lock()
+
+# per-batch timings, newest last, and running totals per scorer
+BATCH_STATS = deque(maxlen=200)
+_totals = {}
+_stats_lock = threading.Lock()
+
+def _load_scorer():
+    if not MODEL_PATH or not Path(MODEL_PATH).is_file():
+        return RULE_SCORER
+    try:
+        import ml_model
+        return ml_model.load(MODEL_PATH)
+    except Exception as e:
+        warnings.warn(f"Risk model {MODEL_PATH} not loaded, scoring with the rules: {e}")
+        return RULE_SCORER
+
+def get_scorer():
+    """The active scorer, loading MODEL_PATH on first use."""
+    global _scorer
+    if _scorer is None:
+        with _scorer_lock:
+            if _scorer is None:
+                _scorer = _load_scorer()
+    return _scorer
+
+def set_scorer(scorer):
+    """Use `scorer` from now on; None reloads MODEL_PATH on next use."""
+    global _scorer
+    with _scorer_lock:
+        _scorer = scorer
+
+def scorer_version():
+    return get_scorer().version
+
+def _record(scorer, rows, seconds, fallback):
+    metrics.observe('risk_batch_seconds', seconds, scorer=scorer)
+    with _stats_lock:
+        BATCH_STATS.append({'scorer': scorer, 'rows': rows, 'seconds': seconds,
+                            'fallback': fallback, 'at': time.time()})
+        total = _totals.setdefault(scorer, {'batches': 0, 'rows': 0, 'seconds': 0.0, 'fallbacks': 0})
+        total['batches'] += 1
+        total['rows'] += rows
+        total['seconds'] += seconds
+        total['fallbacks'] += fallback
+
+def scoring_stats():
+    """Active scorer, totals per scorer and the most recent batch timings."""
+    scorer = get_scorer()
+    with _stats_lock:
+        return {'scorer': scorer.name, 'version': scorer.version,
+                'totals': {name: dict(t) for name, t in _totals.items()}, 'batches': list(BATCH_STATS)}
+
+def score(inputs):
+    """Score one mother with the active scorer. `inputs` maps the
+    predict_risk() arguments, and optionally TREND_STATE, to values; the
+    result also carries the 'version' to store with it."""
+    scorer, fallback = get_scorer(), False
+    t0 = time.perf_counter()
+    try:
+        result = scorer.score(inputs)
+    except Exception:
+        if scorer is RULE_SCORER:
+            raise
+        scorer, fallback = RULE_SCORER, True
+        result = scorer.score(inputs)
+    _record(scorer.name, 1, time.perf_counter() - t0, fallback)
+    return dict(result, version=scorer.version)
+
+def score_batch(columns):
+    """score() for many mothers: predict_risk_batch()-style arrays plus 'version'."""
+    scorer, fallback = get_scorer(), False
+    t0 = time.perf_counter()
+    try:
+        result = scorer.score_batch(columns)
+    except Exception:
+        if scorer is RULE_SCORER:
+            raise
+        scorer, fallback = RULE_SCORER, True
+        result = scorer.score_batch(columns)
+    _record(scorer.name, len(result['score']), time.perf_counter() - t0, fallback)
+    return dict(result, version=scorer.version)
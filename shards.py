@@ -0,0 +1,444 @@
+# Per-facility sharding: one SQLite file per facility (or sub-county) instead
+# of one afyamama.db for the whole county. Each shard takes its own write
+# lock, so writes at different facilities never wait for each other, and a
+# damaged file costs one facility, not the county.
+#
+# Shards are <key>.db files in SHARD_DIR (AFYAMAMA_SHARD_DIR), each a complete
+# afyamama database: same migrations, stored scores, rollups, search index and
+# sync log. A mother lives in the shard her record was created in:
+#   - SHARD_BY=location (default): the key is her location at registration;
+#     _directory.db maps mother_id -> shard for the writes that follow;
+#   - SHARD_BY=prefix: the key is the mother_id prefix before the first '-'
+#     (facility-coded ids such as KSM-00042), so no directory is needed.
+# Per-mother calls run the ordinary db.py functions under db.using(shard).
+# County-wide reads (dashboard, risk counts, follow-up worklists, exports)
+# fan out over every shard - on a process pool once there are
+# FANOUT_MIN_SHARDS or more - and merge the partial results. Editing a
+# mother's location does not move her records to another shard.
+import atexit
+import csv
+import heapq
+import io
+import multiprocessing
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+import db
+import exports
+import importer
+
+SHARD_DIR = Path(os.environ.get('AFYAMAMA_SHARD_DIR') or Path(__file__).parent / 'shards')
+SHARD_BY = os.environ.get('AFYAMAMA_SHARD_BY', 'location')
+FANOUT_WORKERS = int(os.environ.get('AFYAMAMA_SHARD_WORKERS', os.cpu_count() or 1))
+FANOUT_MIN_SHARDS = 4  # below this a process pool costs more than it saves: query in-process
+DEFAULT_SHARD = 'unassigned'  # mothers with no location, chat logs with no mother
+DIRECTORY_NAME = '_directory.db'
+
+# tables copied by split(), parents first; derived tables are rebuilt by the shard's triggers
+SPLIT_TABLES = ('mothers', 'children', 'anc_visits', 'followups', 'chat_logs', 'pregnancy_outcomes')
+
+_MAX_ROWID = 2 ** 63 - 1
+
+# ------------------ Routing ------------------ #
+
+def _slug(text):
+    return re.sub(r'[^a-z0-9]+', '-', str(text or '').strip().lower()).strip('-') or DEFAULT_SHARD
+
+def shard_key(mother):
+    """The shard a new mother record (a dict with mother_id and location) belongs in."""
+    if SHARD_BY == 'prefix':
+        return _slug(str(mother.get('mother_id') or '').split('-')[0])
+    return _slug(mother.get('location'))
+
+def shard_path(key):
+    return SHARD_DIR / f"{key}.db"
+
+def shard_keys():
+    """Every shard on disk, sorted."""
+    return sorted(p.stem for p in SHARD_DIR.glob('*.db') if not p.name.startswith('_'))
+
+_opened = set()
+
+@contextmanager
+def on_shard(key):
+    """Run the block's db.py calls against shard `key`, creating it if needed."""
+    path = shard_path(key)
+    with db.using(path):
+        if key not in _opened:
+            SHARD_DIR.mkdir(parents=True, exist_ok=True)
+            _opened.add(key)
+        db.init_db()  # once per shard per process
+        yield path
+
+# ------------------ Directory ------------------ #
+# mother_id -> shard, for SHARD_BY=location. Written after the shard itself,
+# so a crash in between leaves a mother the directory does not know about;
+# rebuild_directory() recovers her.
+
+_directory_ready = set()
+
+def _directory():
+    path = SHARD_DIR / DIRECTORY_NAME
+    if str(path) not in _directory_ready:
+        SHARD_DIR.mkdir(parents=True, exist_ok=True)
+        with db.transaction(path) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS mother_shards "
+                         "(mother_id TEXT PRIMARY KEY, shard TEXT NOT NULL) WITHOUT ROWID")
+        _directory_ready.add(str(path))
+    return path
+
+def _remember(pairs):
+    if SHARD_BY == 'prefix' or not pairs:
+        return
+    with db.transaction(_directory()) as conn:
+        conn.executemany("INSERT OR REPLACE INTO mother_shards (mother_id, shard) VALUES (?, ?)", pairs)
+
+def shards_of(mother_ids):
+    """{mother_id: shard} for the given ids; ids no shard holds are left out."""
+    ids = sorted({m for m in mother_ids if m})
+    if SHARD_BY == 'prefix':
+        existing = set(shard_keys())
+        return {m: k for m, k in ((m, _slug(m.split('-')[0])) for m in ids) if k in existing}
+    conn, found = db.get_conn(_directory()), {}
+    for i in range(0, len(ids), 500):  # stay under SQLite's bound-parameter limit
+        chunk = ids[i:i + 500]
+        found.update(conn.execute(f"SELECT mother_id, shard FROM mother_shards "
+                                  f"WHERE mother_id IN ({', '.join('?' * len(chunk))})", chunk).fetchall())
+    return found
+
+def shard_of(mother_id):
+    return shards_of([mother_id]).get(mother_id)
+
+def rebuild_directory():
+    """Rebuild the mother_id -> shard map from the shards themselves; returns the number of mothers."""
+    pairs = [(r[0], key) for key in shard_keys()
+             for r in db.get_conn(shard_path(key)).execute("SELECT mother_id FROM mothers")]
+    with db.transaction(_directory()) as conn:
+        conn.execute("DELETE FROM mother_shards")
+        conn.executemany("INSERT OR REPLACE INTO mother_shards (mother_id, shard) VALUES (?, ?)", pairs)
+    return len(pairs)
+
+# ------------------ Per-mother calls ------------------ #
+
+@contextmanager
+def for_mother(mother_id):
+    """on_shard() for the shard holding `mother_id`; KeyError if none does."""
+    key = shard_of(mother_id)
+    if key is None:
+        raise KeyError(mother_id)
+    with on_shard(key) as path:
+        yield path
+
+def add_mother(data: dict):
+    """db.add_mother() on her shard (her existing one, if already registered); returns the shard key.
+
+    Unlike db.add_mother() a mother_id is required: without one the directory
+    could not find her again.
+    """
+    if not str(data.get('mother_id') or '').strip():
+        raise ValueError("mother_id is required")
+    existing = shard_of(data.get('mother_id'))
+    key = existing or shard_key(data)
+    with on_shard(key):
+        db.add_mother(data)
+    if existing is None:
+        _remember([(data.get('mother_id'), key)])
+    return key
+
+def get_mother_by_id(mother_id):
+    key = shard_of(mother_id)
+    if key is None:
+        return None
+    with on_shard(key):
+        return db.get_mother_by_id(mother_id)
+
+def add_anc_visit(data: dict):
+    with for_mother(data.get('mother_id')):
+        db.add_anc_visit(data)
+
+def add_followup(mother_id, due_date, notes='', assigned_to=None, kind=None):
+    with for_mother(mother_id):
+        db.add_followup(mother_id, due_date, notes, assigned_to, kind)
+
+def add_chat_log(mother_id, user_input, assistant_response):
+    with on_shard(shard_of(mother_id) or DEFAULT_SHARD):
+        db.add_chat_log(mother_id, user_input, assistant_response)
+
+def mark_followups_done(followup_ids):
+    """Close follow-ups given as (shard, id) pairs, as get_followup_worklist() returns them."""
+    by_shard = {}
+    for key, followup_id in followup_ids:
+        by_shard.setdefault(key, []).append(followup_id)
+    updated = 0
+    for key, ids in by_shard.items():
+        with on_shard(key):
+            updated += db.mark_followups_done(ids)
+    return updated
+
+# ------------------ Fan-out ------------------ #
+
+_pool = None
+
+def _worker_init():
+    # the parent (and other processes) write the shards: no read cache here
+    db.CACHE_TTL_SECONDS = 0
+
+def _call(path, fn_name, args, kwargs, use_cache=False):
+    # one db.py read against one shard; runs in a pool worker, or inline
+    fn = getattr(db, fn_name)
+    with db.using(path):
+        return (fn if use_cache else getattr(fn, 'uncached', fn))(*args, **kwargs)
+
+def _pool_for(jobs, workers):
+    global _pool
+    if not workers or jobs < FANOUT_MIN_SHARDS:
+        return None
+    if _pool is None:
+        # spawn, not fork: a forked worker would inherit the parent's open SQLite
+        # connections, held locks and write-behind threads
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                    initializer=_worker_init)
+    return _pool
+
+@atexit.register
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True)
+        _pool = None
+
+def _run(calls, workers=None):
+    """{key: result} for calls {key: (fn_name, args, kwargs)}, one per shard."""
+    pool = _pool_for(len(calls), FANOUT_WORKERS if workers is None else workers)
+    if pool is None:
+        # in-process the parent's read cache is coherent with its writes, so use it
+        return {key: _call(shard_path(key), fn, args, kwargs, use_cache=True)
+                for key, (fn, args, kwargs) in calls.items()}
+    futures = {key: pool.submit(_call, str(shard_path(key)), fn, args, kwargs)
+               for key, (fn, args, kwargs) in calls.items()}
+    return {key: future.result() for key, future in futures.items()}
+
+def fan_out(fn_name, *args, workers=None, **kwargs):
+    """{shard key: db.<fn_name>(*args, **kwargs) on that shard} for every shard.
+
+    workers=0 queries the shards in-process, one after another.
+    """
+    return _run({key: (fn_name, args, kwargs) for key in shard_keys()}, workers)
+
+# ------------------ Merged reads ------------------ #
+
+def count_mothers_by_risk(location=None, workers=None):
+    total = Counter()
+    for counts in fan_out('count_mothers_by_risk', location, workers=workers).values():
+        total.update(counts)
+    return dict(total)
+
+def get_dashboard_summary(location=None, days=30, workers=None):
+    """db.get_dashboard_summary() over every shard."""
+    risk, overdue, daily = Counter(), 0, {}
+    for part in fan_out('get_dashboard_summary', location, days, workers=workers).values():
+        risk.update(part['risk'])
+        overdue += part['overdue_followups']
+        for row in part['daily']:
+            counts = daily.setdefault(row['day'], {'registrations': 0, 'anc_visits': 0, 'referrals': 0})
+            for name in counts:
+                counts[name] += row[name]
+    return {
+        'total_mothers': sum(risk.values()),
+        'risk': dict(risk),
+        'overdue_followups': overdue,
+        'daily': [dict(day=day, **counts) for day, counts in sorted(daily.items())],
+    }
+
+def get_rollup_locations(workers=None):
+    return sorted(set().union(*fan_out('get_rollup_locations', workers=workers).values()))
+
+def count_followup_worklists(chv=None, location=None, today=None, workers=None):
+    total = Counter({which: 0 for which in db.FOLLOWUP_WORKLISTS})
+    for counts in fan_out('count_followup_worklists', chv, location, today, workers=workers).values():
+        total.update(counts)
+    return dict(total)
+
+def get_followup_worklist(which, chv=None, location=None, after=None, limit=50, today=None, workers=None):
+    """db.get_followup_worklist() over every shard: one page, earliest due first.
+
+    Rows carry their 'shard'. Follow-up ids are per shard, so the cursor is
+    (due_date, shard, id) and the shard key breaks ties between equal dates.
+    """
+    def shard_after(key):
+        # each shard's own (due_date, id) cursor equivalent to the merged one
+        if after is None:
+            return None
+        due_date, shard, followup_id = after
+        if key < shard:
+            return (due_date, _MAX_ROWID)  # its rows due that day were all on earlier pages
+        return (due_date, followup_id if key == shard else 0)
+
+    pages = _run({key: ('get_followup_worklist', (which, chv, location, shard_after(key), limit, today), {})
+                  for key in shard_keys()}, workers)
+    runs = [[dict(row, shard=key) for row in rows] for key, (rows, _) in pages.items()]
+    merged = list(heapq.merge(*runs, key=lambda r: (r['due_date'], r['shard'], r['id'])))
+    page = merged[:limit]
+    more = len(merged) > limit or any(cursor for _, cursor in pages.values())
+    next_cursor = (page[-1]['due_date'], page[-1]['shard'], page[-1]['id']) if more and page else None
+    return page, next_cursor
+
+def write_export(table, fileobj, **filters):
+    """An exports.write_export() CSV of every shard, with a leading 'shard' column; returns the data rows."""
+    header, rows_written = None, 0
+    for key in shard_keys():
+        for columns, rows in exports.iter_chunks(table, path=shard_path(key), **filters):
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            if header is None:
+                header = ['shard', *columns]
+                writer.writerow(header)
+            writer.writerows((key, *row) for row in rows)
+            fileobj.write(buf.getvalue().encode())
+            rows_written += len(rows)
+    return rows_written
+
+# ------------------ Bulk writes ------------------ #
+
+def _import_on_shard(path, kind, rows, batch_size):
+    # runs in a pool worker (or inline): a shard file is written by one process at a time
+    with db.using(path):
+        return importer.import_rows(kind, rows, batch_size)
+
+def import_rows(kind, rows, batch_size=importer.BATCH_SIZE, workers=None):
+    """importer.import_rows() across shards: rows are routed to their shard and the
+    shards imported in parallel, each by one process.
+
+    Returns the merged report, with each shard's under 'shards'.
+    """
+    t0 = time.perf_counter()
+    rows = list(rows)
+    errors, groups = [], {}
+    if kind == 'mothers':
+        # give id-less rows their generated id here, as importer would, so the
+        # directory records the id the shard writes (and prefix routing sees it)
+        rows = [(line_no, dict(raw, mother_id=importer.new_mother_id()))
+                if isinstance(raw, dict) and not str(raw.get('mother_id') or '').strip() else (line_no, raw)
+                for line_no, raw in rows]
+        known = shards_of(str(raw['mother_id']).strip() for _, raw in rows if isinstance(raw, dict))
+        for line_no, raw in rows:
+            if isinstance(raw, dict):
+                clean = {k: str(v).strip() if v is not None else v for k, v in raw.items()}
+                key = known.get(clean['mother_id']) or shard_key(clean)
+            else:
+                key = DEFAULT_SHARD  # an unreadable line: importer reports it
+            groups.setdefault(key, []).append((line_no, raw))
+    else:
+        known = shards_of(str(raw.get('mother_id') or '').strip() for _, raw in rows if isinstance(raw, dict))
+        for line_no, raw in rows:
+            if not isinstance(raw, dict):
+                key = DEFAULT_SHARD  # an unreadable line: importer reports it
+            else:
+                key = known.get(str(raw.get('mother_id') or '').strip())
+                if key is None:
+                    errors.append((line_no, f"unknown mother_id {raw.get('mother_id')!r}"))
+                    continue
+            groups.setdefault(key, []).append((line_no, raw))
+
+    for key in groups:
+        with on_shard(key):
+            pass  # create and migrate in this process, before any worker writes to it
+    pool = _pool_for(len(groups), FANOUT_WORKERS if workers is None else workers)
+    if pool is None:
+        reports = {key: _import_on_shard(shard_path(key), kind, group, batch_size) for key, group in groups.items()}
+    else:
+        futures = {key: pool.submit(_import_on_shard, str(shard_path(key)), kind, group, batch_size)
+                   for key, group in groups.items()}
+        reports = {key: future.result() for key, future in futures.items()}
+    for key, report in reports.items():
+        db.invalidate(kind, 'mothers', 'followups', path=shard_path(key))  # written by another process
+
+    if kind == 'mothers':
+        failed = {line for report in reports.values() for line, _ in report['errors']}
+        _remember([(str(raw['mother_id']).strip(), key) for key, group in groups.items()
+                   for line_no, raw in group if line_no not in failed and isinstance(raw, dict)])
+    merged = {'kind': kind, 'rows': len(rows), 'shards': reports,
+              'inserted': sum(r['inserted'] for r in reports.values()),
+              'updated': sum(r['updated'] for r in reports.values()),
+              'errors': sorted(errors + [e for r in reports.values() for e in r['errors']], key=lambda e: e[0]),
+              'seconds': time.perf_counter() - t0}
+    return merged
+
+def split(source, batch_size=importer.BATCH_SIZE):
+    """Copy a single-file database's records into shards, routed as new records would be.
+
+    Rows keep their values (stored scores, timestamps) but get new ids; the
+    shards' triggers rebuild rollups, search, trends and the change log.
+    Records with no mother, or whose mother is not in the source, go to
+    DEFAULT_SHARD. Returns {shard: mothers copied}.
+    """
+    source = Path(source)
+    with db.using(source):
+        db.init_db()
+        mothers = [dict(r) for r in db.get_conn().execute("SELECT mother_id, location FROM mothers")]
+    groups = {}
+    for m in mothers:
+        groups.setdefault(shard_key(m), []).append(m['mother_id'])
+    groups.setdefault(DEFAULT_SHARD, [])  # records with no (or no such) mother
+
+    for key, ids in groups.items():
+        with on_shard(key):
+            conn = db.get_conn()
+            conn.execute("ATTACH DATABASE ? AS src", (str(source),))
+            try:
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS split_ids (mother_id TEXT PRIMARY KEY)")
+                conn.execute("DELETE FROM temp.split_ids")
+                conn.executemany("INSERT INTO temp.split_ids VALUES (?)", [(m,) for m in ids])
+                where = "mother_id IN (SELECT mother_id FROM temp.split_ids)"
+                if key == DEFAULT_SHARD:
+                    where = (f"({where} OR mother_id IS NULL OR mother_id NOT IN "
+                             f"(SELECT mother_id FROM src.mothers WHERE mother_id IS NOT NULL))")
+                for table in SPLIT_TABLES:
+                    columns = ({r[1] for r in conn.execute(f"PRAGMA main.table_info({table})")}
+                               & {r[1] for r in conn.execute(f"PRAGMA src.table_info({table})")}) - {'id'}
+                    cols = ', '.join(sorted(columns))
+                    last = 0
+                    while True:  # batches, so writers to this shard are never blocked for long
+                        with db.transaction(invalidates=(table, 'mothers', 'followups')) as tx:
+                            batch = tx.execute(f"SELECT rowid FROM src.{table} WHERE {where} AND rowid > ? "
+                                               f"ORDER BY rowid LIMIT ?", (last, batch_size)).fetchall()
+                            if not batch:
+                                break
+                            tx.execute(f"INSERT INTO main.{table} ({cols}) SELECT {cols} FROM src.{table} "
+                                       f"WHERE {where} AND rowid > ? AND rowid <= ? ORDER BY rowid",
+                                       (last, batch[-1][0]))
+                        last = batch[-1][0]
+                conn.execute("DROP TABLE temp.split_ids")
+            finally:
+                conn.execute("DETACH DATABASE src")
+            db.rescore_stale()
+    _remember([(m, key) for key, ids in groups.items() for m in ids])
+    return {key: len(ids) for key, ids in groups.items()}
+
+# ------------------ Command line ------------------ #
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Per-facility shards (in AFYAMAMA_SHARD_DIR)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_split = sub.add_parser("split", help="copy a single-file database into shards")
+    p_split.add_argument("source")
+    sub.add_parser("list", help="shards with their mother counts and sizes")
+    sub.add_parser("rebuild-directory", help="rebuild the mother_id -> shard map from the shards")
+    args = parser.parse_args()
+    if args.command == "split":
+        t0 = time.perf_counter()
+        copied = split(args.source)
+        print(f"{sum(copied.values()):,} mothers into {len(copied)} shards in {SHARD_DIR} "
+              f"({time.perf_counter() - t0:.1f}s)")
+    elif args.command == "list":
+        counts = fan_out('count_mothers', workers=0)
+        for key in shard_keys():
+            print(f"{key:<24} {counts[key]:>9,} mothers {shard_path(key).stat().st_size / 1e6:9.1f} MB")
+    else:
+        print(f"{rebuild_directory():,} mothers mapped")
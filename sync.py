@@ -0,0 +1,265 @@
+# Offline sync between CHV device databases and a central one.
+#
+# A device pushes the changes it made itself since its last push, then pulls
+# every change the peer has from other devices since its last pull. Each
+# direction moves changesets: the sync_log entries after a watermark (see
+# db.py, "Change tracking"), with the current values of the changed rows,
+# packed column-wise as JSON and zlib-compressed, at most BATCH_SIZE rows
+# each. Conflicts are resolved per row key (mother_id for mothers): the
+# change with the later (changed_at, origin device) wins. Both sides apply
+# the same rule, so every database converges whatever order devices sync in.
+import json
+import time
+import urllib.parse
+import urllib.request
+import zlib
+
+import db
+
+BATCH_SIZE = 2000
+
+FORMAT_VERSION = 1
+
+# ------------------ Changesets ------------------ #
+
+def _fetch_rows(conn, table, key, columns, keys):
+    rows = {}
+    for i in range(0, len(keys), 500):  # stay under SQLite's bound-parameter limit
+        chunk = keys[i:i + 500]
+        for r in conn.execute(f"SELECT {', '.join(columns)} FROM {table} "
+                              f"WHERE {key} IN ({', '.join('?' * len(chunk))})", chunk):
+            rows[r[key]] = [r[c] for c in columns]
+    return rows
+
+def changes_since(since=0, origin=None, exclude_origin=None, limit=BATCH_SIZE, path=None):
+    """The next changeset after sync_log seq `since`.
+
+    `origin` keeps only changes made on that device (what it pushes);
+    `exclude_origin` drops them (what it pulls). `until` is the watermark to
+    resume from and `more` says whether another batch follows.
+    """
+    conn = db.get_conn(path)
+    clauses, params = ["seq > ?"], [since]
+    if origin:
+        clauses.append("origin = ?")
+        params.append(origin)
+    if exclude_origin:
+        clauses.append("origin != ?")
+        params.append(exclude_origin)
+    entries = conn.execute(
+        f"SELECT seq, tbl, row_key, deleted, changed_at, origin FROM sync_log "
+        f"WHERE {' AND '.join(clauses)} ORDER BY seq LIMIT ?", params + [limit + 1]).fetchall()
+    more = len(entries) > limit
+    entries = entries[:limit]
+    changeset = {
+        'format': FORMAT_VERSION,
+        'source': db.device_id(path),
+        'since': since,
+        'until': entries[-1]['seq'] if entries else since,
+        'more': more,
+        'tables': {},
+    }
+    for table, key in db.SYNC_TABLES.items():
+        group = [e for e in entries if e['tbl'] == table]
+        if not group:
+            continue
+        columns = db.sync_columns(conn, table)
+        current = _fetch_rows(conn, table, key, columns, [e['row_key'] for e in group if not e['deleted']])
+        rows, deleted = [], []
+        for e in group:
+            if e['deleted']:
+                deleted.append([e['row_key'], e['changed_at'], e['origin']])
+            elif e['row_key'] in current:
+                rows.append(current[e['row_key']] + [e['changed_at'], e['origin']])
+        changeset['tables'][table] = {'columns': columns, 'rows': rows, 'deleted': deleted}
+    return changeset
+
+def encode(changeset):
+    return zlib.compress(json.dumps(changeset, separators=(',', ':')).encode(), 6)
+
+def decode(data):
+    changeset = json.loads(zlib.decompress(data))
+    if changeset.get('format') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported changeset format: {changeset.get('format')}")
+    return changeset
+
+def _present(conn, table, key, keys):
+    found = set()
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        found.update(r[0] for r in conn.execute(
+            f"SELECT {key} FROM {table} WHERE {key} IN ({', '.join('?' * len(chunk))})", chunk))
+    return found
+
+def _local_versions(conn, table, keys):
+    versions = {}
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        for r in conn.execute(f"SELECT row_key, changed_at, origin FROM sync_log WHERE tbl = ? "
+                              f"AND row_key IN ({', '.join('?' * len(chunk))})", [table] + chunk):
+            versions[r['row_key']] = (r['changed_at'], r['origin'])
+    return versions
+
+def apply_changeset(changeset, path=None):
+    """Apply a changeset in one transaction; returns counts of applied, deleted and skipped rows.
+
+    A change older than what this database already has for that row is
+    skipped. Applied changes keep their original version in sync_log, so
+    they are never echoed back to the device they came from.
+    """
+    report = {'applied': 0, 'deleted': 0, 'skipped': 0}
+    rescore = set()  # mothers whose latest ANC visit may have changed
+    with db.transaction(path, invalidates=tuple(db.SYNC_TABLES)) as conn:
+        for table, key in db.SYNC_TABLES.items():
+            data = changeset['tables'].get(table)
+            if not data:
+                continue
+            # columns this schema knows, in case the two sides are on different migrations
+            local = set(db.sync_columns(conn, table))
+            keep = [i for i, c in enumerate(data['columns']) if c in local]
+            columns = [data['columns'][i] for i in keep]
+            k = data['columns'].index(key)
+            versions = _local_versions(conn, table, [r[k] for r in data['rows']] + [d[0] for d in data['deleted']])
+
+            def newer(row_key, version):
+                return row_key not in versions or tuple(version) > versions[row_key]
+
+            upserts = [r for r in data['rows'] if newer(r[k], r[-2:])]
+            deletes = [d for d in data['deleted'] if newer(d[0], d[1:])]
+            report['skipped'] += len(data['rows']) + len(data['deleted']) - len(upserts) - len(deletes)
+
+            if table == 'followups' and {'kind', 'mother_id', 'due_date'} <= set(data['columns']):
+                # an ANC contact both sides scheduled for the same day: the incoming
+                # one replaces ours, and our delete travels on to everyone else
+                # (a peer on a schema without 'kind' has no scheduled contacts)
+                kind, mother, due = (data['columns'].index(c) for c in ('kind', 'mother_id', 'due_date'))
+                conn.executemany(
+                    "DELETE FROM followups WHERE kind = 'anc' AND mother_id = ? AND due_date = ? AND uid != ?",
+                    [(r[mother], r[due], r[k]) for r in upserts if r[kind] == 'anc'])
+            # plain UPDATE / INSERT, not an upsert: an upsert's conflict clause
+            # would override the OR IGNORE / OR REPLACE inside the tables' triggers
+            present = _present(conn, table, key, [r[k] for r in upserts])
+            sets = ', '.join(f"{c} = ?" for c in columns if c != key)
+            if table == 'mothers':
+                sets += ", risk_version = NULL"  # inputs changed: re-score here
+            conn.executemany(f"UPDATE {table} SET {sets} WHERE {key} = ?",
+                             [[r[i] for i in keep if i != k] + [r[k]] for r in upserts if r[k] in present])
+            conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                             [[r[i] for i in keep] for r in upserts if r[k] not in present])
+            if table == 'anc_visits':
+                m = data['columns'].index('mother_id')
+                rescore.update(r[m] for r in upserts)
+                rescore.update(r[0] for d in deletes for r in conn.execute(
+                    "SELECT mother_id FROM anc_visits WHERE uid = ?", (d[0],)))
+            conn.executemany(f"DELETE FROM {table} WHERE {key} = ?", [(d[0],) for d in deletes])
+            # the triggers logged these as local changes: put the sender's version back
+            conn.executemany(
+                "INSERT OR REPLACE INTO sync_log (tbl, row_key, deleted, changed_at, origin) VALUES (?, ?, ?, ?, ?)",
+                [(table, r[k], 0, r[-2], r[-1]) for r in upserts] + [(table, d[0], 1, d[1], d[2]) for d in deletes])
+            report['applied'] += len(upserts)
+            report['deleted'] += len(deletes)
+        conn.executemany("UPDATE mothers SET risk_version = NULL WHERE mother_id = ?", [(m,) for m in rescore])
+    if changeset['tables'].get('mothers') or rescore:
+        db.rescore_stale(path=path)
+    return report
+
+# ------------------ Peers ------------------ #
+
+class LocalPeer:
+    """Another database file on this machine (a hub, or the test harness's server)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = db.device_id(path)
+
+    def push(self, data):
+        return apply_changeset(decode(data), self.path)
+
+    def pull(self, device, since, limit=BATCH_SIZE):
+        return encode(changes_since(since, exclude_origin=device, limit=limit, path=self.path))
+
+class HttpPeer:
+    """The backend service's /sync endpoints (backend/app.py)."""
+
+    def __init__(self, base_url, timeout=60):
+        self.name = self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def push(self, data):
+        request = urllib.request.Request(self.base_url + '/sync/push', data=data, method='POST',
+                                         headers={'Content-Type': 'application/octet-stream'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.load(response)
+
+    def pull(self, device, since, limit=BATCH_SIZE):
+        query = urllib.parse.urlencode({'device': device, 'since': since, 'limit': limit})
+        with urllib.request.urlopen(f"{self.base_url}/sync/pull?{query}", timeout=self.timeout) as response:
+            return response.read()
+
+def _watermarks(conn, peer):
+    conn.execute("INSERT OR IGNORE INTO sync_peers (peer) VALUES (?)", (peer,))
+    row = conn.execute("SELECT pushed_seq, pulled_seq FROM sync_peers WHERE peer = ?", (peer,)).fetchone()
+    return row['pushed_seq'], row['pulled_seq']
+
+def sync(peer, path=None, batch_size=BATCH_SIZE):
+    """Push this database's own changes to `peer`, then pull everyone else's.
+
+    Watermarks advance after every batch, so an interrupted sync resumes
+    where it stopped. Returns counts, bytes on the wire and timing.
+    """
+    t0 = time.perf_counter()
+    me = db.device_id(path)
+    with db.transaction(path) as conn:
+        pushed, pulled = _watermarks(conn, peer.name)
+    report = {'pushed': 0, 'pulled': 0, 'applied': 0, 'deleted': 0, 'skipped': 0,
+              'bytes_up': 0, 'bytes_down': 0, 'batches': 0}
+
+    more = True
+    while more:
+        changeset = changes_since(pushed, origin=me, limit=batch_size, path=path)
+        more = changeset['more']
+        if changeset['until'] == pushed:
+            break
+        data = encode(changeset)
+        peer.push(data)
+        pushed = changeset['until']
+        with db.transaction(path) as conn:
+            conn.execute("UPDATE sync_peers SET pushed_seq = ? WHERE peer = ?", (pushed, peer.name))
+        report['pushed'] += sum(len(t['rows']) + len(t['deleted']) for t in changeset['tables'].values())
+        report['bytes_up'] += len(data)
+        report['batches'] += 1
+
+    more = True
+    while more:
+        data = peer.pull(me, pulled, batch_size)
+        changeset = decode(data)
+        more = changeset['more']
+        if changeset['until'] == pulled:
+            break
+        applied = apply_changeset(changeset, path)
+        pulled = changeset['until']
+        with db.transaction(path) as conn:
+            conn.execute("UPDATE sync_peers SET pulled_seq = ? WHERE peer = ?", (pulled, peer.name))
+        report['pulled'] += sum(len(t['rows']) + len(t['deleted']) for t in changeset['tables'].values())
+        for k in ('applied', 'deleted', 'skipped'):
+            report[k] += applied[k]
+        report['bytes_down'] += len(data)
+        report['batches'] += 1
+
+    report['seconds'] = time.perf_counter() - t0
+    return report
+
+# ------------------ Command line ------------------ #
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Sync this device's database with a hub")
+    parser.add_argument("peer", help="http(s) URL of the backend, or path of another database file")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+    db.init_db()
+    peer = HttpPeer(args.peer) if args.peer.startswith(("http://", "https://")) else LocalPeer(args.peer)
+    report = sync(peer, batch_size=args.batch_size)
+    print(f"pushed {report['pushed']} / pulled {report['pulled']} changes "
+          f"({report['applied']} applied, {report['deleted']} deleted, {report['skipped']} older skipped), "
+          f"{report['bytes_up'] + report['bytes_down']:,} bytes in {report['seconds']:.2f}s")